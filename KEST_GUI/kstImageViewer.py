@@ -426,6 +426,14 @@ class kstImageViewer(QWidget):
 		self.indexLabel.setText(str(val + 1) + "/" + str(round(self.__data.shape[2])))
 
 
+	def setData(self, data):
+		""" Replace the data of the viewer (same shape, e.g. a newer preview)
+			keeping the current slice.
+		"""
+		self.__data = data
+		self.changeDatasetView()
+
+
 	def changeRepetitionView(self):
 		""" Called when the slider is moved, so user wants to see a different
 			repetition of the same projection.
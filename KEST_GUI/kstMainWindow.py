@@ -17,14 +17,19 @@ from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSettings, QSize, QPoint
 from kstImageViewer import kstImageViewer
 from kstMainPanel import kstMainPanel
 from kstSidebar import kstSidebar
-from kstUtils import eprint
+from kstUtils import eprint, parse_indices
 from kstDataset import kstDataset
 
 from kst_core.kst_preprocessing import pre_processing
 from kst_core.kst_io import read_pixirad_data, read_pixirad_stepgo
 from kst_core.kst_reconstruction import recon_tigre_fdk, recon_astra_sirt_cone
 from kst_core.kst_reconstruction import recon_astra_fbp, recon_astra_sirt_parallel
+from kst_core.kst_reconstruction import recon_fbp_parallel, recon_gridding_parallel
+from kst_core.kst_reconstruction import recon_sirt_parallel, recon_sirt_fan, recon_sirt_cone
 from kst_core.kst_reconstruction import correct_dataset
+from kst_core.kst_backprojection import roi_ranges, correct_detector_tilt
+from kst_core.kst_upsampling import upsample_angles
+from kst_core.kst_alignment import apply_shifts
 
 SW_TITLE = "KEST Recon 0.5 alpha"
 SW_QUIT_MSG = "This will close the application. Are you sure?"
@@ -149,7 +154,8 @@ class PreprocessThread(QThread):
 	def __init__(self, parent, dset, rebinning, flatfielding_window, \
             despeckle_thresh, output_low, output_high, output_diff, output_sum, \
             mode, crop_top, crop_bottom, crop_left, crop_right, proj_avg_mode, \
-            proj_avg_alpha  ):
+            proj_avg_alpha, hex_resampling=False, phase_retrieval=None, \
+            flatfielding_mode='static', alignment=False ):
 		""" Class constructor.
 		"""
 		super(PreprocessThread, self).__init__(parent)
@@ -166,6 +172,10 @@ class PreprocessThread(QThread):
 		self.crop = [ crop_top, crop_bottom, crop_left, crop_right ]
 		self.proj_avg_mode = proj_avg_mode
 		self.proj_avg_alpha = proj_avg_alpha
+		self.hex_resampling = hex_resampling
+		self.phase_retrieval = phase_retrieval
+		self.flatfielding_mode = flatfielding_mode
+		self.alignment = alignment
 
 	def run(self):
 		""" Run the thread.
@@ -192,7 +202,8 @@ class PreprocessThread(QThread):
 			low, high, diff, sum = pre_processing(self.dset, self.rebinning, \
 					self.flatfielding_window, self.despeckle_thresh, self.output_low, \
 					self.output_high, self.output_diff, self.output_sum, self.mode, self.crop, \
-                    self.proj_avg_mode, self.proj_avg_alpha, 0 )				
+                    self.proj_avg_mode, self.proj_avg_alpha, 0, self.hex_resampling, \
+                    self.phase_retrieval, self.flatfielding_mode, self.alignment )				
 
 			# At the end emit a signal with the outputs:
 			self.processDone.emit( low, high, diff, sum, self.output_low, \
@@ -213,18 +224,22 @@ class PreprocessThread(QThread):
 class ReconThread(QThread):
 	
 	reconDone = pyqtSignal(object, object, object, object)      
+	reconPreview = pyqtSignal(object, object, object, object)      
 	logOutput = pyqtSignal(object)         
 	error = pyqtSignal(object, object)     
 
 	def __init__(self, parent, im, sourceFile, angles, geometry, ssd, sdd, \
             px, det_u, det_v, short_scan=False, method='FDK / FBP', \
             iterations=1, mode='2COL', overpadding=False, angles_shift=0, \
-            roll=0.0, pitch=0.0, yaw=0.0):
+            roll=0.0, pitch=0.0, yaw=0.0, subsets=1, system_matrix=False, roi=None, \
+            fov=False, progressive=1, upsampling=1, tolerance=0.0001):
 		""" Class constructor.
 		"""
 		super(ReconThread, self).__init__(parent)
 
-		self.im = im.astype(numpy.float32)
+		# Own copy of the data (reconstruction then works in place on it), i.e.
+		# of each channel if a list of channels with the same geometry:
+		self.im = [x.astype(numpy.float32) for x in (im if isinstance(im, list) else [im])]
 		self.angles = angles
 		self.geometry = geometry
 		self.ssd = ssd
@@ -242,6 +257,27 @@ class ReconThread(QThread):
 		self.roll = roll
 		self.pitch = pitch
 		self.yaw = yaw
+		self.subsets = subsets
+		self.system_matrix = system_matrix
+		self.roi = roi
+		self.fov = fov
+		self.progressive = progressive
+		self.upsampling = upsampling
+		self.tolerance = tolerance
+
+	def previewDone(self, rec, fraction):
+		""" Show the preview of the progressive reconstruction.
+		"""
+		self.reconPreview.emit(rec, fraction, self.sourceFile, self.mode)
+		self.logOutput.emit('Preview with ' + '{:.0f}'.format(100 * fraction) + \
+			'% of the projections.')
+
+	def iterationDone(self, iteration, rec, residual):
+		""" Report the progress of the iterative reconstruction.
+		"""
+		if (iteration % 10 == 0) or (iteration == self.iterations):
+			self.logOutput.emit('Iteration ' + str(iteration) + ' of ' + str(self.iterations) + \
+				' (residual: ' + '{:.5f}'.format(residual) + ').')
 
 	def run(self):
 		""" Run the thread.
@@ -250,22 +286,65 @@ class ReconThread(QThread):
 			# Log info:
 			t1 = timeit.default_timer()
 			self.logOutput.emit('Performing reconstruction...')		
+
+			# Gridding is defined for parallel-beam data only:
+			if (self.method == 'Gridding (parallel-beam)') and (self.geometry != 'parallel-beam'):
+				raise ValueError('Gridding reconstruction requires the parallel-beam geometry.')
+
+			# Detector tilt: folded into the cone-beam projectors, otherwise the
+			# projections are resampled (once for all the angles) onto an ideal
+			# detector:
+			tilt = (self.roll, self.pitch, self.yaw)
+			if any(tilt) and ((self.geometry == 'parallel-beam') or \
+					((self.method == 'SIRT') and (self.system_matrix))):
+				dsd = None if (self.geometry == 'parallel-beam') else self.sdd / self.px
+				self.im = [correct_detector_tilt(im, *tilt, dsd=dsd) for im in self.im]
+
+			# Angular upsampling (interpolated projections between the acquired
+			# ones, e.g. of a decimated fast scan):
+			if (self.upsampling > 1):
+				self.im = [upsample_angles(im, self.upsampling, self.angles, 'sinogram', \
+					self.geometry == 'parallel-beam', self.det_u) for im in self.im]
 			
-			# Correct dataset for overpadding:
-			if (self.overpadding):
-				val = int(round(self.im.shape[1] /4))				
-				self.im = numpy.pad(self.im, ((0,0), (val, val), (0,0)), 'edge')	
+			# Correct dataset for overpadding (FBP, FDK and gridding extend the
+			# projections virtually within their filter buffers, only SIRT needs
+			# the padded data and the larger volume):
+			pad = 0
+			if (self.overpadding) and (self.method == 'SIRT'):
+				pad = int(round(self.im[0].shape[1] /4))				
+				self.im = [numpy.pad(im, ((0,0), (pad, pad), (0,0)), 'edge') for im in self.im]
+
+			# Region of interest (in-plane bounds refer to the unpadded volume):
+			roi = None
+			if (self.roi is not None):
+				nu = self.im[0].shape[1] - 2 * pad
+				(x0, x1), (y0, y1), runs = roi_ranges(self.roi, (nu, nu, self.im[0].shape[0]))
+				roi = ((x0 + pad, x1 + pad), (y0 + pad, y1 + pad), [z for a, b in runs for z in range(a, b)])
 			
 			if (self.geometry == 'parallel-beam'):			
 				
                 #self.im, val = correct_dataset(self.im, self.det_u, 0, self.overpadding)
 
+				# Slices are independent, only the selected ones are reconstructed:
+				if (roi is not None) and (self.method != 'FDK / FBP'):
+					self.im = [im[roi[2]] for im in self.im]
+
 				# Do the reconstruction:
 				if (self.method == 'SIRT'):
-					rec = recon_astra_sirt_parallel(self.im, self.angles, self.iterations, self.angles_shift)  
+					rec = [recon_sirt_parallel(im, self.angles, self.iterations, self.angles_shift, \
+							self.det_u, self.subsets, self.tolerance, callback=self.iterationDone, \
+							system_matrix=self.system_matrix) for im in self.im]
+					#rec = recon_astra_sirt_parallel(self.im, self.angles, self.iterations, self.angles_shift)  
+
+				elif (self.method == 'Gridding (parallel-beam)'):
+					rec = [recon_gridding_parallel(im, self.angles, self.angles_shift, self.det_u, \
+							fov=self.fov, overpadding=self.overpadding) for im in self.im]
 								  
-				else: # default FBP       
-					rec = recon_astra_fbp(self.im, self.angles, self.angles_shift)
+				else: # default FBP (on CPU, channels jointly)
+					rec = recon_fbp_parallel(self.im, self.angles, self.angles_shift, self.det_u, \
+							inplace=True, roi=roi, fov=self.fov, progressive=self.progressive, \
+							callback=self.previewDone, overpadding=self.overpadding)
+					#rec = recon_astra_fbp(self.im, self.angles, self.angles_shift)
 			
 			else:    
 
@@ -273,24 +352,55 @@ class ReconThread(QThread):
 				#self.im, val = correct_dataset(self.im, self.det_u, self.det_v, self.overpadding)
 
 				# Do the reconstruction:
-				if (self.method == 'SIRT'):
-					rec = recon_astra_sirt_cone(self.im, self.angles, self.ssd, self.sdd - self.ssd, \
-							self.px, self.iterations, self.angles_shift)  
+				if (self.method == 'SIRT') and (self.system_matrix):
+
+					# Slice-wise fan-beam approximation: the detector tilt has been
+					# resampled above and the vertical offset is compensated here,
+					# the cone angle is neglected:
+					self.logOutput.emit('Warning: cached system matrix with cone-beam data, ' + \
+						'slices are reconstructed as fan-beam (cone angle neglected).')
+					if (self.det_v != 0):
+						shifts = numpy.tile(numpy.array([[-self.det_v, 0.0]], dtype=numpy.float32), \
+							(self.im[0].shape[2], 1))
+						self.im = [apply_shifts(im, shifts, 'linear') for im in self.im]
+
+					rec = [recon_sirt_fan(im, self.ssd, self.sdd - self.ssd, self.px, self.angles, \
+							self.iterations, self.angles_shift, self.det_u, self.subsets, \
+							self.tolerance, callback=self.iterationDone) for im in self.im]
+
+				elif (self.method == 'SIRT'):
+					rec = [recon_sirt_cone(im, self.ssd, self.sdd - self.ssd, self.px, self.angles, \
+							self.iterations, self.angles_shift, self.det_u, self.det_v, self.roll, \
+							self.pitch, self.yaw, self.subsets, self.tolerance, \
+							callback=self.iterationDone) for im in self.im]
+					#rec = recon_astra_sirt_cone(self.im, self.angles, self.ssd, self.sdd - self.ssd, \
+					#		self.px, self.iterations, self.angles_shift)  
 								  
-				else: # default FDK       
+				else: # default FDK (channels jointly)
 					rec = recon_tigre_fdk(self.im, self.ssd, self.sdd - self.ssd, self.px, self.angles, \
                             self.angles_shift, self.det_u, self.det_v, self.roll, self.pitch, 
-                            self.yaw, self.short_scan, self.overpadding, 'ram-lak')
+                            self.yaw, self.short_scan, self.overpadding, 'ram-lak', inplace=True, \
+                            roi=roi, fov=self.fov, progressive=self.progressive, \
+                            callback=self.previewDone)
 					#rec = recon_astra_fdk(self.im, self.angles, self.ssd, self.sdd - self.ssd, \
 					#		self.px, self.short_scan, self.overpadding, self.angles_shift)			
 
-			# Crop if overpadding:
-			if (self.overpadding):
-				rec = rec[val:-val, val:-val,:] 
+			for i in range(len(rec)):
 
+				# Crop the region of interest (if not reconstructed natively):
+				if (roi is not None):
+					if (rec[i].shape[2] != len(roi[2])):
+						rec[i] = rec[i][:, :, roi[2]]
+					if (rec[i].shape[:2] != (roi[0][1] - roi[0][0], roi[1][1] - roi[1][0])):
+						rec[i] = rec[i][roi[0][0]:roi[0][1], roi[1][0]:roi[1][1], :]
 
-			# At the end emit a signal with the outputs:
-			self.reconDone.emit(rec, self.sourceFile, RECON_TABLABEL, self.mode)
+				# Crop if overpadding (a view, no copy):
+				elif (pad > 0):
+					rec[i] = rec[i][pad:-pad, pad:-pad,:] 
+
+
+				# At the end emit a signal with the outputs:
+				self.reconDone.emit(rec[i], self.sourceFile, RECON_TABLABEL, self.mode)
 
 			# Log info:
 			t2 = timeit.default_timer()
@@ -329,6 +439,7 @@ class kstMainWindow(QMainWindow):
 		#self.pb = QProgressBar(self.statusBar())
 		#self.statusBar().addPermanentWidget(self.pb)
 		self.dset = None
+		self.previewViewer = None
 							
 		# Add the widgets to the panel:
 		self.sidebar = kstSidebar()
@@ -606,12 +717,25 @@ class kstMainWindow(QMainWindow):
 			proj_avg_alpha = self.sidebar.preprocessingTab.getValue("ProjectionAveraging_AlphaTrimmed")
 			
 			rebinning = self.sidebar.preprocessingTab.getValue("MatrixManipulation_Rebinning2x2")
+			hex_resampling = self.sidebar.preprocessingTab.getValue("MatrixManipulation_HexResampling")
 			
 			flatfielding_window = self.sidebar.preprocessingTab.getValue("FlatFielding_Window")
+			flatfielding_mode = self.sidebar.preprocessingTab.getValue("FlatFielding_Mode")
 
 			despeckle_thresh = self.sidebar.preprocessingTab.getValue("Despeckle_Threshold")	
+			alignment = self.sidebar.preprocessingTab.getValue("Correction_Alignment")
 			ringremoval_thresh = self.sidebar.preprocessingTab.getValue("RingRemoval_Threshold")
 
+			# Phase retrieval (pixel size as in the reconstruction geometry):
+			phase_retrieval = None
+			if (self.sidebar.preprocessingTab.getValue("PhaseRetrieval_Enabled")):
+				px = float(self.sidebar.reconstructionTab.getValue("Geometry_DetectorPixelSize"))
+				px = 2 * px if rebinning else px
+				phase_retrieval = ( px, \
+					float(self.sidebar.preprocessingTab.getValue("PhaseRetrieval_Distance")), \
+					float(self.sidebar.preprocessingTab.getValue("PhaseRetrieval_Energy")), \
+					float(self.sidebar.preprocessingTab.getValue("PhaseRetrieval_DeltaBeta")) )
+
 			output_low = self.sidebar.preprocessingTab.getValue("Output_LowEnergy")	
 			output_high = self.sidebar.preprocessingTab.getValue("Output_HighEnergy")
 			output_diff = self.sidebar.preprocessingTab.getValue("Output_LogSubtraction")	
@@ -632,7 +756,8 @@ class kstMainWindow(QMainWindow):
 					flatfielding_window, despeckle_thresh, output_low, \
 					output_high, output_diff, output_sum, mode, \
 					[crop_top, crop_bottom, crop_left, crop_right], \
-                    proj_avg_mode, proj_avg_alpha, ringremoval_thresh )
+                    proj_avg_mode, proj_avg_alpha, ringremoval_thresh, hex_resampling, \
+                    phase_retrieval, flatfielding_mode, alignment )
 			self.preprocessJobDone( low, high, diff, sum, output_low, output_high, \
 						   output_diff, output_sum, sourceFile, PREPROC_TABLABEL, mode )
 
@@ -669,6 +794,9 @@ class kstMainWindow(QMainWindow):
 			# Get parameters from UI:
 			method = self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Method")
 			iterations = self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Iterations")
+			subsets = self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Subsets")
+			tolerance = float(self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Tolerance"))
+			system_matrix = self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_SystemMatrix")
 			filter = self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_FDK-Filter")
 			weights = self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Weights")
 			angles = self.sidebar.reconstructionTab.getValue("Reconstruction_Angles")
@@ -686,24 +814,55 @@ class kstMainWindow(QMainWindow):
 			roll = float(self.sidebar.reconstructionTab.getValue("Offsets_Detector-Roll"))
 			pitch = float(self.sidebar.reconstructionTab.getValue("Offsets_Detector-Pitch"))
 			yaw = float(self.sidebar.reconstructionTab.getValue("Offsets_Detector-Yaw"))
+
+			# Region of interest (bounds are inclusive in the UI):
+			roi = None
+			if (self.sidebar.reconstructionTab.getValue("ROI_Enabled")):
+				x = parse_indices(self.sidebar.reconstructionTab.getValue("ROI_X"))
+				y = parse_indices(self.sidebar.reconstructionTab.getValue("ROI_Y"))
+				z = parse_indices(self.sidebar.reconstructionTab.getValue("ROI_Slices"))
+				roi = (None if x is None else (x[0], x[-1] + 1), \
+					   None if y is None else (y[0], y[-1] + 1), z)
+			fov = self.sidebar.reconstructionTab.getValue("ROI_FOVMask")
+
+			# All the channels (pre-processed tabs of the same source with the same
+			# size, e.g. low, high, diff and sum) share the geometry work:
+			if (self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_AllChannels")):
+				tabs = self.mainPanel.imagePanel.tabImageViewers
+				im = [im] + [tabs.widget(i).getData() for i in range(tabs.count()) \
+					if (tabs.widget(i) is not curr_tab) and \
+					   (tabs.widget(i).getSourceFile() == sourceFile) and \
+					   (tabs.widget(i).getType() == curr_tab.getType()) and \
+					   (tabs.widget(i).getData().shape == im.shape)]
 				
-			# Remove extra projections:
-			im = im[:,:,:nr_proj]
-			im = im[:,:,::angles_decimation]
+			# Remove extra projections (or use the decimation as first angular
+			# step of the progressive reconstruction):
+			progressive = 1
+			if (self.sidebar.reconstructionTab.getValue("Reconstruction_Angles_Progressive")):
+				progressive = angles_decimation
+				angles_decimation = 1
+			if isinstance(im, list):
+				im = [x[:,:,:nr_proj:angles_decimation] for x in im]
+			else:
+				im = im[:,:,:nr_proj:angles_decimation]
 
 			# Convert from degrees to radians:
 			angles = angles * numpy.pi / 180.0
 			angles_shift = angles_shift * numpy.pi / 180.0
 
 			# Convert to boolean for short_scan:
-			short_scan = False if (weights == 0) else True
+			short_scan = (weights == 'Parker')
 
 			# Call reconstruction (on a separate thread):
 			self.reconThread = ReconThread(self, im, sourceFile, angles, geometry, \
                 ssd, sdd, px, det_u, det_v, short_scan, method, iterations, mode, \
-                overpadding, angles_shift )
+                overpadding, angles_shift, roll, pitch, yaw, subsets=subsets, \
+                system_matrix=system_matrix, roi=roi, fov=fov, progressive=progressive, \
+                upsampling=2 if (upsampling) else 1, tolerance=tolerance )
 
+			self.previewViewer = None
 			self.reconThread.reconDone.connect(self.reconstructJobDone)                        
+			self.reconThread.reconPreview.connect(self.reconstructPreview)
 			self.reconThread.logOutput.connect(self.handleOutputLog)
 			self.reconThread.error.connect(self.handleThreadError)
 			self.reconThread.start()	
@@ -799,9 +958,31 @@ class kstMainWindow(QMainWindow):
 		self.sidebar.preprocessingTab.btnApply.setEnabled(True) 
 
 
+	def reconstructPreview(self, im, fraction, sourceFile, mode):
+		""" This function is called with each preview of a progressive reconstruction.
+		"""
+		
+		# Open a tab for the first preview, then update it:
+		if (self.previewViewer is None):
+			self.mainPanel.addTab(im, sourceFile, str(os.path.basename(sourceFile)) \
+					+ " - " + RECON_TABLABEL + " (preview)", RECON_TABLABEL, mode )
+			tabs = self.mainPanel.imagePanel.tabImageViewers
+			self.previewViewer = tabs.widget(tabs.count() - 1)
+		else:
+			self.previewViewer.setData(im)
+
+
 	def reconstructJobDone(self, im, sourceFile, type, mode):
 		""" This function is called when the preprocessing job thread has completed.
 		"""
+
+		# The final volume replaces the preview (if any):
+		if (self.previewViewer is not None):
+			tabs = self.mainPanel.imagePanel.tabImageViewers
+			idx = tabs.indexOf(self.previewViewer)
+			if (idx >= 0):
+				self.mainPanel.removeTab(idx)
+			self.previewViewer = None
 		
 		# Open a new tab in the image viewer with the output of reconstruction:
 		self.mainPanel.addTab(im, sourceFile, str(os.path.basename(sourceFile)) \
@@ -883,16 +1064,31 @@ class kstMainWindow(QMainWindow):
 
 		settings.setValue("MatrixManipulation_Rebinning2x2", \
 			self.sidebar.preprocessingTab.getValue("MatrixManipulation_Rebinning2x2"))  
+		settings.setValue("MatrixManipulation_HexResampling", \
+			self.sidebar.preprocessingTab.getValue("MatrixManipulation_HexResampling"))  
 		
 		settings.setValue("FlatFielding_Window", \
 			self.sidebar.preprocessingTab.getValue("FlatFielding_Window"))         
+		settings.setValue("FlatFielding_Mode", \
+			self.sidebar.preprocessingTab.getValue("FlatFielding_Mode"))         
 
 		settings.setValue("Despeckle_Threshold", \
 			self.sidebar.preprocessingTab.getValue("Despeckle_Threshold"))  
+		settings.setValue("Correction_Alignment", \
+			self.sidebar.preprocessingTab.getValue("Correction_Alignment"))  
 
 		settings.setValue("RingRemoval_Threshold", \
 			self.sidebar.preprocessingTab.getValue("RingRemoval_Threshold"))  
 
+		settings.setValue("PhaseRetrieval_Enabled", \
+			self.sidebar.preprocessingTab.getValue("PhaseRetrieval_Enabled"))  
+		settings.setValue("PhaseRetrieval_DeltaBeta", \
+			self.sidebar.preprocessingTab.getValue("PhaseRetrieval_DeltaBeta"))  
+		settings.setValue("PhaseRetrieval_Distance", \
+			self.sidebar.preprocessingTab.getValue("PhaseRetrieval_Distance"))  
+		settings.setValue("PhaseRetrieval_Energy", \
+			self.sidebar.preprocessingTab.getValue("PhaseRetrieval_Energy"))  
+
 		settings.setValue("Output_LowEnergy", \
 			self.sidebar.preprocessingTab.getValue("Output_LowEnergy"))  
 		settings.setValue("Output_HighEnergy", \
@@ -923,6 +1119,14 @@ class kstMainWindow(QMainWindow):
 			self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_FDK-Filter"))
 		settings.setValue("ReconstructionAlgorithm_Iterations", \
 			self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Iterations"))
+		settings.setValue("ReconstructionAlgorithm_Subsets", \
+			self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Subsets"))
+		settings.setValue("ReconstructionAlgorithm_Tolerance", \
+			self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Tolerance"))
+		settings.setValue("ReconstructionAlgorithm_SystemMatrix", \
+			self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_SystemMatrix"))
+		settings.setValue("ReconstructionAlgorithm_AllChannels", \
+			self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_AllChannels"))
 		settings.setValue("ReconstructionAlgorithm_Weights", \
 			self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Weights"))        
 		
@@ -947,6 +1151,15 @@ class kstMainWindow(QMainWindow):
 		settings.setValue("ReconstructionAlgorithm_Overpadding", \
 			self.sidebar.reconstructionTab.getValue("ReconstructionAlgorithm_Overpadding"))     
 
+		settings.setValue("Reconstruction_Angles_Progressive", \
+			self.sidebar.reconstructionTab.getValue("Reconstruction_Angles_Progressive"))
+
+		settings.setValue("ROI_Enabled", self.sidebar.reconstructionTab.getValue("ROI_Enabled"))
+		settings.setValue("ROI_X", self.sidebar.reconstructionTab.getValue("ROI_X"))
+		settings.setValue("ROI_Y", self.sidebar.reconstructionTab.getValue("ROI_Y"))
+		settings.setValue("ROI_Slices", self.sidebar.reconstructionTab.getValue("ROI_Slices"))
+		settings.setValue("ROI_FOVMask", self.sidebar.reconstructionTab.getValue("ROI_FOVMask"))
+
 		settings.endGroup()   
 
 
@@ -987,15 +1200,46 @@ class kstMainWindow(QMainWindow):
 		else:
 			self.sidebar.preprocessingTab.setValue("MatrixManipulation_Rebinning2x2", True)
 
+        # Bug in PyQT (or at least unexpected behaviour):
+		if ( (str(settings.value("MatrixManipulation_HexResampling", False)) == 'False') or  
+			 (str(settings.value("MatrixManipulation_HexResampling", False)) == 'false') ):
+			self.sidebar.preprocessingTab.setValue("MatrixManipulation_HexResampling", False)
+		else:
+			self.sidebar.preprocessingTab.setValue("MatrixManipulation_HexResampling", True)
+
 		self.sidebar.preprocessingTab.setValue("FlatFielding_Window", \
 			int(settings.value("FlatFielding_Window", 5))) 
+		self.sidebar.preprocessingTab.setValue("FlatFielding_Mode", \
+			self.sidebar.preprocessingTab.flat_fielding_modes.index( \
+			settings.value("FlatFielding_Mode", 'static')))
 
 		self.sidebar.preprocessingTab.setValue("Despeckle_Threshold", \
 			float(settings.value("Despeckle_Threshold", 0.10))) 
 
+        # Bug in PyQT (or at least unexpected behaviour):
+		if ( (str(settings.value("Correction_Alignment", False)) == 'False') or  
+			 (str(settings.value("Correction_Alignment", False)) == 'false') ):
+			self.sidebar.preprocessingTab.setValue("Correction_Alignment", False)
+		else:
+			self.sidebar.preprocessingTab.setValue("Correction_Alignment", True)
+
 		self.sidebar.preprocessingTab.setValue("RingRemoval_Threshold", \
 			int(settings.value("RingRemoval_Threshold", 5))) 
 		
+        # Bug in PyQT (or at least unexpected behaviour):
+		if ( (str(settings.value("PhaseRetrieval_Enabled", False)) == 'False') or  
+			 (str(settings.value("PhaseRetrieval_Enabled", False)) == 'false') ):
+			self.sidebar.preprocessingTab.setValue("PhaseRetrieval_Enabled", False)
+		else:
+			self.sidebar.preprocessingTab.setValue("PhaseRetrieval_Enabled", True)
+
+		self.sidebar.preprocessingTab.setValue("PhaseRetrieval_DeltaBeta", \
+			float(settings.value("PhaseRetrieval_DeltaBeta", 500.0))) 
+		self.sidebar.preprocessingTab.setValue("PhaseRetrieval_Distance", \
+			float(settings.value("PhaseRetrieval_Distance", 70.0))) 
+		self.sidebar.preprocessingTab.setValue("PhaseRetrieval_Energy", \
+			float(settings.value("PhaseRetrieval_Energy", 30.0))) 
+
         # Bug in PyQT (or at least unexpected behaviour):
 		if ( (str(settings.value("Output_LowEnergy")) == 'False') or  
 			 (str(settings.value("Output_LowEnergy")) == 'false') ):
@@ -1045,6 +1289,14 @@ class kstMainWindow(QMainWindow):
 			settings.value("ReconstructionAlgorithm_Method", 0)))
 		self.sidebar.reconstructionTab.setValue("ReconstructionAlgorithm_Iterations", \
 			int(settings.value("ReconstructionAlgorithm_Iterations", 200)))
+		self.sidebar.reconstructionTab.setValue("ReconstructionAlgorithm_Subsets", \
+			int(settings.value("ReconstructionAlgorithm_Subsets", 1)))
+		self.sidebar.reconstructionTab.setValue("ReconstructionAlgorithm_Tolerance", \
+			float(settings.value("ReconstructionAlgorithm_Tolerance", 0.0001)))
+		self.sidebar.reconstructionTab.setValue("ReconstructionAlgorithm_SystemMatrix", \
+			str(settings.value("ReconstructionAlgorithm_SystemMatrix", False)).lower() == 'true')
+		self.sidebar.reconstructionTab.setValue("ReconstructionAlgorithm_AllChannels", \
+			str(settings.value("ReconstructionAlgorithm_AllChannels", False)).lower() == 'true')
 		self.sidebar.reconstructionTab.setValue("ReconstructionAlgorithm_FDK-Filter", \
 			self.sidebar.reconstructionTab.fdk_filters.index( \
 			settings.value("ReconstructionAlgorithm_FDK-Filter", 0)))
@@ -1083,6 +1335,17 @@ class kstMainWindow(QMainWindow):
 		else:
 			self.sidebar.reconstructionTab.setValue("ReconstructionAlgorithm_Overpadding", True)
 
+		self.sidebar.reconstructionTab.setValue("Reconstruction_Angles_Progressive", \
+			str(settings.value("Reconstruction_Angles_Progressive", False)).lower() == 'true')
+
+		self.sidebar.reconstructionTab.setValue("ROI_X", str(settings.value("ROI_X", "")))
+		self.sidebar.reconstructionTab.setValue("ROI_Y", str(settings.value("ROI_Y", "")))
+		self.sidebar.reconstructionTab.setValue("ROI_Slices", str(settings.value("ROI_Slices", "")))
+		self.sidebar.reconstructionTab.setValue("ROI_Enabled", \
+			str(settings.value("ROI_Enabled", False)).lower() == 'true')
+		self.sidebar.reconstructionTab.setValue("ROI_FOVMask", \
+			str(settings.value("ROI_FOVMask", False)).lower() == 'true')
+
 		settings.endGroup()  
 
 
@@ -35,6 +35,9 @@ class kstPreprocessingPanel(QWidget):
     # Available projection averaging methods:
 	projection_averaging_methods = ('average', 'median', 'sum', 'minimum', 'maximum','extract')
 
+    # Available flat fielding methods:
+	flat_fielding_modes = ('static', 'dynamic')
+
 	def __init__(self):
 		""" Class constructor.
 		"""
@@ -147,9 +150,23 @@ class kstPreprocessingPanel(QWidget):
 		self.matrixManipulationItem.addSubProperty(item)        
 		self.addProperty(item, "MatrixManipulation_Rebinning2x2")
 
+		item = self.variantManager.addProperty(QVariant.Bool, "Hexagonal resampling")
+		item.setValue(False) # default
+		self.matrixManipulationItem.addSubProperty(item)        
+		self.addProperty(item, "MatrixManipulation_HexResampling")
+
 		self.flatFieldingItem = self.variantManager.addProperty(\
 		QtVariantPropertyManager.groupTypeId(), "Flat Fielding")
 	
+		item = self.variantManager.addProperty(QtVariantPropertyManager.enumTypeId(),"Mode")
+		enumNames = QList()
+		for method in kstPreprocessingPanel.flat_fielding_modes:  
+			enumNames.append(method)
+		item.setAttribute("enumNames", enumNames)
+		item.setValue(0) 
+		self.flatFieldingItem.addSubProperty(item)        
+		self.addProperty(item, "FlatFielding_Mode")
+
 		item = self.variantManager.addProperty(QVariant.Int, "Window")
 		item.setValue(5) # default for dead pixels
 		item.setAttribute("minimum", 3)
@@ -172,6 +189,11 @@ class kstPreprocessingPanel(QWidget):
 		self.correctionItem.addSubProperty(item)        
 		self.addProperty(item, "Despeckle_Threshold")
 
+		item = self.variantManager.addProperty(QVariant.Bool, "Jitter alignment")
+		item.setValue(False) # default
+		self.correctionItem.addSubProperty(item)        
+		self.addProperty(item, "Correction_Alignment")
+
 		#item = self.variantManager.addProperty(QVariant.Int, "Ring removal")
 		#item.setValue(5) # default for dead pixels
 		#item.setAttribute("minimum", 3)
@@ -182,6 +204,42 @@ class kstPreprocessingPanel(QWidget):
 		#self.addProperty(item, "RingRemoval_Threshold")
 
 
+		self.phaseRetrievalItem = self.variantManager.addProperty(\
+		QtVariantPropertyManager.groupTypeId(), "Phase retrieval")
+
+		item = self.variantManager.addProperty(QVariant.Bool, "Paganin")
+		item.setValue(False) # default
+		self.phaseRetrievalItem.addSubProperty(item)        
+		self.addProperty(item, "PhaseRetrieval_Enabled")
+
+		item = self.variantManager.addProperty(QVariant.Double, "Delta/Beta")
+		item.setValue(500.0) # default
+		item.setAttribute("minimum", 0.0)
+		item.setAttribute("maximum", 99999.0)
+		item.setAttribute("singleStep", 10.0)
+		item.setAttribute("decimals", 1)
+		self.phaseRetrievalItem.addSubProperty(item)        
+		self.addProperty(item, "PhaseRetrieval_DeltaBeta")
+
+		item = self.variantManager.addProperty(QVariant.Double, "Distance [mm]")
+		item.setValue(70.0) # default
+		item.setAttribute("minimum", 0.1)
+		item.setAttribute("maximum", 9999.9)
+		item.setAttribute("singleStep", 0.1)
+		item.setAttribute("decimals", 1)
+		self.phaseRetrievalItem.addSubProperty(item)        
+		self.addProperty(item, "PhaseRetrieval_Distance")
+
+		item = self.variantManager.addProperty(QVariant.Double, "Energy [keV]")
+		item.setValue(30.0) # default
+		item.setAttribute("minimum", 1.0)
+		item.setAttribute("maximum", 999.0)
+		item.setAttribute("singleStep", 0.5)
+		item.setAttribute("decimals", 1)
+		self.phaseRetrievalItem.addSubProperty(item)        
+		self.addProperty(item, "PhaseRetrieval_Energy")
+
+
 		self.outputItem = self.variantManager.addProperty(\
 		QtVariantPropertyManager.groupTypeId(), "Output")
 	
@@ -211,6 +269,7 @@ class kstPreprocessingPanel(QWidget):
 		self.variantEditor.addProperty(self.flatFieldingItem)
 		self.variantEditor.addProperty(self.matrixManipulationItem)		
 		self.variantEditor.addProperty(self.correctionItem)
+		self.variantEditor.addProperty(self.phaseRetrievalItem)
 		self.variantEditor.addProperty(self.outputItem)
 
 
@@ -254,6 +313,8 @@ class kstPreprocessingPanel(QWidget):
 		# Return a string for the combo boxes:
 		if (id == "ProjectionAveraging_Mode"):				
 			val = kstPreprocessingPanel.projection_averaging_methods[val]
+		elif (id == "FlatFielding_Mode"):				
+			val = kstPreprocessingPanel.flat_fielding_modes[val]
 
 		return val
 
@@ -44,7 +44,10 @@ class kstReconstructionPanel(QWidget):
 	geometry_type = ('cone-beam', 'parallel-beam')
 
 	# Available reconstruction algorithms:
-	reconstruction_methods = ('FDK / FBP', 'SIRT')
+	reconstruction_methods = ('FDK / FBP', 'SIRT', 'Gridding (parallel-beam)')
+
+	# Iterative algorithms (i.e. the ones with the number of iterations):
+	iterative_methods = ('SIRT',)
 
 	# Available reconstruction weighting methods:
 	weighting_methods = ('cosine (full 360°)', 'Parker')
@@ -117,6 +120,36 @@ class kstReconstructionPanel(QWidget):
 		self.methodItem.addSubProperty(item)
 		self.addProperty(item, "ReconstructionAlgorithm_Iterations")
 
+		item = self.variantManager.addProperty(QVariant.Int, "Subsets")
+		item.setValue(1) # default: plain SIRT
+		item.setAttribute("minimum", 1)
+		item.setAttribute("maximum", 999)
+		item.setAttribute("singleStep", 1)
+		item.setEnabled(False) # default
+		self.methodItem.addSubProperty(item)
+		self.addProperty(item, "ReconstructionAlgorithm_Subsets")
+
+		item = self.variantManager.addProperty(QVariant.Double, "Tolerance")
+		item.setValue(0.0001) # default: relative change of the residual
+		item.setAttribute("singleStep", 0.0001)
+		item.setAttribute("decimals", 6)
+		item.setAttribute("minimum", 0.0)
+		item.setAttribute("maximum", 1.0)
+		item.setEnabled(False) # default
+		self.methodItem.addSubProperty(item)
+		self.addProperty(item, "ReconstructionAlgorithm_Tolerance")
+
+		item = self.variantManager.addProperty(QVariant.Bool, "Cached system matrix")
+		item.setValue(False) # default: projections computed on the fly
+		item.setEnabled(False) # default
+		self.methodItem.addSubProperty(item)
+		self.addProperty(item, "ReconstructionAlgorithm_SystemMatrix")
+
+		item = self.variantManager.addProperty(QVariant.Bool, "All channels (jointly)")
+		item.setValue(False) # default: current tab only
+		self.methodItem.addSubProperty(item)
+		self.addProperty(item, "ReconstructionAlgorithm_AllChannels")
+
 		item = self.variantManager.addProperty(QtVariantPropertyManager.enumTypeId(),"Weights")
 		enumNames = QList()
 		for method in kstReconstructionPanel.weighting_methods:  
@@ -167,10 +200,15 @@ class kstReconstructionPanel(QWidget):
 		self.anglesItem.addSubProperty(item)
 		self.addProperty(item, "Reconstruction_Angles_Decimation")
 
+		item = self.variantManager.addProperty(QVariant.Bool, "Progressive (preview)")
+		item.setValue(False) 
+		self.anglesItem.addSubProperty(item)
+		self.addProperty(item, "Reconstruction_Angles_Progressive")
+
 		self.paddingItem = self.variantManager.addProperty(\
 			QtVariantPropertyManager.groupTypeId(), "Padding / Upsampling")
 
-		item = self.variantManager.addProperty(QVariant.Bool, "Upsampling 2x2")
+		item = self.variantManager.addProperty(QVariant.Bool, "Angular upsampling 2x")
 		item.setValue(False) 
 		self.paddingItem.addSubProperty(item)
 		self.addProperty(item, "ReconstructionAlgorithm_Upsampling")
@@ -180,6 +218,38 @@ class kstReconstructionPanel(QWidget):
 		self.paddingItem.addSubProperty(item)
 		self.addProperty(item, "ReconstructionAlgorithm_Overpadding")
 
+
+		self.roiItem = self.variantManager.addProperty(\
+			QtVariantPropertyManager.groupTypeId(), "Region of Interest")
+
+		item = self.variantManager.addProperty(QVariant.Bool, "Enabled")
+		item.setValue(False) # default: whole volume
+		self.roiItem.addSubProperty(item)
+		self.addProperty(item, "ROI_Enabled")
+
+		item = self.variantManager.addProperty(QVariant.String, "X range [voxel]")
+		item.setValue("") # default: all the columns (e.g. "100-400")
+		item.setEnabled(False) # default
+		self.roiItem.addSubProperty(item)
+		self.addProperty(item, "ROI_X")
+
+		item = self.variantManager.addProperty(QVariant.String, "Y range [voxel]")
+		item.setValue("") # default: all the rows (e.g. "100-400")
+		item.setEnabled(False) # default
+		self.roiItem.addSubProperty(item)
+		self.addProperty(item, "ROI_Y")
+
+		item = self.variantManager.addProperty(QVariant.String, "Slices")
+		item.setValue("") # default: all the slices (e.g. "100-110, 250")
+		item.setEnabled(False) # default
+		self.roiItem.addSubProperty(item)
+		self.addProperty(item, "ROI_Slices")
+
+		item = self.variantManager.addProperty(QVariant.Bool, "Circular FOV mask")
+		item.setValue(False) # default: all the voxels of the grid
+		self.roiItem.addSubProperty(item)
+		self.addProperty(item, "ROI_FOVMask")
+
 	
 		self.geometryItem = self.variantManager.addProperty(\
 			QtVariantPropertyManager.groupTypeId(), "Geometry")
@@ -305,6 +375,7 @@ class kstReconstructionPanel(QWidget):
 		self.variantEditor.addProperty(self.anglesItem)		
 		self.variantEditor.addProperty(self.offsetItem)
 		self.variantEditor.addProperty(self.paddingItem)
+		self.variantEditor.addProperty(self.roiItem)
 		self.variantEditor.addProperty(self.postprocItem)
 
 		if isinstance(self.variantEditor, QtTreePropertyBrowser):
@@ -336,6 +407,9 @@ class kstReconstructionPanel(QWidget):
 		
 		# Get the iterations and weights properties:
 		pIter = self.idToProperty["ReconstructionAlgorithm_Iterations"] 
+		pSubs = self.idToProperty["ReconstructionAlgorithm_Subsets"] 
+		pTolr = self.idToProperty["ReconstructionAlgorithm_Tolerance"] 
+		pSysM = self.idToProperty["ReconstructionAlgorithm_SystemMatrix"] 
 		pWeig = self.idToProperty["ReconstructionAlgorithm_Weights"] 
 		pOffV = self.idToProperty["Offsets_Detector-v"] 
 		pFilt = self.idToProperty["ReconstructionAlgorithm_FDK-Filter"] 
@@ -343,12 +417,21 @@ class kstReconstructionPanel(QWidget):
 		# Get the related property:
 		id = self.propertyToId[property]
 
+		# Enable/disable the bounds of the region of interest:
+		if (id == "ROI_Enabled"):
+			for roi_id in ("ROI_X", "ROI_Y", "ROI_Slices"):
+				self.idToProperty[roi_id].setEnabled(bool(value))
+
 		# Enable/disable iterations property:
 		if (id == "ReconstructionAlgorithm_Method"):			
 
 			# Enable or disable it:
-			if (value == 0): # FDK / FBP
+			if (kstReconstructionPanel.reconstruction_methods[value] not in \
+				kstReconstructionPanel.iterative_methods): # FDK / FBP, Gridding
 				pIter.setEnabled(False)
+				pSubs.setEnabled(False)
+				pTolr.setEnabled(False)
+				pSysM.setEnabled(False)
 				pFilt.setEnabled(True)
 								
 				if (self.getValue("Geometry_Type") == 'cone-beam'): 
@@ -359,6 +442,9 @@ class kstReconstructionPanel(QWidget):
 					pOffV.setEnabled(False)
 			else:
 				pIter.setEnabled(True)
+				pSubs.setEnabled(True)
+				pTolr.setEnabled(True)
+				pSysM.setEnabled(True)
 				pFilt.setEnabled(False)
 				pWeig.setEnabled(False)
 
@@ -377,12 +463,17 @@ class kstReconstructionPanel(QWidget):
 				gPS.setEnabled(True)
 				pOffV.setEnabled(True)
 
-				if (self.getValue("ReconstructionAlgorithm_Method") == 'FDK / FBP'):
+				if (self.getValue("ReconstructionAlgorithm_Method") not in \
+					kstReconstructionPanel.iterative_methods):
 					pIter.setEnabled(False)
+					pSubs.setEnabled(False)
+					pSysM.setEnabled(False)
 					pFilt.setEnabled(True)
 					pWeig.setEnabled(True)
 				else:
 					pIter.setEnabled(True)
+					pSubs.setEnabled(True)
+					pSysM.setEnabled(True)
 					pFilt.setEnabled(False)
 					pWeig.setEnabled(False)
 
@@ -2,4 +2,22 @@ from __future__ import print_function
 import sys
 
 def eprint(*args, **kwargs):
-    print(*args, file=sys.stderr, **kwargs)
\ No newline at end of file
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def parse_indices(text):
+    """Parse a list of indices and inclusive ranges such as "10, 20-25".
+    Return the sorted list of indices or None if the text is empty.
+    """
+    indices = set()
+    for item in text.replace(';', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '-' in item:
+            a, b = item.split('-', 1)
+            indices.update(range(int(a), int(b) + 1))
+        else:
+            indices.add(int(item))
+
+    return sorted(indices) if indices else None
@@ -1,7 +1,16 @@
+from . import kst_alignment
+from . import kst_backprojection
+from . import kst_fft
 from . import kst_flat_fielding
+from . import kst_gridding
 from . import kst_io
+from . import kst_iterative
 from . import kst_matrix_manipulation
+from . import kst_phase_retrieval
 from . import kst_preprocessing
 #from . import kst_reconstruction
 from . import kst_remove_outliers
+from . import kst_streaming
+from . import kst_system_matrix
 from . import kst_tigre_FDK
+from . import kst_upsampling
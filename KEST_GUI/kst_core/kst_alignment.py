@@ -0,0 +1,273 @@
+from numpy import float32, newaxis, moveaxis, arange, argmax, hanning, outer, conj
+from numpy import floor, exp, pi, zeros, cumsum, where, concatenate, finfo, int32
+from numpy import absolute
+from numpy.fft import fftfreq, rfftfreq
+from collections import OrderedDict
+
+from . import kst_fft
+
+# Cached shift tables (one for each dataset and setting), least recently used
+# first, and their largest number:
+_shift_tables = OrderedDict()
+SHIFT_TABLES = 16
+
+# Cached apodization windows (one for each padded shape):
+_windows = {}
+
+
+def _window(shape):
+	"""Get (or compute and cache) the read-only 2D Hann window of the
+	specified shape.
+
+	"""
+	if shape not in _windows:
+		w = outer(hanning(shape[0]), hanning(shape[1])).astype(float32)
+		w.flags.writeable = False
+		_windows[shape] = w
+
+	return _windows[shape]
+
+
+def _subpixel_peak(corr):
+	"""Locate with sub-pixel accuracy (parabolic fit) the maximum of each
+	(circular) correlation image of the batch corr [batch,rows,cols].
+
+	"""
+	n, rows, cols = corr.shape
+	eps = finfo(float32).eps
+
+	# Integer peak:
+	idx = argmax(corr.reshape(n, -1), axis=1)
+	r, c = idx // cols, idx % cols
+	b = arange(n)
+	c0 = corr[b, r, c]
+
+	# Parabolic fit along each direction:
+	def _parabola(m, p):
+		den = m - 2 * c0 + p
+		return where(absolute(den) > eps, 0.5 * (m - p) / (den + eps), 0.0)
+
+	dr = _parabola(corr[b, (r - 1) % rows, c], corr[b, (r + 1) % rows, c])
+	dc = _parabola(corr[b, r, (c - 1) % cols], corr[b, r, (c + 1) % cols])
+
+	# Signed shifts:
+	r = where(r > rows // 2, r - rows, r) + dr
+	c = where(c > cols // 2, c - cols, c) + dc
+
+	return r, c
+
+
+def estimate_shifts(im, reference='neighbour', axis=2, batch_size=32, nr_threads=None):
+	"""Estimate the (vertical, horizontal) shift of each projection by FFT
+	phase correlation.
+
+	Parameters
+	----------
+	im : array_like
+		Projections as numpy array organized as [x,y,angles] (or [angles,x,y]
+		with axis=0).
+
+	reference : {'neighbour', int}
+		Either each projection is compared with the previous one (and the
+		shifts are accumulated) or with the projection of the specified index.
+
+	axis : int
+		Axis of im along which projections are stacked.
+
+	batch_size : int
+		Number of projections transformed together by each FFT.
+
+	nr_threads : int
+		Number of threads of the FFTs (default: all the cores).
+
+	Return
+	----------
+	shifts : array_like
+		Table [angles,2] with the displacement (rows, columns) in pixels of
+		each projection. For the 'neighbour' reference shifts have zero mean.
+
+	"""
+	proj = moveaxis(im, axis, 0)
+	nr_proj, rows, cols = proj.shape
+
+	# Padded shape and offset of the image in the FFT buffer:
+	shape = (kst_fft.padded_size(rows), kst_fft.padded_size(cols))
+	r0 = (shape[0] - rows) // 2
+	c0 = (shape[1] - cols) // 2
+
+	# Cached plans and window:
+	batch_size = min(batch_size, nr_proj)
+	fwd, inv = kst_fft.rfft_plans((batch_size,) + shape, (1, 2), nr_threads)
+	buf = fwd.input_array
+	spectrum = fwd.output_array
+	win = _window(shape)
+
+	def _spectra(data):
+		n = data.shape[0]
+		kst_fft.edge_pad_into(buf[:n], data, r0, c0)
+		buf[:n] -= buf[:n].mean(axis=(1, 2), keepdims=True)
+		buf[:n] *= win
+		fwd()
+		return spectrum[:n].copy()
+
+	# Spectrum of the reference projection (if fixed):
+	ref = None
+	if (reference != 'neighbour'):
+		ref = conj(_spectra(proj[reference:reference + 1].astype(float32)))
+
+	shifts = zeros((nr_proj, 2), dtype=float32)
+	prev = None
+
+	for i in range(0, nr_proj, batch_size):
+		n = min(batch_size, nr_proj - i)
+		s = _spectra(proj[i:i + n])
+
+		# Previous projections (the first one is compared with itself):
+		if (ref is None):
+			r = conj(concatenate((s[:1] if prev is None else prev, s[:-1])))
+			prev = s[-1:].copy()
+		else:
+			r = ref
+
+		# Normalized cross-power spectrum (regularized against the noise
+		# of the weak frequencies):
+		s *= r
+		mag = absolute(s)
+		s /= mag + 0.05 * mag.max(axis=(1, 2), keepdims=True) + finfo(float32).eps
+		spectrum[:n] = s
+		inv()
+
+		shifts[i:i + n, 0], shifts[i:i + n, 1] = _subpixel_peak(buf[:n])
+
+	# From relative to absolute shifts:
+	if (ref is None):
+		shifts = cumsum(shifts, axis=0)
+		shifts -= shifts.mean(axis=0)
+
+	return shifts
+
+
+def apply_shifts(im, shifts, method='fourier', axis=2, batch_size=32, nr_threads=None):
+	"""Compensate the specified shifts, i.e. each projection is moved by the
+	opposite of its shift.
+
+	Parameters
+	----------
+	im : array_like
+		Projections as numpy array organized as [x,y,angles] (or [angles,x,y]
+		with axis=0). A float32 input is corrected in place.
+
+	shifts : array_like
+		Table [angles,2] with the displacement (rows, columns) in pixels of
+		each projection (e.g. as returned by estimate_shifts).
+
+	method : {'fourier', 'linear'}
+		Shift with a phase ramp (on edge-padded projections) or with bilinear
+		interpolation (edges replicated).
+
+	axis : int
+		Axis of im along which projections are stacked.
+
+	batch_size : int
+		Number of projections processed together.
+
+	nr_threads : int
+		Number of threads of the FFTs (default: all the cores).
+
+	Return
+	----------
+	im : array_like
+		Aligned projections (same layout of the input).
+
+	"""
+	im = im.astype(float32, copy=False)
+	proj = moveaxis(im, axis, 0)
+	nr_proj, rows, cols = proj.shape
+	batch_size = min(batch_size, nr_proj)
+
+	if (method == 'linear'):
+
+		for i in range(0, nr_proj, batch_size):
+			n = min(batch_size, nr_proj - i)
+			block = proj[i:i + n].copy()
+			b = arange(n)[:, newaxis, newaxis]
+
+			# Source coordinates (opposite shift) and bilinear weights:
+			y = arange(rows)[newaxis, :, newaxis] + shifts[i:i + n, 0, newaxis, newaxis]
+			x = arange(cols)[newaxis, newaxis, :] + shifts[i:i + n, 1, newaxis, newaxis]
+			y0, x0 = floor(y), floor(x)
+			wy, wx = (y - y0).astype(float32), (x - x0).astype(float32)
+			y0, x0 = y0.astype(int32), x0.astype(int32)
+			y1, x1 = (y0 + 1).clip(0, rows - 1), (x0 + 1).clip(0, cols - 1)
+			y0, x0 = y0.clip(0, rows - 1), x0.clip(0, cols - 1)
+
+			proj[i:i + n] = (block[b, y0, x0] * (1 - wx) + block[b, y0, x1] * wx) * (1 - wy) + \
+							(block[b, y1, x0] * (1 - wx) + block[b, y1, x1] * wx) * wy
+
+	else: # default 'fourier'
+
+		# Padded shape and offset of the image in the FFT buffer:
+		shape = (kst_fft.padded_size(rows), kst_fft.padded_size(cols))
+		r0 = (shape[0] - rows) // 2
+		c0 = (shape[1] - cols) // 2
+
+		fwd, inv = kst_fft.rfft_plans((batch_size,) + shape, (1, 2), nr_threads)
+		buf = fwd.input_array
+		spectrum = fwd.output_array
+		fy = fftfreq(shape[0])
+		fx = rfftfreq(shape[1])
+
+		for i in range(0, nr_proj, batch_size):
+			n = min(batch_size, nr_proj - i)
+			kst_fft.edge_pad_into(buf[:n], proj[i:i + n], r0, c0)
+			fwd()
+
+			# Separable phase ramps:
+			spectrum[:n] *= exp(2j * pi * fy[newaxis, :] * \
+				shifts[i:i + n, 0, newaxis]).astype(spectrum.dtype)[:, :, newaxis]
+			spectrum[:n] *= exp(2j * pi * fx[newaxis, :] * \
+				shifts[i:i + n, 1, newaxis]).astype(spectrum.dtype)[:, newaxis, :]
+			inv()
+
+			proj[i:i + n] = buf[:n, r0:r0 + rows, c0:c0 + cols]
+
+	return im
+
+
+def align_projections(im, key=None, reference='neighbour', method='fourier', axis=2, \
+					  batch_size=32, nr_threads=None):
+	"""Correct the jitter of the projections, i.e. estimate (or get from the
+	cache) the shift table and compensate the shifts.
+
+	Parameters
+	----------
+	im : array_like
+		Projections as numpy array organized as [x,y,angles] (or [angles,x,y]
+		with axis=0).
+
+	key : hashable
+		Identifier of the dataset (e.g. source file and pre-processing
+		settings). If specified, the shift table is cached and re-used by
+		further calls with the same key, shape and reference.
+
+	(see estimate_shifts and apply_shifts for the other parameters)
+
+	Return
+	----------
+	im, shifts : array_like
+		Aligned projections and the shift table.
+
+	"""
+	cache_key = None if key is None else (key, im.shape, axis, reference)
+
+	if (cache_key is not None) and (cache_key in _shift_tables):
+		_shift_tables.move_to_end(cache_key)
+		shifts = _shift_tables[cache_key]
+	else:
+		shifts = estimate_shifts(im, reference, axis, batch_size, nr_threads)
+		if (cache_key is not None):
+			_shift_tables[cache_key] = shifts
+			while len(_shift_tables) > SHIFT_TABLES:
+				_shift_tables.popitem(last=False)
+
+	return apply_shifts(im, shifts, method, axis, batch_size, nr_threads), shifts
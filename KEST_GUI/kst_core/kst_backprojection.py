@@ -0,0 +1,923 @@
+from numpy import float32, float64, int32, arange, zeros, empty, array, cos, sin, floor
+from numpy import radians, dot, newaxis, add, argsort, unique, sqrt, bincount, broadcast_to
+from numpy import ceil, searchsorted, repeat, cumsum, full, arctan, minimum, int64
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+
+# Maximum number of elements of the (slices x voxels) temporaries of each thread:
+SLAB_ELEMENTS = 2 ** 21
+
+# Maximum number of elements of the interpolation tables of each block of angles:
+TABLE_ELEMENTS = 2 ** 23
+
+# Detector coordinates are clipped within the zero border of the projections:
+BORDER = 0.999
+
+# Cached resampling maps of the detector tilt correction (one for each detector
+# size, tilt and source distance):
+_tilt_maps = {}
+
+
+def _detector_frame(roll_deg, pitch_deg, yaw_deg):
+	"""Unit vectors (u, v and normal) of the detector in the frame rotating
+	with the source, i.e. (t, s, z) with t pointing from the origin to the
+	source, after the tilt (roll about t, pitch about s and yaw about z).
+
+	"""
+	r, p, y = radians(roll_deg), radians(pitch_deg), radians(yaw_deg)
+
+	rot_t = array([[1, 0, 0], [0, cos(r), -sin(r)], [0, sin(r), cos(r)]])
+	rot_s = array([[cos(p), 0, sin(p)], [0, 1, 0], [-sin(p), 0, cos(p)]])
+	rot_z = array([[cos(y), -sin(y), 0], [sin(y), cos(y), 0], [0, 0, 1]])
+	rot = dot(rot_t, dot(rot_s, rot_z))
+
+	return rot[:, 1], rot[:, 2], rot[:, 0]
+
+
+def _dot(d_t, s, z, e):
+	"""Scalar product between the rays d = (d_t, s, z) and the vector e, 
+	skipping the null terms (to avoid (slices x voxels) arrays if possible).
+
+	"""
+	val = 0.0
+	if (e[0] != 0.0):
+		val = val + d_t * e[0]
+	if (e[1] != 0.0):
+		val = val + s * e[1]
+	if (e[2] != 0.0):
+		val = val + z * e[2]
+
+	return val
+
+
+def _coords2(width, x, y):
+	"""Flattened indices and fractional parts (fx, fy) of the bilinear 
+	interpolation at the (already clipped) coordinates x, y of a zero 
+	bordered projection of the specified width. NOTE: y is overwritten.
+
+	"""
+	x0 = floor(x)
+	fx = x - x0
+	idx = x0.astype(int32)
+
+	# Vertical coordinates (in place, this is the larger array):
+	y0 = floor(y)
+	y -= y0
+	idx = idx + y0.astype(int32) * width
+
+	return idx, fx, y
+
+
+def _gather2(p, width, coords, w, acc):
+	"""Accumulate into acc the bilinear interpolation (weighted by w) of the
+	flattened projection p at the coordinates computed by _coords2 (which 
+	can be shared by projections with the same geometry).
+
+	"""
+	idx, fx, fy = coords
+
+	# Shifted views instead of shifted indexes:
+	val = p.take(idx)
+	val += fx * (p[1:].take(idx) - val)
+	tmp = p[width:].take(idx)
+	tmp += fx * (p[width + 1:].take(idx) - tmp)
+	tmp -= val
+	tmp *= fy
+	val += tmp
+	val *= w
+	acc += val
+
+
+def _interp2(p, width, x, y, w, acc):
+	"""Accumulate into acc the bilinear interpolation (weighted by w) of the
+	flattened (zero bordered) projection p of the specified width at the 
+	(already clipped) coordinates x, y. NOTE: y is overwritten.
+
+	"""
+	_gather2(p, width, _coords2(width, x, y), w, acc)
+
+
+def detector_tilt_map(nu, nv, roll_deg, pitch_deg, yaw_deg, dsd=None):
+	"""Get (or compute and cache) the sub-pixel resampling map from the ideal
+	(untilted) detector to the tilted one, as read-only bilinear coordinates 
+	(see _coords2) of the zero bordered projections. Each ideal pixel reads 
+	the point where its ray crosses the tilted detector, which is rotated 
+	about its center (see _detector_frame).
+
+	Parameters
+	----------
+	nu, nv : int
+		Number of detector columns and rows.
+
+	roll_deg, pitch_deg, yaw_deg : double [degrees]
+		Detector tilt.
+
+	dsd : double [pixel]
+		Source-detector distance for cone-beam rays (None for parallel-beam).
+
+	"""
+	key = (int(nu), int(nv), float(roll_deg), float(pitch_deg), float(yaw_deg), \
+		None if dsd is None else float(dsd))
+
+	if key not in _tilt_maps:
+		eu, ev, en = _detector_frame(roll_deg, pitch_deg, yaw_deg)
+		u = (arange(nu) - (nu - 1) / 2.0)[newaxis, :]
+		v = (arange(nv) - (nv - 1) / 2.0)[:, newaxis]
+
+		# Crossing of the ray of each ideal pixel (u, v) with the tilted plane
+		# through the detector center:
+		if dsd is None:
+			# Rays along the beam (t axis):
+			a = -(u * en[1] + v * en[2]) / en[0]
+			q = (a, u, v)
+		else:
+			# Rays from the source at (dsd, 0, 0):
+			a = -dsd * en[0] / (-dsd * en[0] + u * en[1] + v * en[2])
+			q = (dsd * (1 - a), a * u, a * v)
+
+		x = (_dot(q[0], q[1], q[2], eu) + zeros((nv, nu))).ravel() + (nu + 1) / 2.0
+		y = (_dot(q[0], q[1], q[2], ev) + zeros((nv, nu))).ravel() + (nv + 1) / 2.0
+		x = x.clip(0, nu + BORDER).astype(float32)
+		y = y.clip(0, nv + BORDER).astype(float32)
+
+		coords = _coords2(nu + 2, x, y)
+		for c in coords:
+			c.flags.writeable = False
+		_tilt_maps[key] = coords
+
+	return _tilt_maps[key]
+
+
+def correct_detector_tilt(proj, roll_deg, pitch_deg, yaw_deg, dsd=None, nr_threads=None):
+	"""Resample the projections [rows,cols,angles] of a tilted detector onto 
+	the ideal one with the cached map of detector_tilt_map (no geometry cost 
+	for each projection), in blocks of angles across threads. Meant for the
+	reconstruction methods that cannot fold the tilt into their projectors.
+
+	Parameters
+	----------
+	proj : array_like
+		Projections as numpy array organized as [rows,cols,angles].
+
+	roll_deg, pitch_deg, yaw_deg : double [degrees]
+		Detector tilt.
+
+	dsd : double [pixel]
+		Source-detector distance for cone-beam rays (None for parallel-beam).
+
+	nr_threads : int
+		Number of parallel threads (default: all the cores).
+
+	Return
+	----------
+	out : array_like
+		Resampled (float32) projections organized as [rows,cols,angles].
+
+	"""
+	nr_threads = cpu_count() if nr_threads is None else nr_threads
+	nv, nu, nr_angles = proj.shape
+	width = nu + 2
+	coords = detector_tilt_map(nu, nv, roll_deg, pitch_deg, yaw_deg, dsd)
+
+	out = empty(proj.shape, dtype=float32)
+	block = max(1, min(16, -(-nr_angles // nr_threads)))
+
+	def _block(i0):
+		p = zeros((nv + 2, width), dtype=float32)
+		val = empty(nv * nu, dtype=float32)
+
+		for i in range(i0, min(i0 + block, nr_angles)):
+			p[1:-1, 1:-1] = proj[:, :, i]
+			val[:] = 0
+			_gather2(p.ravel(), width, coords, float32(1.0), val)
+			out[:, :, i] = val.reshape(nv, nu)
+
+	with ThreadPoolExecutor(max_workers=nr_threads) as executor:
+		list(executor.map(_block, range(0, nr_angles, block)))
+
+	return out
+
+
+def _splat2(p, width, x, y, val):
+	"""Accumulate val into the flattened (zero bordered) projection p of the
+	specified width at the (already clipped) coordinates x, y. This is the
+	adjoint of _interp2. NOTE: y is overwritten.
+
+	"""
+	x0 = floor(x)
+	fx = x - x0
+	idx = x0.astype(int32)
+
+	y0 = floor(y)
+	y -= y0
+	idx = broadcast_to(idx + y0.astype(int32) * width, val.shape).ravel()
+
+	# Bilinear weights of the four neighbours:
+	bottom = val * y
+	top = val - bottom
+	n = len(p)
+	for v, shift in ((top, 0), (bottom, width)):
+		right = v * fx
+		v -= right
+		p += bincount(idx + shift, v.ravel(), n)
+		p += bincount(idx + shift + 1, right.ravel(), n)
+
+
+def _fov_voxels(vx, vy, radius):
+	"""Flattened [x,y] indices of the voxels (of coordinates vx, vy in 
+	ascending order) within radius from the rotation axis, gathered from the
+	per-row ranges of y.
+
+	"""
+	half = sqrt((radius * radius - vx * vx).clip(0))
+	y0 = searchsorted(vy, -half, 'left')
+	y1 = searchsorted(vy, half, 'right')
+	y1[vx * vx > radius * radius] = y0[vx * vx > radius * radius]
+
+	# Concatenation of the ranges (no loop over the rows):
+	counts = y1 - y0
+	starts = arange(len(vx), dtype=int64) * len(vy) + y0
+	offsets = cumsum(counts) - counts
+
+	return arange(int(counts.sum()), dtype=int64) + repeat(starts - offsets, counts)
+
+
+def fov_radius_parallel(nu, offset_u=0.0):
+	"""Radius [pixel] of the field of view of a parallel-beam scan, i.e. of
+	the cylinder (about the rotation axis) seen by all the projections.
+
+	"""
+	center = (nu - 1) / 2.0 - offset_u
+
+	return max(0.0, min(center, nu - 1 - center))
+
+
+def fov_radius_cone(geo, z):
+	"""Radius [mm] of the field of view of a cone-beam scan (i.e. of the 
+	region seen by all the projections, detector tilt neglected) for the 
+	slices at the heights z [mm]: the cylinder of the fan cut by the cone.
+
+	"""
+	nu, nv = int(geo.nDetector[0]), int(geo.nDetector[1])
+	u = array([-1.0, 1.0]) * (nu - 1) / 2.0 * geo.dDetector[0] + geo.offDetector[0]
+	v = array([-1.0, 1.0]) * (nv - 1) / 2.0 * geo.dDetector[1] + geo.offDetector[1]
+	z = array(z, dtype=float64)
+
+	# Cylinder tangent to the outermost rays of the fan:
+	if (u[0] >= 0) or (u[1] <= 0):
+		return zeros(z.shape)
+	r = full(z.shape, geo.DSO * sin(arctan(min(-u[0], u[1]) / geo.DSD)))
+
+	# Cone cut, for the most magnified voxels (i.e. the ones closest to the 
+	# source) of each slice:
+	pos, neg = z > 0, z < 0
+	r[pos] = minimum(r[pos], geo.DSO - z[pos] * geo.DSD / v[1]) if (v[1] > 0) else 0
+	r[neg] = minimum(r[neg], geo.DSO - z[neg] * geo.DSD / v[0]) if (v[0] < 0) else 0
+
+	return r.clip(0)
+
+
+def fov_mask(rec, radius, vx, vy):
+	"""Zero (in place) the voxels of rec [x,y,z] outside the field of view
+	(radius scalar or one value for each slice, same units as the voxel
+	coordinates vx, vy).
+
+	"""
+	r2 = (vx[:, newaxis] ** 2 + vy[newaxis, :] ** 2)[:, :, newaxis]
+	radius = array(radius, dtype=float64).reshape(-1)
+	rec *= (r2 <= (radius * radius)[newaxis, newaxis, :])
+
+	return rec
+
+
+def _cone_frame(geo, roll_deg, pitch_deg, yaw_deg):
+	"""Detector frame, normal component of the vector from the source to the
+	detector center and bordered detector center.
+
+	"""
+	nu, nv = int(geo.nDetector[0]), int(geo.nDetector[1])
+
+	eu, ev, en = _detector_frame(roll_deg, pitch_deg, yaw_deg)
+	k = array([-geo.DSD, 0.0, 0.0]) + geo.offDetector[0] * eu + geo.offDetector[1] * ev
+	k_n = dot(k, en)
+	c_u = (nu + 1) / 2.0 - dot(k, eu) / geo.dDetector[0]
+	c_v = (nv + 1) / 2.0 - dot(k, ev) / geo.dDetector[1]
+
+	return eu, ev, en, k_n, c_u, c_v
+
+
+def _cone_setup(geo, roll_deg, pitch_deg, yaw_deg):
+	"""Voxel coordinates (in-plane flattened as [x,y] and along z) and
+	detector frame (see _cone_frame) shared by the cone-beam projectors, 
+	memoized in the geometry for each detector tilt.
+
+	"""
+	return geo.table('cone_setup', _cone_tables, float(roll_deg), float(pitch_deg), float(yaw_deg))
+
+
+def _cone_tables(geo, roll_deg, pitch_deg, yaw_deg):
+	nx, ny, nz = int(geo.nVoxel[0]), int(geo.nVoxel[1]), int(geo.nVoxel[2])
+
+	vx = (arange(nx) - (nx - 1) / 2.0) * geo.dVoxel[0] + geo.offOrigin[0]
+	vy = (arange(ny) - (ny - 1) / 2.0) * geo.dVoxel[1] + geo.offOrigin[1]
+	px = (vx[:, None] + 0 * vy[None, :]).ravel().astype(float32)
+	py = (0 * vx[:, None] + vy[None, :]).ravel().astype(float32)
+	pz = ((arange(nz) - (nz - 1) / 2.0) * geo.dVoxel[2] + geo.offOrigin[2]).astype(float32)
+
+	return px, py, pz, _cone_frame(geo, roll_deg, pitch_deg, yaw_deg)
+
+
+def _subvoxels(geo, oversampling):
+	"""Offsets [mm] of the sub-voxels (oversampling along each axis) and 
+	their weight. The default oversampling makes the magnified sub-voxels not
+	larger than the detector pixels, so that the voxel-driven splatting of the
+	forward projection leaves no gaps.
+
+	"""
+	if oversampling is None:
+		mag = geo.DSD / geo.DSO * max(geo.dVoxel) / min(geo.dDetector)
+		oversampling = int(ceil(mag - 1e-6))
+	n = max(1, int(oversampling))
+
+	o = (arange(n) - (n - 1) / 2.0) / n
+	offsets = [(dx * geo.dVoxel[0], dy * geo.dVoxel[1], dz * geo.dVoxel[2]) \
+		for dx in o for dy in o for dz in o]
+
+	return offsets, 1.0 / len(offsets)
+
+
+def _cone_rays(geo, px, py, z, frame, cos_a, sin_a, matched):
+	"""Bordered (and clipped) detector coordinates and weights of the voxels
+	(px, py, z) for one angle. Weights are the FDK ones or, if matched, the
+	ones of the line integrals (voxel volume spread over the detector pixels
+	crossed by its rays).
+
+	"""
+	eu, ev, en, k_n, c_u, c_v = frame
+	nu, nv = int(geo.nDetector[0]), int(geo.nDetector[1])
+
+	# Voxels in the rotating frame (ray direction from the source):
+	t = px * cos_a + py * sin_a
+	s = -px * sin_a + py * cos_a
+	d_t = t - geo.DSO
+
+	# Intersection with the detector plane (bordered coordinates):
+	lam = k_n / _dot(d_t, s, z, en)
+	x = lam * _dot(d_t, s, z, eu / geo.dDetector[0]) + c_u
+	y = lam * _dot(d_t, s, z, ev / geo.dDetector[1])
+	y += c_v
+	x = x.clip(0, nu + BORDER)
+	y.clip(0, nv + BORDER, out=y)
+
+	if (matched):
+		# Magnification squared times the obliquity of the ray:
+		w = lam * lam
+		w *= abs(lam / k_n) * float(geo.dVoxel[0] * geo.dVoxel[1] * geo.dVoxel[2] / \
+			(geo.dDetector[0] * geo.dDetector[1]))
+		w = w * sqrt(d_t * d_t + s * s + z * z)
+	else:
+		w = (geo.DSO / (geo.DSO - t)) ** 2
+
+	return x, y, w
+
+
+def backproject_cone(proj, geo, angles, roll_deg=0.0, pitch_deg=0.0, yaw_deg=0.0, \
+					 nr_threads=None, matched=False, oversampling=None, fov=False, out=None):
+	"""FDK (i.e. distance weighted) voxel-driven cone-beam backprojection on
+	CPU, vectorised for each projection and multi-threaded across z-slabs.
+
+	Parameters
+	----------
+	proj : array_like
+		Filtered projections as numpy array organized as [rows,cols,angles],
+		or a list of them (channels sharing the geometry, e.g. low and high
+		energy): detector coordinates and weights are then computed once and
+		applied to all the channels in the same pass.
+
+	geo : Geometry
+		Geometry of the acquisition (see kst_tigre_FDK.Geometry): distances,
+		detector and volume sizes, detector offsets.
+
+	angles : array_like [radians]
+		Angle of each projection.
+
+	roll_deg, pitch_deg, yaw_deg : double [degrees]
+		Detector tilt (roll about the beam axis, pitch about the horizontal
+		detector axis and yaw about the vertical detector axis).
+
+	nr_threads : int
+		Number of parallel threads (default: all the cores).
+
+	matched : bool
+		Use the line integral weights instead of the FDK ones, i.e. compute
+		the exact adjoint of project_cone (for the iterative methods).
+
+	oversampling : int
+		Sub-voxels along each axis of the matched backprojection (see 
+		project_cone). Ignored for the FDK weights.
+
+	fov : bool
+		Skip (and zero in the output) the voxels outside the field of view
+		(see fov_radius_cone): only the per-row voxel ranges of the slab
+		cylinder are visited.
+
+	out : array_like
+		C-contiguous float32 volume organized as geo.nVoxel [x,y,z] where the
+		backprojection is accumulated (e.g. projection by projection), or a
+		list of them for a list of channels.
+
+	Return
+	----------
+	rec : array_like
+		Reconstructed volume as numpy array organized as geo.nVoxel [x,y,z]
+		(out, if specified), or the list of the volumes of the channels.
+
+	"""
+	nr_threads = cpu_count() if nr_threads is None else nr_threads
+	nu, nv = int(geo.nDetector[0]), int(geo.nDetector[1])
+	nx, ny, nz = int(geo.nVoxel[0]), int(geo.nVoxel[1]), int(geo.nVoxel[2])
+	px, py, pz, frame = _cone_setup(geo, roll_deg, pitch_deg, yaw_deg)
+	offsets, scale = _subvoxels(geo, oversampling) if matched else ([(0.0, 0.0, 0.0)], 1.0)
+
+	# Projections with a zero border (as a texture with border addressing):
+	width = nu + 2
+	ang = array(angles, dtype=float64)
+	cos_a, sin_a = cos(ang), sin(ang)
+
+	# Channels share the interpolation coordinates (see _coords2):
+	channels = isinstance(proj, (list, tuple))
+	projs = list(proj) if channels else [proj]
+	nc = len(projs)
+
+	if out is None:
+		recs = [empty((nx * ny, nz), dtype=float32) for _ in projs]
+	else:
+		recs = [o.reshape(nx * ny, nz) for o in (out if channels else [out])]
+	slab = max(1, min(nz, SLAB_ELEMENTS // (len(px) * nc)))
+
+	# Field of view of each slice:
+	if (fov):
+		radius = fov_radius_cone(geo, pz)
+		vx = (arange(nx) - (nx - 1) / 2.0) * geo.dVoxel[0] + geo.offOrigin[0]
+		vy = (arange(ny) - (ny - 1) / 2.0) * geo.dVoxel[1] + geo.offOrigin[1]
+
+	def _slab(z0):
+		z = pz[z0:z0 + slab, None]
+		p = zeros((nc, nv + 2, width), dtype=float32)
+		sx, sy = px, py
+
+		# Voxels within the largest radius of the slab:
+		if (fov):
+			vox = _fov_voxels(vx, vy, radius[z0:z0 + slab].max())
+			sx, sy = px[vox], py[vox]
+		acc = zeros((nc, len(z), len(sx)), dtype=float32)
+
+		for i in range(len(ang)):
+			for c in range(nc):
+				p[c, 1:-1, 1:-1] = projs[c][:, :, i]
+			pf = p.reshape(nc, -1)
+
+			# Accumulate with FDK (or matched) weights:
+			for dx, dy, dz in offsets:
+				x, y, w = _cone_rays(geo, sx + float32(dx), sy + float32(dy), z + float32(dz), \
+					frame, cos_a[i], sin_a[i], matched)
+				if (scale != 1.0):
+					w = w * float32(scale)
+				coords = _coords2(width, x, y)
+				for c in range(nc):
+					_gather2(pf[c], width, coords, w, acc[c])
+
+		if (fov):
+			# Exact field of view of each slice:
+			inside = (sx * sx + sy * sy)[newaxis, :] <= (radius[z0:z0 + slab, newaxis] ** 2)
+			acc *= inside
+
+		for c, rec in enumerate(recs):
+			a = acc[c].T
+			if (fov):
+				if out is None:
+					rec[:, z0:z0 + slab] = 0
+					rec[vox, z0:z0 + slab] = a
+				else:
+					rec[vox, z0:z0 + slab] += a
+			elif out is None:
+				rec[:, z0:z0 + slab] = a
+			else:
+				rec[:, z0:z0 + slab] += a
+
+	with ThreadPoolExecutor(max_workers=nr_threads) as executor:
+		list(executor.map(_slab, range(0, nz, slab)))
+
+	recs = [rec.reshape(nx, ny, nz) for rec in recs]
+	return recs if (channels) else recs[0]
+
+
+def cone_rows(geo, angles, z0, z1, roll_deg=0.0, pitch_deg=0.0, yaw_deg=0.0):
+	"""Range of the detector rows read by backproject_cone for the slices
+	z0:z1 of the volume. The rows are found by projecting the corners of the
+	bounding box of the slab (a box projects within the hull of its corners).
+
+	Parameters
+	----------
+	geo : Geometry
+		Geometry of the acquisition (see kst_tigre_FDK.Geometry).
+
+	angles : array_like [radians]
+		Angle of each projection.
+
+	z0, z1 : int
+		First and last (excluded) slice of the slab.
+
+	roll_deg, pitch_deg, yaw_deg : double [degrees]
+		Detector tilt.
+
+	Return
+	----------
+	rows : tuple
+		First and last (excluded) detector row, (0, 0) if the slab is not 
+		seen by the detector.
+
+	"""
+	nx, ny, nz = int(geo.nVoxel[0]), int(geo.nVoxel[1]), int(geo.nVoxel[2])
+	nv = int(geo.nDetector[1])
+	frame = _cone_frame(geo, roll_deg, pitch_deg, yaw_deg)
+
+	# Centers of the corner voxels of the slab:
+	ex = array([-1.0, 1.0]) * (nx - 1) / 2.0 * geo.dVoxel[0] + geo.offOrigin[0]
+	ey = array([-1.0, 1.0]) * (ny - 1) / 2.0 * geo.dVoxel[1] + geo.offOrigin[1]
+	ez = (array([z0, z1 - 1]) - (nz - 1) / 2.0) * geo.dVoxel[2] + geo.offOrigin[2]
+	px = array([ex[0], ex[0], ex[1], ex[1]])
+	py = array([ey[0], ey[1], ey[0], ey[1]])
+
+	ang = array(angles, dtype=float64)
+	y_min, y_max = float('inf'), -float('inf')
+	for a in ang:
+		_, y, _ = _cone_rays(geo, px, py, ez[:, None], frame, cos(a), sin(a), False)
+		y_min, y_max = min(y_min, y.min()), max(y_max, y.max())
+
+	# Rows of the bilinear interpolation (bordered y is row y - 1), plus one
+	# row of margin:
+	r0 = max(0, int(floor(y_min)) - 2)
+	r1 = min(nv, int(floor(y_max)) + 2)
+
+	return (r0, r1) if (r1 > r0) else (0, 0)
+
+
+def project_cone(vol, geo, angles, roll_deg=0.0, pitch_deg=0.0, yaw_deg=0.0, nr_threads=None, \
+				 oversampling=None, out=None):
+	"""Voxel-driven cone-beam forward projection on CPU, vectorised for each
+	z-slab and multi-threaded across projections. Each (sub-)voxel is 
+	splatted onto the four detector pixels it is interpolated from by 
+	backproject_cone, i.e. this is the exact adjoint of 
+	backproject_cone(matched=True) with the same oversampling.
+
+	Parameters
+	----------
+	vol : array_like
+		Volume as numpy array organized as geo.nVoxel [x,y,z].
+
+	geo : Geometry
+		Geometry of the acquisition (see kst_tigre_FDK.Geometry): distances,
+		detector and volume sizes, detector offsets.
+
+	angles : array_like [radians]
+		Angle of each projection.
+
+	roll_deg, pitch_deg, yaw_deg : double [degrees]
+		Detector tilt (roll about the beam axis, pitch about the horizontal
+		detector axis and yaw about the vertical detector axis).
+
+	nr_threads : int
+		Number of parallel threads (default: all the cores).
+
+	oversampling : int
+		Sub-voxels along each axis (default: the magnified sub-voxels are not
+		larger than the detector pixels).
+
+	out : array_like
+		Float32 array (or view) organized as [rows,cols,angles] where the 
+		projections are written. If None, a numpy array is allocated.
+
+	Return
+	----------
+	proj : array_like
+		Projections as numpy array organized as [rows,cols,angles] (out, if
+		specified).
+
+	"""
+	nr_threads = cpu_count() if nr_threads is None else nr_threads
+	nu, nv = int(geo.nDetector[0]), int(geo.nDetector[1])
+	nx, ny, nz = int(geo.nVoxel[0]), int(geo.nVoxel[1]), int(geo.nVoxel[2])
+	px, py, pz, frame = _cone_setup(geo, roll_deg, pitch_deg, yaw_deg)
+	offsets, scale = _subvoxels(geo, oversampling)
+
+	vol = vol.reshape(nx * ny, nz)
+	width = nu + 2
+	ang = array(angles, dtype=float64)
+	cos_a, sin_a = cos(ang), sin(ang)
+
+	proj = empty((nv, nu, len(ang)), dtype=float32) if out is None else out
+	slab = max(1, min(nz, SLAB_ELEMENTS // len(px)))
+
+	def _angle(i):
+		# Each thread owns its (zero bordered) projection:
+		p = zeros((nv + 2) * width, dtype=float64)
+
+		for z0 in range(0, nz, slab):
+			z = pz[z0:z0 + slab, None]
+			v = vol[:, z0:z0 + slab].T * float32(scale)
+
+			for dx, dy, dz in offsets:
+				x, y, w = _cone_rays(geo, px + float32(dx), py + float32(dy), z + float32(dz), \
+					frame, cos_a[i], sin_a[i], True)
+				val = v * w
+				_splat2(p, width, x, broadcast_to(y, val.shape).copy(), val)
+
+		proj[:, :, i] = p.reshape(nv + 2, width)[1:-1, 1:-1]
+
+	with ThreadPoolExecutor(max_workers=nr_threads) as executor:
+		list(executor.map(_angle, range(len(ang))))
+
+	return proj
+
+
+def interleaved_subsets(decimation):
+	"""Offsets of the interleaved subsets of angles (i.e. the projections
+	offset::decimation) in coarse-to-fine order: each further subset fills
+	the largest angular gaps left by the previous ones (bit-reversed order,
+	e.g. 0, 4, 2, 6, 1, 5, 3, 7 for a decimation of 8).
+
+	"""
+	bits = max(1, int(decimation - 1).bit_length())
+	reverse = lambda k: int(format(k, '0' + str(bits) + 'b')[::-1], 2)
+
+	return sorted(range(int(decimation)), key=reverse)
+
+
+def roi_ranges(roi, shape):
+	"""In-plane bounds and runs of consecutive slices of a region of 
+	interest of a volume of the specified [x,y,z] shape.
+
+	Parameters
+	----------
+	roi : tuple
+		(x, y, z) where x and y are (start, stop) voxel indices and z is 
+		either (start, stop) or a list of slice indices. None (for the whole
+		roi or for any of its items) means the full range.
+
+	shape : tuple
+		Shape of the whole volume.
+
+	Return
+	----------
+	ranges : tuple
+		(x0, x1), (y0, y1) and the list of the (z0, z1) runs of slices.
+
+	"""
+	x, y, z = (None, None, None) if roi is None else roi
+	x0, x1 = (0, int(shape[0])) if x is None else (max(0, int(x[0])), min(int(shape[0]), int(x[1])))
+	y0, y1 = (0, int(shape[1])) if y is None else (max(0, int(y[0])), min(int(shape[1]), int(y[1])))
+	if (x1 <= x0) or (y1 <= y0):
+		raise ValueError('Empty region of interest.')
+
+	if z is None:
+		runs = [(0, int(shape[2]))]
+	elif isinstance(z, tuple):
+		runs = [(max(0, int(z[0])), min(int(shape[2]), int(z[1])))]
+	else:
+		runs = []
+		for k in sorted(set(int(k) for k in z if 0 <= int(k) < int(shape[2]))):
+			if runs and (runs[-1][1] == k):
+				runs[-1] = (runs[-1][0], k + 1)
+			else:
+				runs.append((k, k + 1))
+	runs = [(a, b) for a, b in runs if b > a]
+	if not runs:
+		raise ValueError('No slices in the region of interest.')
+
+	return (x0, x1), (y0, y1), runs
+
+
+def _parallel_grid(nu, roi=None):
+	"""Voxel coordinates [pixel] along x and y of a parallel-beam slice of
+	[nu,nu] voxels (or of its ((x0, x1), (y0, y1)) region of interest).
+
+	"""
+	vx = arange(nu) - (nu - 1) / 2.0
+	vy = vx
+	if roi is not None:
+		vx, vy = vx[roi[0][0]:roi[0][1]], vy[roi[1][0]:roi[1][1]]
+
+	return vx, vy
+
+
+def parallel_tables(ang, nu, offset_u, roi=None, voxels=None):
+	"""Bordered detector indices and linear interpolation weights [angles,
+	voxels] of the in-plane voxels of a parallel-beam slice of [nu,nu] voxels
+	(or of its ((x0, x1), (y0, y1)) region of interest, or only of the 
+	specified flattened voxels of it) for the specified block of angles.
+
+	"""
+	vx, vy = _parallel_grid(nu, roi)
+	c, s = cos(ang), sin(ang)
+
+	if voxels is None:
+		x = (-s[:, newaxis, newaxis] * vx[newaxis, :, newaxis] + \
+			c[:, newaxis, newaxis] * vy[newaxis, newaxis, :]).reshape(len(ang), len(vx) * len(vy))
+	else:
+		x = -s[:, newaxis] * vx[voxels // len(vy)][newaxis, :] + \
+			c[:, newaxis] * vy[voxels % len(vy)][newaxis, :]
+	x += (nu + 1) / 2.0 - offset_u
+	x.clip(0, nu + BORDER, out=x)
+	x0 = floor(x)
+
+	return x0.astype(int32), (x - x0).astype(float32)
+
+
+def backproject_parallel_into(proj, angles, rec, offset_u=0.0, nr_threads=None, roi=None, \
+							  fov=False):
+	"""Accumulate into rec (organized as [slices,voxels], i.e. each slice is
+	a flattened [x,y] image) the parallel-beam backprojection of proj. 
+	Interpolation indices and weights are computed once for each block of 
+	angles and shared by all the slices (and by all the channels if proj 
+	and rec are lists), which are processed in parallel z-slabs. See 
+	backproject_parallel for the parameters (with fov the voxels outside 
+	the field of view are left untouched).
+
+	"""
+	nr_threads = cpu_count() if nr_threads is None else nr_threads
+	channels = isinstance(proj, (list, tuple))
+	projs, recs = (list(proj), list(rec)) if channels else ([proj], [rec])
+	nz, nu, nr_angles = projs[0].shape
+	ang = array(angles, dtype=float64)
+
+	# Voxels within the field of view (per-row ranges):
+	voxels = None
+	if (fov):
+		vx, vy = _parallel_grid(nu, roi)
+		voxels = _fov_voxels(vx, vy, fov_radius_parallel(nu, offset_u))
+	nr_vox = recs[0].shape[1] if voxels is None else max(1, len(voxels))
+
+	slab = max(1, min(SLAB_ELEMENTS // nr_vox, -(-nz // nr_threads)))
+	block = max(1, min(nr_angles, TABLE_ELEMENTS // nr_vox))
+
+	def _slab(c, z0, idx, fx, i0):
+		proj, rec = projs[c], recs[c]
+		p = zeros((min(slab, nz - z0), nu + 2), dtype=float32)
+		if voxels is None:
+			acc = rec[z0:z0 + slab]
+		else:
+			acc = zeros((p.shape[0], len(voxels)), dtype=float32)
+
+		for j in range(idx.shape[0]):
+			p[:, 1:-1] = proj[z0:z0 + slab, :, i0 + j]
+			val = p.take(idx[j], axis=1)
+			tmp = p[:, 1:].take(idx[j], axis=1)
+			tmp -= val
+			tmp *= fx[j]
+			val += tmp
+			acc += val
+
+		if voxels is not None:
+			rec[z0:z0 + slab, voxels] += acc
+
+	with ThreadPoolExecutor(max_workers=nr_threads) as executor:
+
+		for i0 in range(0, nr_angles, block):
+			idx, fx = parallel_tables(ang[i0:i0 + block], nu, offset_u, roi, voxels)
+			list(executor.map(lambda cz: _slab(cz[0], cz[1], idx, fx, i0), \
+				[(c, z0) for c in range(len(projs)) for z0 in range(0, nz, slab)]))
+
+	return rec
+
+
+def project_parallel_into(vol, angles, proj, offset_u=0.0, nr_threads=None):
+	"""Write into proj [rows,cols,angles] the parallel-beam projections of vol
+	(organized as [slices,voxels]). This is the exact adjoint (transpose) of
+	backproject_parallel_into: each voxel is split between the two detector
+	columns it is interpolated from. See project_parallel for the parameters.
+
+	"""
+	nr_threads = cpu_count() if nr_threads is None else nr_threads
+	nz, nu, nr_angles = proj.shape
+	nr_vox = nu * nu
+	ang = array(angles, dtype=float64)
+
+	slab = max(1, min(SLAB_ELEMENTS // nr_vox, -(-nz // nr_threads)))
+	block = max(1, min(nr_angles, TABLE_ELEMENTS // nr_vox))
+
+	def _slab(z0, tables, i0):
+		p = empty((min(slab, nz - z0), nu + 2), dtype=float32)
+
+		for j, (order, fx, bins, starts) in enumerate(tables):
+
+			# Voxels sorted by detector column and summed for each column:
+			val = vol[z0:z0 + slab].take(order, axis=1)
+			tmp = val * fx
+			val -= tmp
+			p[:] = 0
+			p[:, bins] = add.reduceat(val, starts, axis=1)
+			p[:, bins + 1] += add.reduceat(tmp, starts, axis=1)
+
+			proj[z0:z0 + slab, :, i0 + j] = p[:, 1:-1]
+
+	with ThreadPoolExecutor(max_workers=nr_threads) as executor:
+
+		for i0 in range(0, nr_angles, block):
+			idx, fx = parallel_tables(ang[i0:i0 + block], nu, offset_u)
+
+			# Voxels of each angle grouped by detector column:
+			tables = []
+			for j in range(idx.shape[0]):
+				order = argsort(idx[j], kind='stable')
+				bins, starts = unique(idx[j][order], return_index=True)
+				tables.append((order, fx[j][order], bins, starts))
+
+			list(executor.map(lambda z0: _slab(z0, tables, i0), range(0, nz, slab)))
+
+	return proj
+
+
+def backproject_parallel(proj, angles, offset_u=0.0, nr_threads=None, roi=None, fov=False):
+	"""Voxel-driven parallel-beam backprojection on CPU, multi-threaded across
+	slices (see backproject_parallel_into).
+
+	Parameters
+	----------
+	proj : array_like
+		Filtered projections as numpy array organized as [rows,cols,angles],
+		or a list of them (channels sharing the geometry, reconstructed with
+		the same interpolation tables).
+
+	angles : array_like [radians]
+		Angle of each projection.
+
+	offset_u : double [pixel]
+		Horizontal detector offset (i.e. position of the rotation axis with 
+		respect to the central column).
+
+	nr_threads : int
+		Number of parallel threads (default: all the cores).
+
+	roi : tuple
+		In-plane region of interest ((x0, x1), (y0, y1)): only its voxels are
+		visited (default: the whole slice).
+
+	fov : bool
+		Skip (i.e. zero in the output) the voxels outside the field of view
+		(see fov_radius_parallel): only the per-row voxel ranges of the
+		cylinder are visited.
+
+	Return
+	----------
+	rec : array_like
+		Reconstructed volume as numpy array organized as [x,y,z] with shape
+		[cols,cols,rows] (voxel size equal to the pixel size), or the shape of
+		the region of interest. A list of volumes for a list of channels.
+
+	"""
+	channels = isinstance(proj, (list, tuple))
+	projs = list(proj) if channels else [proj]
+	nz, nu = projs[0].shape[0], projs[0].shape[1]
+	nx, ny = (nu, nu) if roi is None else (roi[0][1] - roi[0][0], roi[1][1] - roi[1][0])
+
+	# Output used as accumulator [slices,voxels] (each thread owns its slab):
+	recs = [zeros((nz, nx * ny), dtype=float32) for _ in projs]
+	backproject_parallel_into(projs, angles, recs, offset_u, nr_threads, roi, fov)
+
+	recs = [rec.T.reshape(nx, ny, nz) for rec in recs]
+	return recs if (channels) else recs[0]
+
+
+def project_parallel(vol, angles, offset_u=0.0, nr_threads=None):
+	"""Parallel-beam forward projection on CPU, multi-threaded across slices
+	(see project_parallel_into).
+
+	Parameters
+	----------
+	vol : array_like
+		Volume as numpy array organized as [x,y,z] with shape [cols,cols,rows].
+
+	angles : array_like [radians]
+		Angle of each projection.
+
+	offset_u : double [pixel]
+		Horizontal detector offset (i.e. position of the rotation axis with 
+		respect to the central column).
+
+	nr_threads : int
+		Number of parallel threads (default: all the cores).
+
+	Return
+	----------
+	proj : array_like
+		Projections as numpy array organized as [rows,cols,angles].
+
+	"""
+	nu, nz = vol.shape[0], vol.shape[2]
+
+	proj = empty((nz, nu, len(angles)), dtype=float32)
+	vol = vol.reshape(nu * nu, nz).T.astype(float32, order='C')
+	project_parallel_into(vol, angles, proj, offset_u, nr_threads)
+
+	return proj
@@ -0,0 +1,125 @@
+from numpy import float32, complex64, ceil, log2
+from multiprocessing import cpu_count
+from collections import OrderedDict
+from threading import Lock, get_ident
+
+from pyfftw import FFTW, empty_aligned
+
+# Cached FFTW plans (each one with its own aligned buffers), least recently 
+# used first:
+_plans = OrderedDict()
+_plans_lock = Lock()
+
+# Bounds of the plan cache (number of entries and memory of their buffers):
+FFT_PLANS = 8
+FFT_PLANS_MEMORY = 512 * 1024 ** 2
+
+
+def default_threads():
+	"""Number of threads used by default by the FFT-based stages (i.e. the
+	number of cores of the machine).
+
+	"""
+	return cpu_count()
+
+
+def padded_size(n):
+	"""Power of two leaving a margin of at least n/8 on each side.
+
+	"""
+	return int(2 ** ceil(log2(n * 1.25)))
+
+
+def edge_pad_into(buf, im, r0, c0):
+	"""Copy the batch of images im [batch,rows,cols] into the (larger) buffer
+	buf at offset (r0,c0) replicating the edges over the remaining part.
+
+	"""
+	rows, cols = im.shape[1], im.shape[2]
+
+	buf[:, r0:r0 + rows, c0:c0 + cols] = im
+	buf[:, :r0, c0:c0 + cols] = im[:, :1, :]
+	buf[:, r0 + rows:, c0:c0 + cols] = im[:, -1:, :]
+	buf[:, :, :c0] = buf[:, :, c0:c0 + 1]
+	buf[:, :, c0 + cols:] = buf[:, :, c0 + cols - 1:c0 + cols]
+
+
+def rfft_plans(shape, axes, threads=None, direction='both'):
+	"""Get (or create and cache) a pair of single precision real FFTW plans
+	working on aligned buffers of the specified shape. Plans are owned by the
+	calling thread (each thread gets its own buffers, but a shape is measured
+	only once) and the least recently used ones are dropped beyond FFT_PLANS 
+	entries or FFT_PLANS_MEMORY bytes.
+
+	Parameters
+	----------
+	shape : tuple
+		Shape of the real buffer (e.g. [batch, rows, cols]).
+
+	axes : tuple
+		Axes along which the transform is computed. The last one is the
+		halved one in the complex buffer.
+
+	threads : int
+		Number of threads of the plans (default: all the cores).
+
+	direction : string
+		'both', 'forward' (the inverse plan is None) or 'inverse' (the forward
+		plan is None).
+
+	Return
+	----------
+	fwd, inv : FFTW
+		Forward and inverse plans. The real data are in fwd.input_array (that
+		is also inv.output_array) and the spectrum is in fwd.output_array.
+		Calling fwd() and then inv() leaves the (normalized) result in place.
+		NOTE: buffers are reused by the following calls with the same 
+		arguments from the same thread.
+
+	"""
+	if direction not in ('both', 'forward', 'inverse'):
+		raise ValueError('FFT direction not recognised: ' + str(direction))
+
+	threads = default_threads() if threads is None else threads
+	key = (tuple(shape), tuple(axes), threads, direction, get_ident())
+
+	with _plans_lock:
+		if key in _plans:
+			_plans.move_to_end(key)
+			return _plans[key][0]
+
+	# Aligned buffers:
+	cshape = list(shape)
+	cshape[axes[-1]] = shape[axes[-1]] // 2 + 1
+	re = empty_aligned(tuple(shape), dtype=float32)
+	im = empty_aligned(tuple(cshape), dtype=complex64)
+
+	# Plans:
+	fwd, inv = None, None
+	if (direction != 'inverse'):
+		fwd = _plan(re, im, axes, 'FFTW_FORWARD', threads)
+	if (direction != 'forward'):
+		inv = _plan(im, re, axes, 'FFTW_BACKWARD', threads)
+
+	with _plans_lock:
+		_plans[key] = ((fwd, inv), re.nbytes + im.nbytes)
+
+		# Drop the least recently used plans (not the new ones):
+		while (len(_plans) > 1) and ((len(_plans) > FFT_PLANS) or \
+				(sum(nbytes for _, nbytes in _plans.values()) > FFT_PLANS_MEMORY)):
+			_plans.popitem(last=False)
+
+	return fwd, inv
+
+
+def _plan(a, b, axes, direction, threads):
+	"""FFTW plan from a to b. Measuring is paid only once for each shape in 
+	the process: the plans of the other threads (or the ones dropped from the
+	cache and created again) come from the accumulated FFTW wisdom.
+	"""
+	try:
+		return FFTW(a, b, axes=axes, direction=direction, \
+			flags=('FFTW_MEASURE', 'FFTW_WISDOM_ONLY'), threads=threads)
+	except RuntimeError:
+		return FFTW(a, b, axes=axes, direction=direction, \
+			flags=('FFTW_MEASURE',), threads=threads)
@@ -4,11 +4,18 @@
 #
 from numpy import int_, float32, finfo, gradient, sqrt, ndarray, real, dot, sort
 from numpy import std, zeros, cov, diag, mean, sum, ComplexWarning, amin, amax
-from numpy import concatenate, tile, median, repeat, newaxis
+from numpy import concatenate, tile, median, repeat, newaxis, ascontiguousarray
+from numpy import einsum, eye, maximum
+from numpy.linalg import qr, svd, solve
+from numpy.random import RandomState
+from hashlib import sha1
 
 from scipy.signal import medfilt
 from scipy.ndimage import zoom
 
+# Cached eigen-flats (one entry for each flat acquisition):
+_eigen_flats = {}
+
 
 def flat_fielding(im, ff, win_size=5):
 	""" Apply basic flat fielding to the whole input projection dataset.
@@ -49,4 +56,149 @@ def flat_fielding(im, ff, win_size=5):
 
 
 
+def _downsample(im, factor):
+	"""Downsample the first two dimensions of a [x,y,...] dataset by averaging
+	(non overlapping) factor x factor blocks.
+
+	"""
+	rows = (im.shape[0] // factor) * factor
+	cols = (im.shape[1] // factor) * factor
+	im = im[:rows, :cols]
+
+	return im.reshape((rows // factor, factor, cols // factor, factor) + \
+		im.shape[2:]).mean(axis=(1, 3))
+
+
+
+def _randomized_svd(a, rank, oversampling=10, power_iter=2):
+	"""Compute the first rank left singular vectors of a (and the related 
+	singular values) with a randomized low-rank SVD.
+
+	"""
+	k = min(rank + oversampling, a.shape[1])
+	
+	# Range finder (with some power iterations for a better accuracy):
+	y = a.dot(RandomState(0).standard_normal((a.shape[1], k)).astype(a.dtype))
+	for i in range(power_iter):
+		q, _ = qr(y)
+		y = a.dot(a.T.dot(q))
+	q, _ = qr(y)
+
+	# SVD of the small projected matrix:
+	u, s, _ = svd(q.T.dot(a), full_matrices=False)
+
+	return q.dot(u[:, :rank]), s[:rank]
+
+
+
+def eigen_flats(ff, nr_components=5, downsample=4):
+	"""Get (or compute and cache) the mean flat and the principal-component 
+	flats (eigen-flats) of a flat field acquisition.
+
+	Parameters
+	----------
+	ff : array_like
+		Flat field images organized as [x,y,flats].
+
+	nr_components : int
+		Number of eigen-flats.
+
+	downsample : int
+		Downsampling factor of the images used to fit the weights.
+
+	Return value
+	------------
+	mean_ff, eig_ff, mean_ds, eig_ds : array_like
+		Mean flat and eigen-flats (flattened as [pixels,components]) at full
+		resolution and downsampled.
+
+	"""
+	ff = ascontiguousarray(ff)
+	key = (sha1(ff.data).hexdigest(), ff.shape, str(ff.dtype), nr_components, downsample)
+
+	if key not in _eigen_flats:
+
+		# Centered flats as a [pixels,flats] matrix:
+		a = ff.reshape(ff.shape[0] * ff.shape[1], -1).astype(float32)
+		mean_ff = a.mean(axis=1)
+		a -= mean_ff[:, newaxis]
+
+		# Principal components (scaled by their standard deviation):
+		nr_components = min(nr_components, a.shape[1] - 1)
+		u, s = _randomized_svd(a, nr_components)
+		eig_ff = (u * (s / sqrt(a.shape[1]))).astype(float32)
+
+		# Downsampled versions to fit the weights:
+		shp = (ff.shape[0], ff.shape[1], -1)
+		mean_ds = _downsample(mean_ff.reshape(shp), downsample)
+		eig_ds = _downsample(eig_ff.reshape(shp), downsample)
+		mean_ds = mean_ds.reshape(-1)
+		eig_ds = eig_ds.reshape(mean_ds.shape[0], -1)
 
+		_eigen_flats[key] = (mean_ff, eig_ff, mean_ds, eig_ds)
+
+	return _eigen_flats[key]
+
+
+
+def dynamic_flat_fielding(im, ff, nr_components=5, downsample=4, air_thresh=0.9, \
+						  block_size=32):
+	""" Apply dynamic flat fielding to the whole input projection dataset, i.e.
+	each projection is divided by its own flat modeled as the mean flat plus a
+	weighted sum of the eigen-flats of the flat field acquisition.
+	
+	Parameters
+	----------
+	im : array_like
+		The (dark-corrected) projection images to process.
+		
+	ff : array_like
+		Flat field images (eigen-flats are cached for each acquisition).
+
+	nr_components : int
+		Number of eigen-flats.
+
+	downsample : int
+		Downsampling factor of the images used to fit the weights.
+
+	air_thresh : float
+		The weights are fitted (least squares) only on the pixels of each
+		downsampled projection having a transmission (w.r.t. the mean flat) 
+		greater than this threshold (i.e. where there is no sample).
+
+	block_size : int
+		Number of projections corrected together.
+
+	Return value
+	------------
+	im : array_like
+		Flat-corrected projections.
+
+	"""
+	mean_ff, eig_ff, mean_ds, eig_ds = eigen_flats(ff, nr_components, downsample)
+
+	# Cast the input image (always a copy, as the division is in place) and
+	# get a [pixels,angles] view:
+	im = im.astype(float32, order='C')
+	proj = im.reshape(im.shape[0] * im.shape[1], -1)
+
+	# Fit the weights on the downsampled projections:
+	proj_ds = _downsample(im, downsample).reshape(mean_ds.shape[0], -1)
+	mask = (proj_ds / (mean_ds[:, newaxis] + finfo(float32).eps)) > air_thresh
+	mask[:, mask.sum(axis=0) < 4 * eig_ds.shape[1]] = True
+	mask = mask.astype(float32)
+
+	# Masked normal equations (all the projections at once):
+	lhs = einsum('pk,pj,pl->jkl', eig_ds, mask, eig_ds)
+	rhs = einsum('pk,pj->jk', eig_ds, mask * (proj_ds - mean_ds[:, newaxis]))
+	w = solve(lhs + 1e-6 * eye(eig_ds.shape[1]), rhs[..., newaxis])[..., 0]
+	w = w.T.astype(float32)
+
+	# Point-to-point division by the modeled flats (block of projections):
+	for i in range(0, proj.shape[1], block_size):
+		flat = eig_ff.dot(w[:, i:i + block_size])
+		flat += mean_ff[:, newaxis]
+		proj[:, i:i + block_size] /= maximum(flat, finfo(float32).eps)
+
+	# Return pre-processed image:
+	return im
@@ -0,0 +1,271 @@
+from numpy import float32, float64, complex64, int32, int64, arange, empty, conj
+from numpy import cos, sin, pi, floor, sqrt, ceil, log2, exp, sinh, where, newaxis
+from numpy import concatenate, array
+from scipy.special import i0
+from scipy.sparse import coo_matrix
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from multiprocessing import cpu_count
+import hashlib
+
+from . import kst_backprojection
+from . import kst_fft
+from . import kst_tigre_FDK
+
+# Width (in grid points) of the Kaiser-Bessel gridding kernel and oversampling
+# of the Cartesian frequency grid:
+KERNEL_WIDTH = 4
+OVERSAMPLING = 2
+
+# Maximum number of elements of the FFT buffers of each batch of slices:
+BATCH_ELEMENTS = 2 ** 24
+
+# Number of angles whose samples are gridded together while building the
+# operator (bounds the temporaries):
+ANGLES_CHUNK = 64
+
+# Cached gridding operators (one for each detector width and set of angles),
+# least recently used first, and their largest number (each one can take 
+# about 1 GB for a 2k detector):
+_operators = OrderedDict()
+GRIDDING_OPERATORS = 2
+
+
+def _kb_beta():
+	"""Shape parameter of the Kaiser-Bessel kernel for the current width and
+	oversampling (Beatty et al., 2005).
+
+	"""
+	return pi * sqrt((KERNEL_WIDTH / OVERSAMPLING) ** 2 * (OVERSAMPLING - 0.5) ** 2 - 0.8)
+
+
+def _kb_kernel(d, beta):
+	"""Kaiser-Bessel kernel at the distances d (in grid points).
+
+	"""
+	arg = 1.0 - (2.0 * d / KERNEL_WIDTH) ** 2
+	return where(arg > 0, i0(beta * sqrt(arg.clip(0))), 0.0)
+
+
+def _kb_deapodization(n, grid_size, beta):
+	"""Fourier transform of the Kaiser-Bessel kernel at the image positions n
+	(in pixels) of a grid of the specified size.
+
+	"""
+	z = sqrt(beta ** 2 - (pi * KERNEL_WIDTH * n / grid_size) ** 2 + 0j)
+	return (KERNEL_WIDTH * sinh(z) / z).real
+
+
+def gridding_operator(nr_cols, angles):
+	"""Get (or compute and cache) the gridding operator for the specified
+	detector width and angles.
+
+	Parameters
+	----------
+	nr_cols : int
+		Number of detector columns.
+
+	angles : array_like [radians]
+		Angle of each projection.
+
+	Return
+	----------
+	op : tuple
+		Size of the (square) Cartesian grid, sparse matrix (float32 CSR) that
+		grids the polar samples (positive frequencies followed by negative
+		ones) onto the half grid of a real inverse FFT, and read-only
+		deapodization correction of the [cols,cols] output.
+
+	"""
+	angles = array(angles, dtype=float64)
+	grid_size = int(2 ** ceil(log2(OVERSAMPLING * nr_cols)))
+	key = (nr_cols, hashlib.sha1(angles.tobytes()).hexdigest())
+
+	if key in _operators:
+		_operators.move_to_end(key)
+	else:
+		beta = _kb_beta()
+		half = grid_size // 2 + 1
+		nr_freq = half
+		nr_samples = len(angles) * nr_freq
+		offsets = arange(KERNEL_WIDTH)
+
+		rows, cols, vals = [], [], []
+
+		for a0 in range(0, len(angles), ANGLES_CHUNK):
+			ang = angles[a0:a0 + ANGLES_CHUNK]
+
+			# Polar samples (in grid points) of the chunk:
+			j = arange(nr_freq)
+			kx = (-sin(ang)[:, newaxis] * j[newaxis, :]).ravel()
+			ky = (cos(ang)[:, newaxis] * j[newaxis, :]).ravel()
+			idx = (a0 * nr_freq + arange(len(kx))).astype(int64)
+
+			for sign, first in ((1, 0), (-1, nr_samples)):
+
+				# Neighbouring grid points and separable kernel weights:
+				gx = floor(sign * kx - KERNEL_WIDTH / 2.0)[:, newaxis] + 1 + offsets
+				gy = floor(sign * ky - KERNEL_WIDTH / 2.0)[:, newaxis] + 1 + offsets
+				wx = _kb_kernel(gx - sign * kx[:, newaxis], beta)
+				wy = _kb_kernel(gy - sign * ky[:, newaxis], beta)
+				gx = gx.astype(int64) % grid_size
+				gy = gy.astype(int64) % grid_size
+
+				# Only the half grid of the real inverse FFT is needed:
+				r = gx[:, :, newaxis] * half + gy[:, newaxis, :]
+				w = wx[:, :, newaxis] * wy[:, newaxis, :]
+				mask = (gy[:, newaxis, :] < half) & (w > 0)
+				c = (first + idx)[:, newaxis, newaxis] + 0 * r
+
+				rows.append(r[mask].astype(int32))
+				cols.append(c[mask].astype(int32))
+				vals.append(w[mask].astype(float32))
+
+		# Duplicates (i.e. the same grid point) are summed by the conversion:
+		matrix = coo_matrix((concatenate(vals), (concatenate(rows), concatenate(cols))), \
+			shape=(grid_size * half, 2 * nr_samples)).tocsr()
+		matrix.indices = matrix.indices.astype(int32)
+		matrix.indptr = matrix.indptr.astype(int32)
+
+		# Deapodization of the output (centered on the grid origin):
+		n = arange(nr_cols) - nr_cols // 2
+		c = _kb_deapodization(n, grid_size, beta)
+		deapod = (1.0 / (c[:, newaxis] * c[newaxis, :])).astype(float32)
+		deapod.flags.writeable = False
+
+		_operators[key] = (grid_size, matrix, deapod)
+		while len(_operators) > GRIDDING_OPERATORS:
+			_operators.popitem(last=False)
+
+	return _operators[key]
+
+
+def _grid(matrix, x, nr_threads):
+	"""Sparse product matrix @ x computed by row blocks on parallel threads.
+
+	"""
+	out = empty((matrix.shape[0], x.shape[1]), dtype=float32)
+	step = -(-matrix.shape[0] // nr_threads)
+
+	def _block(r0):
+		out[r0:r0 + step] = matrix[r0:r0 + step].dot(x)
+
+	with ThreadPoolExecutor(max_workers=nr_threads) as executor:
+		list(executor.map(_block, range(0, matrix.shape[0], step)))
+
+	return out
+
+
+def gridding_parallel(proj, angles, offset_u=0.0, filter='ram-lak', nr_threads=None, fov=False, \
+					  padding=0):
+	"""Parallel-beam reconstruction by Fourier gridding: the (filtered and
+	density compensated) 1D spectra of the projections are interpolated onto
+	a Cartesian grid (Kaiser-Bessel kernel) and a 2D inverse FFT returns the
+	slice. Slices are processed in batches.
+
+	Parameters
+	----------
+	proj : array_like
+		Projections as numpy array organized as [rows,cols,angles].
+
+	angles : array_like [radians]
+		Angle of each projection.
+
+	offset_u : double [pixel]
+		Horizontal detector offset (i.e. center of rotation offset).
+
+	filter : string
+		The available options are "ram-lak", "shepp-logan", "cosine",
+		"hamming", "hann".
+
+	nr_threads : int
+		Number of parallel threads (default: all the cores).
+
+	fov : bool
+		Zero the voxels outside the field of view (the whole grid is
+		computed anyway by the inverse FFT).
+
+	padding : int
+		Number of columns virtually added on each side by replicating the
+		edge ones (overpadding of truncated data) within the zero-padded 
+		(circular) FFT buffer, at most half of the zero padding.
+
+	Return
+	----------
+	rec : array_like
+		Reconstructed volume as numpy array organized as [x,y,z] with shape
+		[cols,cols,rows] (voxel size equal to the pixel size).
+
+	"""
+	nr_threads = cpu_count() if nr_threads is None else nr_threads
+	nz, nu, nr_angles = proj.shape
+	ang = array(angles, dtype=float64)
+
+	grid_size, matrix, deapod = gridding_operator(nu, ang)
+	half = grid_size // 2 + 1
+	padding = min(int(padding), (grid_size - nu) // 2)
+	nr_samples = nr_angles * half
+
+	# Density compensation and filter (with the scaling of the FBP and of the
+	# normalized inverse FFT), then phase shifts moving the rotation axis to
+	# the origin and the center of the volume to the grid origin:
+	filt = kst_tigre_FDK.filter_kernel(grid_size, filter, 1.0) * (pi / nr_angles) / grid_size * \
+		grid_size ** 2
+	freq = arange(half) / grid_size
+	shift = (nu - 1) / 2.0 - nu // 2
+	center = (nu - 1) / 2.0 - offset_u
+	weights = (filt[newaxis, :] * exp(2j * pi * freq[newaxis, :] * (center - shift * \
+		(cos(ang) - sin(ang))[:, newaxis]))).astype(complex64)
+
+	# The DC and Nyquist bins are shared by positive and negative samples:
+	weights[:, 0] *= 0.5
+	weights[:, -1] *= 0.5
+
+	# Cached plans: 1D transforms of the projections [angles,padded cols,slices]
+	# and 2D inverse transforms of the grid [x,y,slices]:
+	batch_size = max(1, min(nz, BATCH_ELEMENTS // max(nr_angles * grid_size, grid_size ** 2)))
+	fwd, _ = kst_fft.rfft_plans((nr_angles, grid_size, batch_size), (1,), nr_threads, 'forward')
+	_, inv = kst_fft.rfft_plans((grid_size, grid_size, batch_size), (0, 1), nr_threads, 'inverse')
+	buf = fwd.input_array
+	spectrum = fwd.output_array
+	grid = inv.input_array
+	image = inv.output_array
+
+	# Stacked positive and negative (conjugate) samples, as real pairs:
+	samples = empty((2 * nr_samples, 2 * batch_size), dtype=float32)
+	csamples = samples.view(complex64)
+
+	# Output cropping (the center of the volume is at the grid origin):
+	crop = (arange(nu) - nu // 2) % grid_size
+	rec = empty((nu, nu, nz), dtype=float32)
+
+	for z0 in range(0, nz, batch_size):
+		n = min(batch_size, nz - z0)
+
+		# Zero-padded projections and their spectra (the tail of a partial
+		# batch is just ignored):
+		buf[:, :nu, :n] = proj[z0:z0 + n].transpose(2, 1, 0)
+		buf[:, nu:, :] = 0
+
+		# Edge extension (the left one wraps around to the end of the buffer):
+		if (padding > 0):
+			buf[:, nu:nu + padding, :n] = buf[:, nu - 1:nu, :n]
+			buf[:, grid_size - padding:, :n] = buf[:, 0:1, :n]
+		fwd()
+		spectrum *= weights[:, :, newaxis]
+
+		csamples[:nr_samples] = spectrum.reshape(nr_samples, batch_size)
+		csamples[nr_samples:] = conj(csamples[:nr_samples])
+
+		# Gridding and inverse FFT:
+		grid.reshape(-1, batch_size)[:] = _grid(matrix, samples, nr_threads).view(complex64)
+		inv()
+
+		# Crop and deapodization:
+		rec[:, :, z0:z0 + n] = image[crop][:, crop, :n] * deapod[:, :, newaxis]
+
+	if (fov):
+		v = arange(nu) - (nu - 1) / 2.0
+		kst_backprojection.fov_mask(rec, kst_backprojection.fov_radius_parallel(nu, offset_u), v, v)
+
+	return rec
@@ -1,6 +1,9 @@
 from numpy import arange, tile, fromfile, delete, reshape, zeros, transpose
 from numpy import nanmedian, nanmean, nansum
 from glob import glob
+from os.path import getsize, basename, splitext
+from re import findall
+from time import sleep, time
 from tifffile import imread
 
 PIXIRAD_WIDTH = 512 # pixels
@@ -203,4 +206,73 @@ def read_tiff_sequence (path):
 		im = imread(tomo_files[i])
 		data[:,:,i] = im
 
-	return data
\ No newline at end of file
+	return data
+
+
+def watch_tiff_sequence (path, nr_files, poll=1.0, timeout=None, first=0):
+	"""Read a sequence of TIFF files while it is being written (e.g. during
+	the acquisition), yielding each image as soon as its file is complete.
+	Files may be completed in any order.
+
+	Parameters
+	----------
+	path : string
+		Path (with wildcards) of the TIFF files. The index of each file is
+		the last number in its name (e.g. 12 for "proj_0012.tif") minus
+		first, i.e. it does not depend on the files already written.
+
+	nr_files : int
+		Number of files of the complete sequence (files with an index out
+		of [0, nr_files) are ignored).
+
+	poll : double [s]
+		Interval between two checks of the folder. A file is considered
+		complete when its size does not change between two checks.
+
+	timeout : double [s]
+		Stop if no new file is complete within this time (default: wait
+		forever).
+
+	first : int
+		Number in the name of the first file of the sequence.
+
+	Return
+	----------
+	(index, im) : generator
+		Index of the file in the sequence and image data.
+
+	"""
+	done = set()
+	sizes = {}
+	last = time()
+
+	while len(done) < nr_files:
+		found = False
+
+		for f in glob(path):
+			i = _file_index(f) - first
+			if (i in done) or (i < 0) or (i >= nr_files):
+				continue
+			size = getsize(f)
+			if (size > 0) and (sizes.get(f) == size):
+				done.add(i)
+				found = True
+				yield i, imread(f)
+			sizes[f] = size
+
+		if found:
+			last = time()
+		elif (timeout is not None) and (time() - last > timeout):
+			return
+		else:
+			sleep(poll)
+
+
+def _file_index(f):
+	"""Last number in the name (without extension) of the file f.
+	"""
+	numbers = findall(r'\d+', splitext(basename(f))[0])
+	if not numbers:
+		raise ValueError('no index in the file name: ' + f)
+
+	return int(numbers[-1])
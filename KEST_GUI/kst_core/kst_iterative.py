@@ -0,0 +1,127 @@
+from numpy import float32, zeros, ones, empty, sqrt, vdot, maximum, finfo
+
+# Sums of the system matrix below this value are treated as zero (i.e. rays
+# not crossing the volume and voxels not seen by any ray):
+EPS = 1e-6
+
+# Default relative change of the residual norm below which SIRT stops:
+SIRT_TOLERANCE = 1e-4
+
+
+def _inverse(a):
+	"""Invert in place the array a, setting to zero the negligible values.
+
+	"""
+	mask = a > EPS
+	a[~mask] = 0
+	a[mask] = 1.0 / a[mask]
+
+	return a
+
+
+def sirt(proj, forward, back, shape, iterations=100, subsets=1, tolerance=SIRT_TOLERANCE, \
+		 relaxation=1.0, nonnegativity=True, callback=None):
+	"""Ordered-subsets SIRT (i.e. SART for one projection per subset) on top
+	of a forward/back projector pair.
+
+	Parameters
+	----------
+	proj : array_like
+		Projections as numpy array organized as [rows,cols,angles].
+
+	forward : callable
+		forward(vol, angles, out) writes into out (a [rows,cols,angles] view)
+		the projections of vol for the specified slice of angles.
+
+	back : callable
+		back(proj, angles, out) accumulates into out (a volume) the
+		backprojection of proj (a [rows,cols,angles] view) for the specified
+		slice of angles. It must be the adjoint of forward.
+
+	shape : tuple
+		Shape of the volume (in the layout used by the projector pair).
+
+	iterations : int
+		Maximum number of iterations (i.e. of sweeps over all the subsets).
+
+	subsets : int
+		Number of ordered subsets (each one with interleaved angles).
+
+	tolerance : double
+		The solver stops when the relative residual norm ||b - Ax|| / ||b||
+		changes between two iterations less than this fraction of its value
+		(0 to always run all the iterations).
+
+	relaxation : double
+		Relaxation factor of the updates.
+
+	nonnegativity : bool
+		Clip negative values after each update.
+
+	callback : callable
+		callback(iteration, vol, residual) called after each iteration with
+		the current volume and relative residual norm. If it returns True the
+		solver stops.
+
+	Return
+	----------
+	vol : array_like
+		Reconstructed volume (in the layout used by the projector pair).
+
+	"""
+	nr_angles = proj.shape[2]
+	subsets = max(1, min(subsets, nr_angles))
+	groups = [slice(s, None, subsets) for s in range(subsets)]
+
+	# Preallocated volumes and (largest subset) projections:
+	vol = zeros(shape, dtype=float32)
+	upd = empty(shape, dtype=float32)
+	res = empty(proj.shape[:2] + (len(range(nr_angles)[groups[0]]),), dtype=float32)
+
+	# Inverse ray sums (whole dataset) and inverse voxel sums (full angular
+	# range; each subset of interleaved angles gets its share):
+	row_w = empty(proj.shape, dtype=float32)
+	forward(ones(shape, dtype=float32), slice(None), row_w)
+	_inverse(row_w)
+
+	col_w = zeros(shape, dtype=float32)
+	back(ones(proj.shape, dtype=float32), slice(None), col_w)
+	_inverse(col_w)
+	col_w *= float32(subsets)
+
+	norm = sqrt(vdot(proj.ravel(), proj.ravel()).real) + finfo(float32).eps
+	prev = None
+
+	for it in range(iterations):
+		err = 0.0
+
+		for g in groups:
+			r = res[:, :, :len(range(nr_angles)[g])]
+
+			# Weighted residual of the subset:
+			forward(vol, g, r)
+			r -= proj[:, :, g]
+			r *= -1
+			err += float(vdot(r.ravel(), r.ravel()).real)
+			r *= row_w[:, :, g]
+
+			# Weighted (and relaxed) update:
+			upd[:] = 0
+			back(r, g, upd)
+			upd *= col_w
+			if (relaxation != 1.0):
+				upd *= float32(relaxation)
+			vol += upd
+
+			if (nonnegativity):
+				maximum(vol, 0, out=vol)
+
+		# Convergence:
+		curr = sqrt(err) / norm
+		if (callback is not None) and callback(it + 1, vol, curr):
+			break
+		if (prev is not None) and (abs(prev - curr) < tolerance * prev):
+			break
+		prev = curr
+
+	return vol
@@ -1,9 +1,14 @@
 ﻿from numpy import float32, pad, arange, repeat, reshape
 from numpy import sort, nanmean, nansum, squeeze, rint
+from numpy import floor, sqrt, clip, concatenate, ones, int32, ascontiguousarray, tile
 from scipy.interpolate import interp2d
+from scipy.sparse import csr_matrix
 
 import tifffile
 
+# Sparse hexagonal-to-square operators (one for each crop and rebinning):
+_hex_operators = {}
+
 def rebinning2x2(im):
 	"""Perform 2x2 rebinning (i.e. sum of the gray levels of the 2x2 
 	neighborhood).
@@ -35,6 +40,121 @@ def rebinning2x2(im):
 
 
 
+def _rebinning2x2_operator(rows, cols):
+	"""Sparse matrix equivalent to rebinning2x2 applied to a (rows x cols) 
+	image flattened in C order.
+
+	"""
+	# Same output size (and edge replication) of rebinning2x2:
+	out_r = len(range(0, rows - 1, 2))
+	out_c = len(range(0, cols - 1, 2))
+	r, c = (arange(out_r) * 2)[:,None], (arange(out_c) * 2)[None,:]
+
+	# Center, East, South and South-East:
+	idx = [ (r * cols + c), (r * cols + clip(c + 1, 0, cols - 1)), \
+			(clip(r + 1, 0, rows - 1) * cols + c), \
+			(clip(r + 1, 0, rows - 1) * cols + clip(c + 1, 0, cols - 1)) ]
+	idx = concatenate([ i.ravel() for i in idx ])
+	out = tile(arange(out_r * out_c), 4)
+
+	op = csr_matrix((ones(idx.shape, dtype=float32), (out, idx)), \
+		shape=(out_r * out_c, rows * cols))
+
+	return op, (out_r, out_c)
+
+
+
+def _hex_operator(rows, cols, row_offset=0, rebinning=False):
+	"""Get (or build and cache) the sparse matrix that resamples a hexagonal 
+	grid of (rows x cols) pixels onto a square grid.
+
+	Pixels of odd rows (considering row_offset as the index of the first row 
+	in the full detector frame) are shifted right by half a pixel and the rows
+	are spaced sqrt(3)/2 of the pixel pitch. The output square grid has the
+	pitch of the columns. Each output pixel is bilinearly interpolated from 
+	the two closest rows (linear interpolation along each row).
+
+	"""
+	key = (rows, cols, row_offset % 2, bool(rebinning))
+	if key in _hex_operators:
+		return _hex_operators[key]
+
+	# Output grid (in units of pixel pitch):
+	row_pitch = sqrt(3.0) / 2.0
+	out_r = int(floor((rows - 1) * row_pitch)) + 1
+	y = arange(out_r) / row_pitch
+	x = arange(cols, dtype=float32)
+
+	# Vertical neighbors:
+	r0 = clip(floor(y).astype(int32), 0, rows - 1)
+	r1 = clip(r0 + 1, 0, rows - 1)
+	wr = (y - r0).astype(float32)
+
+	out_idx = []
+	in_idx = []
+	weights = []
+	for r, w_r in ((r0, 1.0 - wr), (r1, wr)):
+
+		# Horizontal neighbors (within each row, with edge replication):
+		c = x[None,:] - 0.5 * ((r[:,None] + row_offset) % 2)
+		c0 = floor(c).astype(int32)
+		w_c = (c - c0).astype(float32)
+		for cc, w in ((c0, 1.0 - w_c), (c0 + 1, w_c)):
+			cc = clip(cc, 0, cols - 1)
+			out_idx.append(arange(out_r * cols))
+			in_idx.append((r[:,None] * cols + cc).ravel())
+			weights.append((w_r[:,None] * w).ravel())
+
+	# Duplicates (e.g. at the borders) are summed by csr_matrix:
+	op = csr_matrix((concatenate(weights).astype(float32), \
+		(concatenate(out_idx), concatenate(in_idx))), shape=(out_r * cols, rows * cols))
+	shape = (out_r, cols)
+
+	# Fold the rebinning into the same operator:
+	if (rebinning):
+		reb, shape = _rebinning2x2_operator(out_r, cols)
+		op = (reb * op).tocsr()
+
+	op.eliminate_zeros()
+	_hex_operators[key] = (op, shape)
+
+	return op, shape
+
+
+
+def hex_resampling(im, row_offset=0, rebinning=False):
+	"""Resample projections acquired with the hexagonal pixel grid of PIXIRAD
+	onto a square grid with the same pixel pitch (horizontally).
+
+	Parameters
+	----------
+	im : array_like
+		Image data as numpy array (2D or 3D organized as [x,y,angles]).
+
+	row_offset : int
+		Index of the first row of im in the full detector frame (e.g. the top
+		crop). It determines which rows are shifted by half a pixel.
+
+	rebinning : bool
+		Apply also 2x2 rebinning (as rebinning2x2) with the same operator.
+
+	Return
+	----------
+	im : array_like
+		Resampled data. The number of rows is reduced by a factor sqrt(3)/2
+		(and the sizes halved if rebinning is required).
+
+	"""	
+	op, shape = _hex_operator(im.shape[0], im.shape[1], row_offset, rebinning)
+
+	# All the projections with one sparse product (no copy if contiguous):
+	data = ascontiguousarray(im, dtype=float32).reshape(im.shape[0] * im.shape[1], -1)
+	out = op.dot(data).astype(float32, copy=False)
+
+	return out.reshape(shape + im.shape[2:])
+
+
+
 def upscaling2x2(im, method='repeat'):
 	"""Perform 2x2 upscaling with either repetition or interpolation.
 
@@ -0,0 +1,105 @@
+from numpy import float32, pi, newaxis, moveaxis
+from numpy.fft import fftfreq, rfftfreq
+
+from . import kst_fft
+
+# Cached Paganin kernels (one for each padded shape and set of parameters):
+_kernels = {}
+
+
+def _paganin_kernel(shape, pixel_size, distance, energy, delta_beta):
+	"""Get (or compute and cache) the read-only Paganin low-pass kernel for the
+	spectrum of a real FFT of the specified (padded) shape.
+
+	"""
+	key = (shape, pixel_size, distance, energy, delta_beta)
+
+	if key not in _kernels:
+
+		# Wavelength [mm] from energy [keV]:
+		wavelength = 12.398e-7 / energy
+
+		# Frequencies [1/mm] of the real FFT along rows and columns:
+		fy = fftfreq(shape[0], pixel_size)
+		fx = rfftfreq(shape[1], pixel_size)
+
+		kernel = 1.0 / (1.0 + pi * wavelength * distance * delta_beta * \
+			(fy[:,newaxis] ** 2 + fx[newaxis,:] ** 2))
+		kernel = kernel.astype(float32)
+		kernel.flags.writeable = False
+
+		_kernels[key] = kernel
+
+	return _kernels[key]
+
+
+def paganin(im, pixel_size, distance, energy, delta_beta, axis=2, batch_size=32, \
+			nr_threads=None):
+	"""Apply single-distance phase retrieval (Paganin filter) to flat-fielded
+	projections (i.e. before the log transform).
+
+	Parameters
+	----------
+	im : array_like
+		Flat-fielded projections as numpy array organized as [x,y,angles] (or
+		[angles,x,y] with axis=0). A float32 input is filtered in place.
+
+	pixel_size : double [mm]
+		Size of each detector pixel.
+
+	distance : double [mm]
+		Propagation (sample-detector) distance.
+
+	energy : double [keV]
+		Energy of the X-rays.
+
+	delta_beta : double
+		Ratio between the real and the imaginary part of the refractive index.
+
+	axis : int
+		Axis of im along which projections are stacked.
+
+	batch_size : int
+		Number of projections transformed together by each FFT.
+
+	nr_threads : int
+		Number of threads of the FFTs (default: all the cores).
+
+	Return
+	----------
+	im : array_like
+		Filtered projections (same layout of the input).
+
+	"""
+	im = im.astype(float32, copy=False)
+
+	# View with projections along the first axis (no copy):
+	proj = moveaxis(im, axis, 0)
+	nr_proj, rows, cols = proj.shape
+
+	# Padded shape and offset of the image in the FFT buffer:
+	shape = (kst_fft.padded_size(rows), kst_fft.padded_size(cols))
+	r0 = (shape[0] - rows) // 2
+	c0 = (shape[1] - cols) // 2
+
+	# Cached plans and kernel:
+	batch_size = min(batch_size, nr_proj)
+	fwd, inv = kst_fft.rfft_plans((batch_size,) + shape, (1, 2), nr_threads)
+	kernel = _paganin_kernel(shape, float(pixel_size), float(distance), float(energy), \
+		float(delta_beta))
+	buf = fwd.input_array
+	spectrum = fwd.output_array
+
+	for i in range(0, nr_proj, batch_size):
+		n = min(batch_size, nr_proj - i)
+
+		# Filter the batch (the tail of a partial batch is just ignored):
+		kst_fft.edge_pad_into(buf[:n], proj[i:i + n], r0, c0)
+		fwd()
+		spectrum *= kernel
+		inv()
+
+		# Crop:
+		proj[i:i + n] = buf[:n, r0:r0 + rows, c0:c0 + cols]
+
+	return im
@@ -1,7 +1,7 @@
 ﻿from numpy import arange, float32, tile, fromfile, delete, reshape, zeros, array 
 from numpy import logical_or, isnan, isinf, log as nplog, r_, iinfo, uint16, asfortranarray
 from glob import glob
-from tifffile import imread, imsave # only for debug
+from tifffile import imread # only for debug
 from os.path import splitext, isfile, isdir
 
 
@@ -10,22 +10,29 @@ from . import kst_flat_fielding
 from . import kst_matrix_manipulation
 from . import kst_remove_outliers
 from . import kst_ring_removal
+from . import kst_phase_retrieval
+from . import kst_alignment
 
 
 
 def pre_processing(dset, rebinning, flatfielding_window, despeckle_thresh, \
 				   output_low, output_high, output_diff, output_sum, mode, \
-				   crop, proj_avg_mode, proj_avg_alpha, dering_thresh):
+				   crop, proj_avg_mode, proj_avg_alpha, dering_thresh, hex_resampling=False, \
+				   phase_retrieval=None, flatfielding_mode='static', alignment=False):
 	""" Perform pre-processing composed of the following steps:
 
 		- Crop (at first to speed-up everything else)        
 		- Projection averaging (if 4D-data with Nan compensation)
 		- Removal of the first column (Pixirad has a bad first column)
 		- Create energy integrated image (if required)
-		- Flat fielding
-		- Rebinning (if required)
+		- Flat fielding (either 'static' or 'dynamic', i.e. with eigen-flats)
+		- Hexagonal-to-square resampling and/or rebinning (if required)
 		- Despeckle with NaNs and Infs removal 
 		- Ring removal
+		- Jitter alignment (if required, shifts estimated on low energy and 
+		  cached for each dataset)
+		- Phase retrieval (if required, as a tuple of pixel size, distance, 
+		  energy and delta/beta for the Paganin filter)
 
 	"""	
 	
@@ -86,16 +93,33 @@ def pre_processing(dset, rebinning, flatfielding_window, despeckle_thresh, \
 
 
 	# Apply flat fielding:
-	low = kst_flat_fielding.flat_fielding(low, flat_low, flatfielding_window)
-	if dset.high is not None:
-		high = kst_flat_fielding.flat_fielding(high, flat_high, flatfielding_window)	
+	if (flatfielding_mode == 'dynamic'):
+		low = kst_flat_fielding.dynamic_flat_fielding(low, flat_low)
+		if dset.high is not None:
+			high = kst_flat_fielding.dynamic_flat_fielding(high, flat_high)	
 
-	if (output_sum):
-		sum = kst_flat_fielding.flat_fielding(sum, flat_sum, flatfielding_window)	
+		if (output_sum):
+			sum = kst_flat_fielding.dynamic_flat_fielding(sum, flat_sum)	
+
+	else:
+		low = kst_flat_fielding.flat_fielding(low, flat_low, flatfielding_window)
+		if dset.high is not None:
+			high = kst_flat_fielding.flat_fielding(high, flat_high, flatfielding_window)	
+
+		if (output_sum):
+			sum = kst_flat_fielding.flat_fielding(sum, flat_sum, flatfielding_window)	
 	
 		
+	# Apply hexagonal-to-square resampling (with rebinning in the same operator):
+	if (hex_resampling):
+		low = kst_matrix_manipulation.hex_resampling(low, crop[0], rebinning)
+		if dset.high is not None:
+			high = kst_matrix_manipulation.hex_resampling(high, crop[0], rebinning)
+		if (output_sum):
+			sum = kst_matrix_manipulation.hex_resampling(sum, crop[0], rebinning)
+
 	# Apply rebinning (if required):
-	if (rebinning):
+	elif (rebinning):
 
 		# Get new size by calling code once:
 		new_im = kst_matrix_manipulation.rebinning2x2(low[:,:,0])
@@ -153,6 +177,28 @@ def pre_processing(dset, rebinning, flatfielding_window, despeckle_thresh, \
 		#	sum[j,:,:] = kst_ring_removal.boinhaibel(sum[j,:,:].T, dering_thresh).T			
 
 
+	# Correct projection jitter (the same shifts for all the images, cached
+	# for all the settings the low energy images depend on):
+	if (alignment):
+		key = (dset.source_file, tuple(crop), proj_avg_mode, proj_avg_alpha, \
+			   flatfielding_mode, flatfielding_window, rebinning, hex_resampling, \
+			   despeckle_thresh)
+		low, shifts = kst_alignment.align_projections(low, key)
+		if dset.high is not None:
+			high = kst_alignment.apply_shifts(high, shifts)
+		if (output_sum):
+			sum = kst_alignment.apply_shifts(sum, shifts)
+
+
+	# Apply phase retrieval (if required):
+	if (phase_retrieval is not None):
+		low = kst_phase_retrieval.paganin(low, *phase_retrieval)
+		if dset.high is not None:
+			high = kst_phase_retrieval.paganin(high, *phase_retrieval)
+		if (output_sum):
+			sum = kst_phase_retrieval.paganin(sum, *phase_retrieval)
+
+
 	# Compute the subtraction image (if required):
 	if (output_diff):
 		diff = nplog(high) - nplog(low)				
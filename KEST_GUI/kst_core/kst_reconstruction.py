@@ -6,6 +6,10 @@ from pyfftw.interfaces.numpy_fft import rfft, irfft
 
 #import astra
 from . import kst_tigre_FDK
+from . import kst_backprojection
+from . import kst_gridding
+from . import kst_iterative
+from . import kst_system_matrix
 
 
 def correct_dataset(proj, offset_u=0, offset_v=0, overpadding=False):  	
@@ -49,13 +53,16 @@ def correct_dataset(proj, offset_u=0, offset_v=0, overpadding=False):
 
 def recon_tigre_fdk(proj, ssd, sdd, pixel_size, angles=2*pi, angles_shift=0, 
                    offset_u=0.0, offset_v=0.0, roll_deg=0.0, pitch_deg=0.0, 
-                   yaw_deg=0.0, short_scan=False, overpadding=False, filter='ram-lak'):
+                   yaw_deg=0.0, short_scan=False, overpadding=False, filter='ram-lak', 
+                   inplace=False, roi=None, fov=False, progressive=1, callback=None):
 	"""Reconstruct the input dataset by using the FDK implemented in TIGRE.
 
     Parameters
     ----------
     proj : array_like
-		Image data (3D set of projections) as numpy array. 	
+		Image data (3D set of projections) as numpy array, or a list of 
+		channels with the same geometry (reconstructed jointly, a list of
+		volumes is returned).
 
 	ssd : double [mm]
 		Source-sample distance.
@@ -93,21 +100,417 @@ def recon_tigre_fdk(proj, ssd, sdd, pixel_size, angles=2*pi, angles_shift=0,
 	short_scan : bool
 		Use Parker weights for short scan (i.e. 180 deg plus twice the cone angle).	
 
+	overpadding : bool
+		Extend each projection by replicating the edge columns (a quarter of
+		the width on each side) to reduce the artifacts of laterally 
+		truncated data. The extension is virtual (within the filter buffer),
+		the volume keeps the size of the original detector.
+
+	inplace : bool
+		Use the (float32) input as working buffer, i.e. proj is overwritten
+		but no further copy of the projections is made.
+
+	roi : tuple
+		Region of interest (x, y, z) of the volume: (start, stop) voxel 
+		bounds in-plane and (start, stop) or a list of slices along z (see
+		kst_backprojection.roi_ranges). Only its voxels are backprojected.
+
+	fov : bool
+		Skip (and zero) the voxels outside the circular field of view.
+
+	progressive : int
+		Number of interleaved subsets of angles reconstructed coarse-to-fine
+		(see kst_tigre_FDK.FDK_progressive), 1 to reconstruct all at once.
+
+	callback : function
+		callback(rec, fraction) called with each preview (progressive only).
+
 	"""  
-	# Pad:
-	if (overpadding):
-		val = int(round(proj.shape[1] /4))				
-		proj = pad(proj, ((0,0), (val, val), (0,0)), 'edge')
+	# Virtual padding (edge extension in the filter buffer):
+	val = int(round(_width(proj) / 4)) if (overpadding) else 0
+
+	# Region of interest (voxels outside are not visited):
+	if (roi is not None):
+		return kst_tigre_FDK.FDK(proj, ssd, sdd, pixel_size, offset_u, offset_v, roll_deg, \
+			pitch_deg, yaw_deg, filter, angles, angles_shift, short_scan=short_scan, roi=roi, \
+			fov=fov, padding=val)
 
 	# Actual reconstruction:
-	rec = kst_tigre_FDK.FDK(proj, ssd, sdd, pixel_size, offset_u, offset_v, roll_deg, \
-		pitch_deg, yaw_deg, filter, angles, angles_shift)
+	return kst_tigre_FDK.FDK(proj, ssd, sdd, pixel_size, offset_u, offset_v, roll_deg, \
+		pitch_deg, yaw_deg, filter, angles, angles_shift, inplace=inplace, \
+		short_scan=short_scan, fov=fov, progressive=progressive, callback=callback, padding=val)
 
-	# Crop:
-	if (overpadding):
-		rec = rec[val:-val, val:-val,:] 
 
-	return rec
+def _width(proj):
+	"""Number of detector columns of proj (or of its first channel).
+	"""
+	return (proj[0] if isinstance(proj, (list, tuple)) else proj).shape[1]
+
+
+def recon_fdk_slabs(proj, ssd, sdd, pixel_size, angles=2*pi, angles_shift=0, 
+                    offset_u=0.0, offset_v=0.0, roll_deg=0.0, pitch_deg=0.0, 
+                    yaw_deg=0.0, short_scan=False, filter='ram-lak', upsampling=1, 
+                    out=None, memory=None, fov=False):
+	"""Reconstruct the input dataset by using the FDK by z-slabs with bounded
+	memory (only the detector rows seen by each slab are filtered and
+	backprojected on CPU).
+
+    Parameters
+    ----------
+    proj : array_like
+		Image data (3D set of projections) as numpy array or h5py dataset.
+
+	ssd, sdd, pixel_size, angles, angles_shift, offset_u, offset_v, roll_deg,
+	pitch_deg, yaw_deg, short_scan, filter, fov : see recon_tigre_fdk.
+
+    upsampling : int
+        Number of voxels per detector pixel along each axis.
+
+    out : array_like
+        Output volume [x,y,z] (e.g. a h5py dataset), allocated if None.
+
+    memory : int [bytes]
+        Working memory budget (default: a fraction of the available memory).
+
+	"""
+	return kst_tigre_FDK.FDK_slabs(proj, ssd, sdd, pixel_size, offset_u, offset_v, roll_deg, \
+		pitch_deg, yaw_deg, filter, angles, angles_shift, short_scan, upsampling, out, memory, \
+		fov=fov)
+
+
+def recon_fbp_parallel(proj, angles=pi, angles_shift=0, offset_u=0.0, filter='ram-lak', 
+                       inplace=False, roi=None, fov=False, progressive=1, callback=None,
+                       overpadding=False):
+	"""Reconstruct the input parallel-beam dataset by using the CPU filtered
+	backprojection (multi-threaded across slices).
+
+    Parameters
+    ----------
+    proj : array_like
+		Image data (3D set of projections) as numpy array, or a list of 
+		channels with the same geometry (backprojected jointly with the same
+		interpolation tables, a list of volumes is returned).
+
+	angles : double [radians]
+		Value in radians representing the number of covered angles of the CT dataset.
+
+    angles_shift : double [radians]
+        Lossless rotation of the reconstructed images.
+
+    offset_u : double [pixel]
+        Horizontal detector offset (i.e. center of rotation offset).
+
+    filter : string
+		The available options are "ram-lak", "shepp-logan", "cosine", "hamming", "hann".
+
+	inplace : bool
+		Use the (float32) input as working buffer, i.e. proj is overwritten
+		but no further copy of the projections is made.
+
+	roi : tuple
+		Region of interest (x, y, z) of the volume (see 
+		kst_backprojection.roi_ranges): only the selected slices are filtered
+		and only the voxels in the region are backprojected.
+
+	fov : bool
+		Skip (and zero) the voxels outside the circular field of view.
+
+	progressive : int
+		Number of interleaved subsets of angles (e.g. 8 for every 8th 
+		projection) filtered and backprojected coarse-to-fine into the same
+		volume, 1 to reconstruct all at once. Filter weights are the ones of
+		the whole scan, so the final volume is the full reconstruction.
+
+	callback : function
+		callback(rec, fraction) called after each subset but the last one
+		with the preview (rescaled to the whole number of projections) and 
+		the fraction of projections already backprojected.
+
+	overpadding : bool
+		Virtually extend each sinogram by replicating the edge columns (a 
+		quarter of the width on each side) within the filter buffer, see
+		recon_tigre_fdk.
+
+    """
+	# Channels are reconstructed one after the other if not jointly:
+	channels = isinstance(proj, (list, tuple))
+	if (channels) and (progressive > 1):
+		return [recon_fbp_parallel(p, angles, angles_shift, offset_u, filter, inplace, roi, fov, \
+			progressive, callback, overpadding) for p in proj]
+	projs = list(proj) if (channels) else [proj]
+
+	if (roi is not None):
+		(x0, x1), (y0, y1), runs = kst_backprojection.roi_ranges(roi, (projs[0].shape[1], \
+			projs[0].shape[1], projs[0].shape[0]))
+		slices = [z for a, b in runs for z in range(a, b)]
+		projs = [p[slices[0]:slices[-1] + 1] if (len(runs) == 1) else p[slices] for p in projs]
+		roi = ((x0, x1), (y0, y1))
+
+	projs = [p.astype(float32, copy=not inplace) for p in projs]
+	proj = projs[0]
+	nr_proj = proj.shape[2] 
+	ang_range = linspace(0 + angles_shift, angles + angles_shift, nr_proj, False)
+
+	# Geometry with unit magnification and pixel size (output in pixel units):
+	geo = kst_tigre_FDK.Geometry(proj.shape, 1.0, 0.0, 1.0, offset_u, 0.0, 'parallel', filter)
+	geo.filter = filter
+	val = int(round(proj.shape[1] / 4)) if (overpadding) else 0
+
+	if (progressive <= 1):
+		# Batched ramp filtering (in place, on a [cols,rows,angles] view):
+		for p in projs:
+			kst_tigre_FDK.filtering(p.transpose(1,0,2), geo, ang_range, False, padding=val)
+
+		# Backprojection:
+		return kst_backprojection.backproject_parallel(projs if (channels) else proj, ang_range, \
+			offset_u, roi=roi, fov=fov)
+
+	# Coarse-to-fine (interleaved subsets accumulated in [slices,voxels]):
+	nz, nu = proj.shape[0], proj.shape[1]
+	nx, ny = (nu, nu) if roi is None else (roi[0][1] - roi[0][0], roi[1][1] - roi[1][0])
+	rec = zeros((nz, nx * ny), dtype=float32)
+	subsets = kst_backprojection.interleaved_subsets(min(progressive, nr_proj))
+	step = (2 * pi / nr_proj) / 2
+	count = 0
+
+	for m, k in enumerate(subsets):
+		sub = proj[:, :, k::len(subsets)]
+		kst_tigre_FDK.filtering(sub.transpose(1,0,2), geo, ang_range[k::len(subsets)], False, step=step, \
+			padding=val)
+		kst_backprojection.backproject_parallel_into(sub, ang_range[k::len(subsets)], rec, offset_u, \
+			roi=roi, fov=fov)
+		count += sub.shape[2]
+
+		if (callback is not None) and (m < len(subsets) - 1):
+			callback((rec * float32(nr_proj / count)).T.reshape(nx, ny, nz), count / nr_proj)
+
+	return rec.T.reshape(nx, ny, nz)
+
+
+def recon_gridding_parallel(proj, angles=pi, angles_shift=0, offset_u=0.0, filter='ram-lak', 
+                            fov=False, overpadding=False):
+	"""Reconstruct the input parallel-beam dataset by using Fourier gridding 
+	on CPU (faster than the filtered backprojection for large slices).
+
+    Parameters
+    ----------
+    proj : array_like
+		Image data (3D set of projections) as numpy array. 
+
+	angles : double [radians]
+		Value in radians representing the number of covered angles of the CT dataset.
+
+    angles_shift : double [radians]
+        Lossless rotation of the reconstructed images.
+
+    offset_u : double [pixel]
+        Horizontal detector offset (i.e. center of rotation offset).
+
+    filter : string
+		The available options are "ram-lak", "shepp-logan", "cosine", "hamming", "hann".
+
+	fov : bool
+		Zero the voxels outside the circular field of view.
+
+	overpadding : bool
+		Virtually extend each sinogram by replicating the edge columns within
+		the FFT buffer, see recon_tigre_fdk.
+
+    """
+	nr_proj = proj.shape[2] 
+	ang_range = linspace(0 + angles_shift, angles + angles_shift, nr_proj, False)
+	val = int(round(proj.shape[1] / 4)) if (overpadding) else 0
+
+	return kst_gridding.gridding_parallel(proj, ang_range, offset_u, filter, fov=fov, padding=val)
+
+
+def recon_sirt_parallel(proj, angles=pi, iterations=100, angles_shift=0, offset_u=0.0, 
+                        subsets=1, tolerance=kst_iterative.SIRT_TOLERANCE, callback=None, 
+                        system_matrix=False):
+	"""Reconstruct the input parallel-beam dataset by using the (ordered 
+	subsets) SIRT on CPU.
+
+    Parameters
+    ----------
+    proj : array_like
+		Image data (3D set of projections) as numpy array. 
+
+	angles : double [radians]
+		Value in radians representing the number of covered angles of the CT dataset.
+
+    iterations : int
+		Maximum number of iterations for the algebraic solution.	
+
+    angles_shift : double [radians]
+        Lossless rotation of the reconstructed images.
+
+    offset_u : double [pixel]
+        Horizontal detector offset (i.e. center of rotation offset).
+
+    subsets : int
+        Number of ordered subsets (1 for plain SIRT).
+
+    tolerance : double
+        Stop when the relative residual changes less than this fraction of
+        its value between two iterations.
+
+    callback : callable
+        Called after each iteration as callback(iteration, rec, residual).
+
+    system_matrix : bool
+        Use the (cached on disk) system matrix of one slice instead of 
+        computing the projections on the fly.
+
+    """
+	proj = proj.astype(float32, copy=False)
+	nz, nu, nr_proj = proj.shape
+	ang_range = linspace(0 + angles_shift, angles + angles_shift, nr_proj, False)
+
+	if (system_matrix):
+		A = kst_system_matrix.system_matrix(nu, ang_range, offset_u)
+		forward, back = kst_system_matrix.matrix_projectors(A, nu, nr_proj)
+
+		rec = kst_iterative.sirt(proj, forward, back, (nu * nu, nz), iterations, subsets, \
+			tolerance, callback=callback)
+
+		return rec.reshape(nu, nu, nz)
+
+	# CPU projector pair working on volumes organized as [slices,voxels]:
+	def forward(vol, sl, out):
+		kst_backprojection.project_parallel_into(vol, ang_range[sl], out, offset_u)
+
+	def back(p, sl, out):
+		kst_backprojection.backproject_parallel_into(p, ang_range[sl], out, offset_u)
+
+	rec = kst_iterative.sirt(proj, forward, back, (nz, nu * nu), iterations, subsets, \
+		tolerance, callback=callback)
+
+	return rec.T.reshape(nu, nu, nz)
+
+
+def recon_sirt_cone(proj, ssd, sdd, pixel_size, angles=2*pi, iterations=100, angles_shift=0, 
+                    offset_u=0.0, offset_v=0.0, roll_deg=0.0, pitch_deg=0.0, yaw_deg=0.0, 
+                    subsets=1, tolerance=kst_iterative.SIRT_TOLERANCE, callback=None):
+	"""Reconstruct the input cone-beam dataset by using the (ordered subsets)
+	SIRT on CPU with the matched voxel-driven projector pair.
+
+    Parameters
+    ----------
+    proj : array_like
+		Image data (3D set of projections) as numpy array. 
+
+	ssd : double [mm]
+		Source-sample distance.
+
+    sdd : double [mm]
+		Sample-detector distance.
+
+    pixel_size : double [mm]
+		Size of each detector pixel (square pixels assumed).
+
+	angles : double [radians]
+		Value in radians representing the number of covered angles of the CT dataset.
+
+    iterations : int
+		Maximum number of iterations for the algebraic solution.	
+
+    angles_shift : double [radians]
+        Lossless rotation of the reconstructed images.
+
+    offset_u : double [pixel]
+        Horizontal detector offset.
+
+    offset_v : double [pixel]
+        Vertical detector offset.
+
+    roll_deg, pitch_deg, yaw_deg : double [degrees]
+        Detector tilt.
+
+    subsets : int
+        Number of ordered subsets (1 for plain SIRT).
+
+    tolerance : double
+        Stop when the relative residual changes less than this fraction of
+        its value between two iterations.
+
+    callback : callable
+        Called after each iteration as callback(iteration, rec, residual).
+
+    """
+	proj = proj.astype(float32, copy=False)
+	nr_proj = proj.shape[2]
+	ang_range = linspace(0 + angles_shift, angles + angles_shift, nr_proj, False)
+
+	geo = kst_tigre_FDK.Geometry(proj.shape, ssd, sdd, pixel_size, offset_u, offset_v, 'cone', None)
+	tilt = (roll_deg, pitch_deg, yaw_deg)
+
+	# CPU projector pair working on volumes organized as [x,y,z] (in place in
+	# the buffers of the solver):
+	def forward(vol, sl, out):
+		kst_backprojection.project_cone(vol, geo, ang_range[sl], *tilt, out=out)
+
+	def back(p, sl, out):
+		kst_backprojection.backproject_cone(p, geo, ang_range[sl], *tilt, matched=True, out=out)
+
+	return kst_iterative.sirt(proj, forward, back, tuple(int(n) for n in geo.nVoxel), \
+		iterations, subsets, tolerance, callback=callback)
+
+
+def recon_sirt_fan(proj, ssd, sdd, pixel_size, angles=2*pi, iterations=100, angles_shift=0, 
+                   offset_u=0.0, subsets=1, tolerance=kst_iterative.SIRT_TOLERANCE, callback=None):
+	"""Reconstruct the input cone-beam dataset slice by slice as fan-beam (i.e.
+	neglecting the cone angle) by using the (ordered subsets) SIRT on CPU with
+	the (cached on disk) system matrix of the central slice.
+
+    Parameters
+    ----------
+    proj : array_like
+		Image data (3D set of projections) as numpy array. 
+
+	ssd : double [mm]
+		Source-sample distance.
+
+    sdd : double [mm]
+		Sample-detector distance.
+
+    pixel_size : double [mm]
+		Size of each detector pixel (square pixels assumed).
+
+	angles : double [radians]
+		Value in radians representing the number of covered angles of the CT dataset.
+
+    iterations : int
+		Maximum number of iterations for the algebraic solution.	
+
+    angles_shift : double [radians]
+        Lossless rotation of the reconstructed images.
+
+    offset_u : double [pixel]
+        Horizontal detector offset.
+
+    subsets : int
+        Number of ordered subsets (1 for plain SIRT).
+
+    tolerance : double
+        Stop when the relative residual changes less than this fraction of
+        its value between two iterations.
+
+    callback : callable
+        Called after each iteration as callback(iteration, rec, residual).
+
+    """
+	proj = proj.astype(float32, copy=False)
+	nz, nu, nr_proj = proj.shape
+	ang_range = linspace(0 + angles_shift, angles + angles_shift, nr_proj, False)
+
+	geo = kst_tigre_FDK.Geometry(proj.shape, ssd, sdd, pixel_size, offset_u, 0.0, 'cone', None)
+	A = kst_system_matrix.system_matrix(nu, ang_range, geo=geo)
+	forward, back = kst_system_matrix.matrix_projectors(A, nu, nr_proj)
+
+	rec = kst_iterative.sirt(proj, forward, back, (nu * nu, nz), iterations, subsets, \
+		tolerance, callback=callback)
+
+	return rec.reshape(nu, nu, nz)
 
 
 def recon_astra_fdk(proj, angles, ssd, sdd, pixel_size, offset_u, offset_v, 
@@ -1,10 +1,13 @@
 ﻿from numpy import float32, finfo, ndarray, isnan, isinf, logical_or, uint16
 from numpy import median, amin, amax, nonzero, percentile, pad, array
 from numpy import tile, concatenate, reshape, interp, zeros, asfortranarray
+from numpy import mgrid, newaxis, where
 
-from scipy.ndimage.filters import median_filter
-
-from . import _despeckle
+# Compiled (OpenMP) filter, available as a Windows binary only:
+try:
+	from . import _despeckle
+except ImportError:
+	_despeckle = None
 
 
 def despeckle(im, thresh=0.1, non_negativity=False, nr_threads=16):
@@ -28,6 +31,9 @@ def despeckle(im, thresh=0.1, non_negativity=False, nr_threads=16):
 		Image 3D data as numpy array with the correction applied.
 
 	"""	
+	if (_despeckle is None):
+		raise ImportError('despeckle: the compiled _despeckle module is not available')
+
 	non_neg_i = 1 if non_negativity else 0
 
 	shp = array([im.shape[0],im.shape[1],im.shape[2]]) # For further reshape
@@ -84,6 +90,17 @@ def pixel_correction(im):
 
 
 
+def _reflect_index(idx, n):
+	"""Map (possibly out of range) indexes into [0, n) as the 'reflect' mode
+	of scipy.ndimage does, i.e. (d c b a | a b c d | d c b a).
+
+	"""
+	period = 2 * n
+	idx = idx % period
+
+	return where(idx < n, idx, period - idx - 1)
+
+
 def afterglow_correction(im, max_depth=7):
 	"""Correct values below zero (such as e.g. after flat fielding) 
 	by adaptive median filtering
@@ -91,7 +108,9 @@ def afterglow_correction(im, max_depth=7):
 	Parameters
 	----------
 	im : array_like
-		Image data as numpy array. 
+		Image data as numpy array. A 3D dataset organized as [x,y,angles]
+		is also accepted: each image of the stack is processed with a 2D
+		neighborhood.
 
 	max_depth : int
 		If a single pass with a 3x3 median filter does not correct all the 
@@ -105,21 +124,36 @@ def afterglow_correction(im, max_depth=7):
 		Image data as numpy array with the correction applied.
 	
 	"""
+	eps = finfo(float32).eps
+
+	# Find the pixels to correct (only once):
+	bad = nonzero(im < eps)
+	if (bad[0].size == 0):
+		return im
 
-	# Quick and dirty compensation for values below zero:
+	print("Afterglow occurred.")
+
+	# The median is computed only in the neighborhood of the pixels still
+	# to correct, with a growing window:
 	size_ct = 3
-	while ((float(amin(im)) < finfo(float32).eps) and (size_ct <= max_depth)):	
-		print("Afterglow occurred.")		
-		im_f = median_filter(im, size_ct)
-		im[im < finfo(float32).eps] = im_f[im < finfo(float32).eps]					
+	while ((bad[0].size > 0) and (size_ct <= max_depth)):
+		h = size_ct // 2
+		dr, dc = mgrid[-h:h + 1, -h:h + 1]
+
+		# Neighbors (one row for each pixel) with the same borders of median_filter:
+		rows = _reflect_index(bad[0][:,newaxis] + dr.ravel(), im.shape[0])
+		cols = _reflect_index(bad[1][:,newaxis] + dc.ravel(), im.shape[1])
+		others = tuple(idx[:,newaxis] for idx in bad[2:])
+		im_f = median(im[(rows, cols) + others], axis=1)
+
+		# Replace and keep only the pixels still below eps:
+		im[bad] = im_f
+		still = im_f < eps
+		bad = tuple(idx[still] for idx in bad)
 		size_ct += 2
 
 	# Compensate negative values by replacing them with zero:
-	if (float(amin(im)) < finfo(float32).eps):		
-		im[im < finfo(float32).eps] = finfo(float32).eps
+	if (bad[0].size > 0):		
+		im[bad] = eps
 
 	return im
-
-
-
-	
@@ -0,0 +1,199 @@
+from numpy import float32, pi, linspace, stack, asarray, zeros, log, maximum, newaxis
+from threading import Lock
+
+from . import kst_backprojection
+from . import kst_tigre_FDK
+
+# Default number of projections filtered and backprojected at once:
+STREAM_BATCH = 16
+
+# Smallest normalized intensity (i.e. maximum attenuation) before the log:
+STREAM_MIN_TRANSMISSION = 1e-6
+
+
+class StreamingFDK:
+	"""On-the-fly FDK reconstruction: each projection is normalized (with the
+	cached flat and dark images), weighted, filtered and backprojected into
+	an accumulator volume as soon as it is available (e.g. during the
+	acquisition). The partial volume can be read at any time and, once all
+	the projections have been added, it is the FDK reconstruction.
+
+	Parameters
+	----------
+	shape : tuple
+		Size [rows,cols] of each projection.
+
+	nr_proj : int
+		Number of projections of the complete scan.
+
+	ssd, sdd, px, offset_u, offset_v, roll_deg, pitch_deg, yaw_deg, filter,
+	tot_angles, angles_shift, short_scan : see kst_tigre_FDK.FDK.
+
+	flat : array_like
+		Flat (open beam) images [rows,cols] or [rows,cols,images] used to
+		normalize the raw projections (None if projections are already
+		normalized).
+
+	dark : array_like
+		Dark images [rows,cols] or [rows,cols,images] (optional).
+
+	take_log : bool
+		Convert the normalized intensity into line integrals (-log).
+
+	batch_size : int
+		Number of projections filtered and backprojected at once.
+
+	fov : bool
+		Skip the voxels outside the field of view (see
+		kst_backprojection.backproject_cone).
+
+	nr_threads : int
+		Number of parallel threads of the backprojection (default: all the
+		cores).
+
+	"""
+
+	def __init__(self, shape, nr_proj, ssd, sdd, px, offset_u=0.0, offset_v=0.0, roll_deg=0.0, \
+				 pitch_deg=0.0, yaw_deg=0.0, filter='ram-lak', tot_angles=2*pi, angles_shift=0, \
+				 short_scan=False, flat=None, dark=None, take_log=True, batch_size=STREAM_BATCH, \
+				 fov=False, nr_threads=None):
+
+		self.geo = kst_tigre_FDK.Geometry((shape[0], shape[1], nr_proj), ssd, sdd, px, offset_u, \
+			offset_v, 'cone', filter)
+		if filter is not None:
+			self.geo.filter = filter
+		self.angles = linspace(0 + angles_shift, tot_angles + angles_shift, nr_proj, False).astype(float32)
+		self.tilt = (roll_deg, pitch_deg, yaw_deg)
+		self.batch_size = max(1, int(batch_size))
+		self.fov = fov
+		self.nr_threads = nr_threads
+
+		# Cached weights and angular step of the whole scan:
+		self.weights = kst_tigre_FDK.cosine_weights(self.geo)
+		self.parker = kst_tigre_FDK.parker_weights(self.geo, self.angles) if short_scan else None
+		if short_scan and (nr_proj > 1):
+			self.step = abs(float(self.angles[1]) - float(self.angles[0]))
+		else:
+			self.step = (2 * pi / nr_proj) / 2
+
+		# Cached flat fielding (computed once for all the projections):
+		self.dark = None if dark is None else _average(dark)
+		if flat is None:
+			self.inv_flat = None
+		else:
+			flat = _average(flat)
+			if self.dark is not None:
+				flat = flat - self.dark
+			self.inv_flat = 1.0 / maximum(flat, STREAM_MIN_TRANSMISSION)
+		self.take_log = take_log
+
+		self.rec = zeros(self.geo.nVoxel, dtype=float32)
+		self.added = zeros(nr_proj, dtype=bool)
+		self.queued = zeros(nr_proj, dtype=bool)
+		self.pending = []
+		self.lock = Lock()
+
+
+	@property
+	def count(self):
+		"""Number of projections already backprojected.
+		"""
+		return int(self.added.sum())
+
+
+	def add(self, im, index):
+		"""Add the projection [rows,cols] acquired at the specified index of
+		the scan (projections already added are ignored). Projections are
+		processed in batches of batch_size. Thread-safe.
+		"""
+		index = int(index)
+		with self.lock:
+			if self.queued[index]:
+				return
+			self.queued[index] = True
+			self.pending.append((index, im))
+			if len(self.pending) < self.batch_size:
+				return
+			batch, self.pending = self.pending, []
+
+		self._process(batch)
+
+
+	def feed(self, source, callback=None):
+		"""Add all the (index, projection) of the specified iterable, e.g.
+		kst_io.watch_tiff_sequence. The optional callback(count) is called
+		after each batch.
+		"""
+		for index, im in source:
+			self.add(im, index)
+			if (callback is not None) and not self.pending:
+				callback(self.count)
+
+		self.flush()
+		if callback is not None:
+			callback(self.count)
+
+		return self.volume()
+
+
+	def flush(self):
+		"""Filter and backproject the pending projections. Thread-safe.
+		"""
+		with self.lock:
+			batch, self.pending = self.pending, []
+
+		if batch:
+			self._process(batch)
+
+
+	def _process(self, batch):
+		"""Filter and backproject the batch of (index, projection) taken
+		from the pending ones.
+		"""
+		idx = [i for i, _ in batch]
+		proj = stack([asarray(im, dtype=float32) for _, im in batch], axis=2)
+
+		# Flat fielding:
+		if self.dark is not None:
+			proj -= self.dark[:, :, newaxis]
+		if self.inv_flat is not None:
+			proj *= self.inv_flat[:, :, newaxis]
+		if self.take_log:
+			maximum(proj, STREAM_MIN_TRANSMISSION, out=proj)
+			log(proj, out=proj)
+			proj *= -1
+
+		# Weights (Parker ones of the whole scan) and filtering:
+		proj *= self.weights[:, :, newaxis]
+		if self.parker is not None:
+			proj *= self.parker[idx].T[newaxis, :, :]
+		angles = self.angles[idx]
+		kst_tigre_FDK.filtering(proj.transpose(1, 0, 2), self.geo, angles, False, step=self.step)
+
+		# Accumulate:
+		with self.lock:
+			kst_backprojection.backproject_cone(proj, self.geo, angles, *self.tilt, \
+				nr_threads=self.nr_threads, fov=self.fov, out=self.rec)
+			self.added[idx] = True
+
+
+	def volume(self, normalize=False):
+		"""Copy of the (partial) reconstructed volume [x,y,z]. With normalize
+		the partial sum is scaled to the complete number of projections.
+		"""
+		with self.lock:
+			rec = self.rec.copy()
+			count = int(self.added.sum())
+
+		if normalize and (count > 0):
+			rec *= float32(len(self.added) / count)
+
+		return rec
+
+
+def _average(im):
+	"""Average [rows,cols] of a stack [rows,cols,images] of flat or dark
+	images.
+	"""
+	im = asarray(im, dtype=float32)
+	return im.mean(axis=2) if im.ndim == 3 else im
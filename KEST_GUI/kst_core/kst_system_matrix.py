@@ -0,0 +1,215 @@
+from numpy import float32, float64, int32, int64, arange, array, cos, sin, sqrt, floor
+from numpy import newaxis, concatenate, argsort, bincount, cumsum, zeros, load, savez
+from scipy.sparse import csr_matrix
+from collections import OrderedDict
+from zipfile import BadZipFile
+import tempfile
+import hashlib
+import os
+
+from . import kst_backprojection
+
+# Default folder of the cached system matrices:
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.kest', 'system_matrices')
+
+# Cached system matrices (one for each geometry hash), least recently used 
+# first, and their largest number (each one can take hundreds of MB):
+_matrices = OrderedDict()
+SYSTEM_MATRICES = 2
+
+
+def _fan_tables(ang, nu, geo):
+	"""Bordered detector indices, linear interpolation weights and splatting
+	weights [angles,voxels] of the voxels of the central slice of a cone-beam
+	geometry (i.e. fan-beam) for the specified block of angles.
+
+	"""
+	nx = int(geo.nVoxel[0])
+	vx = (arange(nx) - (nx - 1) / 2.0) * geo.dVoxel[0] + geo.offOrigin[0]
+	vy = (arange(nx) - (nx - 1) / 2.0) * geo.dVoxel[1] + geo.offOrigin[1]
+	c, s = cos(ang)[:, newaxis, newaxis], sin(ang)[:, newaxis, newaxis]
+
+	t = (c * vx[newaxis, :, newaxis] + s * vy[newaxis, newaxis, :]).reshape(len(ang), nx * nx)
+	u = (-s * vx[newaxis, :, newaxis] + c * vy[newaxis, newaxis, :]).reshape(len(ang), nx * nx)
+
+	# Magnification and position on the detector (from the principal point):
+	lam = geo.DSD / (geo.DSO - t)
+	u *= lam
+
+	# Each voxel spreads its path length over the detector columns:
+	w = lam * (geo.dVoxel[0] * geo.dVoxel[1] / geo.dDetector[0]) * sqrt(1 + (u / geo.DSD) ** 2)
+
+	x = (u - geo.offDetector[0]) / geo.dDetector[0] + (nu + 1) / 2.0
+	x.clip(0, nu + kst_backprojection.BORDER, out=x)
+	x0 = floor(x)
+
+	return x0.astype(int32), (x - x0).astype(float32), w.astype(float32)
+
+
+def _geometry_key(nr_cols, angles, offset_u, geo):
+	"""Hash identifying the system matrix of the specified geometry.
+
+	"""
+	h = hashlib.sha1()
+	h.update(repr((int(nr_cols), float(offset_u))).encode())
+	h.update(array(angles, dtype=float64).tobytes())
+	if geo is not None:
+		h.update(repr((float(geo.DSO), float(geo.DSD), tuple(float(v) for v in geo.dDetector), \
+			float(geo.offDetector[0]), tuple(int(v) for v in geo.nVoxel[:2]), \
+			tuple(float(v) for v in geo.dVoxel[:2]), tuple(float(v) for v in geo.offOrigin[:2]))).encode())
+
+	return h.hexdigest()
+
+
+def system_matrix(nr_cols, angles, offset_u=0.0, geo=None, cache_dir=None):
+	"""Get (or build and cache in memory and on disk) the system matrix of one
+	slice, i.e. the linear operator from the flattened [x,y] slice to the
+	flattened [angles,cols] sinogram. Weights are the ones of the CPU
+	projectors (linear interpolation of the voxel centers).
+
+	Parameters
+	----------
+	nr_cols : int
+		Number of detector columns.
+
+	angles : array_like [radians]
+		Angle of each projection.
+
+	offset_u : double [pixel]
+		Horizontal detector offset (parallel-beam only, for fan-beam it is
+		geo.offDetector).
+
+	geo : Geometry
+		None for parallel-beam (volume of [cols,cols] voxels with the size of
+		the pixel) or the cone-beam geometry (see kst_tigre_FDK.Geometry)
+		whose central slice is used as fan-beam.
+
+	cache_dir : string
+		Folder of the disk cache (default: CACHE_DIR). If False, the matrix is
+		cached in memory only.
+
+	Return
+	----------
+	A : csr_matrix
+		System matrix with float32 weights and int32 indices.
+
+	"""
+	key = _geometry_key(nr_cols, angles, offset_u, geo)
+	cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+	file_name = os.path.join(cache_dir, key + '.npz') if cache_dir else None
+
+	if key in _matrices:
+		_matrices.move_to_end(key)
+		return _matrices[key]
+
+	# Load from disk (an unreadable file, e.g. truncated, is rebuilt):
+	if file_name and os.path.isfile(file_name):
+		try:
+			with load(file_name) as f:
+				A = csr_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+			return _remember(key, A)
+		except (OSError, ValueError, KeyError, BadZipFile):
+			pass
+
+	ang = array(angles, dtype=float64)
+	nu = int(nr_cols)
+	nr_vox = nu * nu if geo is None else int(geo.nVoxel[0]) * int(geo.nVoxel[1])
+	block = max(1, min(len(ang), kst_backprojection.TABLE_ELEMENTS // nr_vox))
+	vox = arange(nr_vox, dtype=int32)
+
+	data, indices, counts = [], [], []
+
+	for i0 in range(0, len(ang), block):
+		if geo is None:
+			idx, fx = kst_backprojection.parallel_tables(ang[i0:i0 + block], nu, offset_u)
+			w = None
+		else:
+			idx, fx, w = _fan_tables(ang[i0:i0 + block], nu, geo)
+
+		for j in range(idx.shape[0]):
+
+			# The two taps of each voxel (border columns are dropped):
+			col = concatenate((idx[j] - 1, idx[j]))
+			val = concatenate((1 - fx[j], fx[j]))
+			if w is not None:
+				val *= concatenate((w[j], w[j]))
+			mask = (col >= 0) & (col < nu) & (val > 0)
+			col, val, v = col[mask], val[mask], concatenate((vox, vox))[mask]
+
+			# Rows of this angle (i.e. entries sorted by detector column):
+			order = argsort(col, kind='stable')
+			data.append(val[order])
+			indices.append(v[order])
+			counts.append(bincount(col, minlength=nu))
+
+	indptr = zeros(len(ang) * nu + 1, dtype=int64)
+	indptr[1:] = cumsum(concatenate(counts))
+	A = csr_matrix((concatenate(data).astype(float32), concatenate(indices).astype(int32), \
+		indptr.astype(int32 if indptr[-1] < 2 ** 31 else int64)), shape=(len(ang) * nu, nr_vox))
+
+	# Store:
+	if file_name:
+		_save(file_name, A)
+
+	return _remember(key, A)
+
+
+def _remember(key, A):
+	"""Cache in memory the system matrix A, dropping the least recently used
+	ones beyond SYSTEM_MATRICES.
+
+	"""
+	_matrices[key] = A
+	_matrices.move_to_end(key)
+	while len(_matrices) > SYSTEM_MATRICES:
+		_matrices.popitem(last=False)
+
+	return A
+
+
+def _save(file_name, A):
+	"""Write the system matrix A to a temporary file moved to file_name only
+	when complete (i.e. an interrupted write never leaves a truncated cache
+	file). Errors (e.g. disk full) are ignored: the matrix is not cached on
+	disk.
+
+	"""
+	tmp_name = None
+	try:
+		os.makedirs(os.path.dirname(file_name), exist_ok=True)
+		fd, tmp_name = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(file_name))
+		with os.fdopen(fd, 'wb') as f:
+			savez(f, data=A.data, indices=A.indices, indptr=A.indptr, shape=array(A.shape))
+		os.replace(tmp_name, file_name)
+	except OSError:
+		if (tmp_name is not None) and os.path.isfile(tmp_name):
+			os.remove(tmp_name)
+
+
+def matrix_projectors(A, nr_cols, nr_angles):
+	"""Forward/back projector pair (see kst_iterative.sirt) based on the
+	system matrix A of one slice, applied to all the slices at once. Volumes
+	are organized as [voxels,slices] (i.e. a flattened [x,y,z] volume) and the
+	matrix rows of each subset of angles are extracted only once.
+
+	"""
+	rows = arange(nr_angles * nr_cols).reshape(nr_angles, nr_cols)
+	subsets = {}
+
+	def _matrix(sl):
+		key = sl.indices(nr_angles)
+		if key == (0, nr_angles, 1):
+			return A
+		if key not in subsets:
+			subsets[key] = A[rows[sl].ravel()]
+		return subsets[key]
+
+	def forward(vol, sl, out):
+		sino = _matrix(sl).dot(vol)
+		out[:] = sino.reshape(out.shape[2], nr_cols, out.shape[0]).transpose(2, 1, 0)
+
+	def back(p, sl, out):
+		sino = p.transpose(2, 1, 0).reshape(-1, p.shape[0])
+		out += _matrix(sl).T.dot(sino)
+
+	return forward, back
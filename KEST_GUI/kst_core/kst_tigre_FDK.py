@@ -7,15 +7,47 @@ import scipy.io
 import os
 import sys
 import math
-import numpy as np
+import hashlib
 import copy
+import json
+import threading
+import numpy as np
+
+# Compiled (CUDA) backprojector is optional, the portable CPU one is used as
+# a fallback:
+try:
+	from _tigre_FDK import tigre_FDK
+except ImportError:
+	tigre_FDK = None
+
+# Available memory is used (if known) to size the slabs of FDK_slabs:
+try:
+	import psutil
+except ImportError:
+	psutil = None
+
+from . import kst_backprojection
+from . import kst_fft
 
-from pyfftw import n_byte_align, simd_alignment
-from pyfftw.interfaces.numpy_fft import rfft, irfft
+# Maximum number of elements of the (padded) buffer filtered by each FFT:
+FILTER_BLOCK_ELEMENTS = 2 ** 23
 
-#from _tigre_FDK import tigre_FDK
+# Cached frequency responses of the filters (one for each padded length,
+# filter and pixel size):
+_filter_kernels = {}
 
-from tifffile import imread, imsave
+# Memoized tables of the geometries (shared by equal geometries, e.g. by the
+# scans of a series), least recently used first:
+_geometry_tables = {}
+_geometry_lock = threading.Lock()
+
+# Maximum number of memoized geometry tables:
+GEOMETRY_TABLES = 64
+
+# Memory budget of FDK_slabs (fraction of the available memory, or bytes if
+# the available memory is unknown):
+SLAB_MEMORY_FRACTION = 0.5
+SLAB_MEMORY_DEFAULT = 2 ** 31
 
 class Geometry:
 
@@ -42,32 +74,124 @@ class Geometry:
 		self.mode = geom
 		self.filter = None
 
+	def key(self):
+		"""Hashable tuple of all the parameters (equal for equal geometries).
+		"""
+		return (float(self.DSD), float(self.DSO), tuple(int(v) for v in self.nDetector), \
+			tuple(float(v) for v in self.dDetector), tuple(int(v) for v in self.nVoxel), \
+			tuple(float(v) for v in self.dVoxel), tuple(float(v) for v in self.offOrigin), \
+			tuple(float(v) for v in self.offDetector), float(self.accuracy), self.mode, self.filter)
+
+	def __eq__(self, other):
+		return isinstance(other, Geometry) and (self.key() == other.key())
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+	def __hash__(self):
+		return hash(self.key())
+
+	def table(self, name, build, *args):
+		"""Get (or build as build(self, *args) and memoize) the read-only 
+		table of the specified name and arguments. Tables are kept at module
+		level (the object itself stays small and picklable for the worker 
+		processes) and keyed by the parameters, so a geometry modified after
+		its construction (e.g. a sub-geometry) never gets stale tables.
+		"""
+		key = (self.key(), name) + tuple(args)
+
+		with _geometry_lock:
+			table = _geometry_tables.pop(key, None)
+		if table is None:
+			table = build(self, *args)
+			for a in (table if isinstance(table, tuple) else (table,)):
+				if isinstance(a, np.ndarray):
+					a.flags.writeable = False
+
+		with _geometry_lock:
+			_geometry_tables[key] = table
+			while len(_geometry_tables) > GEOMETRY_TABLES:
+				del _geometry_tables[next(iter(_geometry_tables))]
+
+		return table
+
+	def detector_grid(self):
+		"""Coordinates [mm] (u along the columns, v along the rows) of the
+		centers of the detector pixels, offsets included (memoized).
+		"""
+		return self.table('detector_grid', _detector_grid)
+
+	def to_dict(self):
+		"""Parameters as a JSON serializable dictionary.
+		"""
+		return dict((k, v.tolist() if isinstance(v, (np.ndarray, np.generic)) else v) \
+			for k, v in vars(self).items())
+
+	@classmethod
+	def from_dict(cls, d):
+		"""Geometry with the parameters of the dictionary (see to_dict).
+		"""
+		geo = cls.__new__(cls)
+		for k, v in d.items():
+			setattr(geo, k, np.array(v) if isinstance(v, list) else v)
+		return geo
+
+	def save(self, filename):
+		"""Write the parameters to a JSON file.
+		"""
+		with open(filename, 'w') as f:
+			json.dump(self.to_dict(), f, indent=1)
+
+	@classmethod
+	def load(cls, filename):
+		"""Read a geometry from a JSON file (see save).
+		"""
+		with open(filename) as f:
+			return cls.from_dict(json.load(f))
+
+
+def _detector_grid(geo):
+	u = (np.arange(geo.nDetector[0]) - (geo.nDetector[0] - 1) / 2) * geo.dDetector[0] + geo.offDetector[0]
+	v = (np.arange(geo.nDetector[1]) - (geo.nDetector[1] - 1) / 2) * geo.dDetector[1] + geo.offDetector[1]
+	return u, v
+
+
+def parker_weights(geo,angles,q=1.0):
+	"""Get (or compute and memoize in the geometry) the read-only table 
+	[angles,detector columns] of the Parker weights for a short scan, computed
+	in a single vectorised pass (angles are relative to the first one).
+	"""
+	angles = np.asarray(angles, dtype=np.float64)
+	digest = hashlib.sha1(angles.tobytes()).hexdigest()
+
+	return geo.table(('parker_weights', digest), lambda geo, q: _parker_weights(geo, angles, q), \
+		float(q))
+
 
-def parkerweight(proj,geo,angles,q):
+def _parker_weights(geo, angles, q):
 	start = -geo.sDetector[0] / 2 + geo.dDetector[0] / 2
-	stop = geo.sDetector[0] / 2 - geo.dDetector[0] / 2
 	step = geo.dDetector[0]
-	alpha = np.arctan(np.arange(start, stop + step, step) / geo.DSD)
+	alpha = np.arctan((start + np.arange(int(geo.nDetector[0])) * step) / geo.DSD)
 	alpha = -alpha
 	delta = abs(alpha[0] - alpha[-1]) / 2
-	totangles = np.cumsum(np.diff(angles))
-	totangles = totangles[-1]
+	totangles = angles[-1] - angles[0]
 
-	if totangles < 2 * np.pi:
+	if totangles >= 2 * np.pi:
 		warnings.warn('Computing Parker weigths for scanning angle equal or bigger than 2*pi '
 			  'Consider disabling Parker weigths.')
 	if totangles < np.pi + 2 * delta:
 		warnings.warn('Scanning angles smaller than pi+cone_angle. This is limited angle tomgraphy, \n'
 					  'there is nosufficient data, thus weigthing for data redundancy is not required.')
 	epsilon = max(totangles - (np.pi + 2 * delta),0)
-	data = proj
-	# for i in range(proj.shape[0]):
-	for i in range(33):
-		beta = angles[i]
-		w = 0.5 * (s_function(beta / b_subf(alpha,delta,epsilon,q) - 0.5) + s_function((beta - 2 * delta + 2 * alpha - epsilon) / b_subf(alpha,delta,epsilon,q) + 0.5) - s_function((beta - np.pi + 2 * alpha) / b_subf(-alpha,delta,epsilon,q) - 0.5) - s_function((beta - np.pi - 2 * delta - epsilon) / b_subf(-alpha,delta,epsilon,q) + 0.5))
-		proj[i]*=w
 
-	return proj
+	# Whole table by broadcasting angles (rows) against columns:
+	beta = (angles - angles[0])[:,np.newaxis]
+	alpha = alpha[np.newaxis,:]
+	b_pos = b_subf(alpha,delta,epsilon,q)
+	b_neg = b_subf(-alpha,delta,epsilon,q)
+	w = 0.5 * (s_function(beta / b_pos - 0.5) + s_function((beta - 2 * delta + 2 * alpha - epsilon) / b_pos + 0.5) - \
+		s_function((beta - np.pi + 2 * alpha) / b_neg - 0.5) - s_function((beta - np.pi - 2 * delta - epsilon) / b_neg + 0.5))
+	return w.astype(np.float32)
 
 def s_function(abeta):
 	w = np.zeros(abeta.shape)
@@ -85,44 +209,100 @@ def b_subf(alpha,delta,epsilon,q):
 	return q * b_function(alpha,delta,epsilon)
 
 
-def filtering(proj,geo,angles,parker):
+def filtering(proj,geo,angles,parker,step=None,padding=0):
+	"""Ramp filtering (in place) of proj [cols,rows,angles]. With padding the
+	projections are virtually extended by replicating the first and last 
+	column padding times on each side (overpadding of truncated data) within 
+	the zero-padded FFT buffer, i.e. no padded copy of proj is made.
+	"""
+	# Short scan weights (applied in the FFT buffer):
+	weights = parker_weights(geo,angles,float(parker)) if parker else None
 
-	if parker:
-		proj = parkerweight(proj.transpose(0,2,1),geo,angles,parker).transpose(0,2,1)
-		# proj=parkerweight(proj,geo,angles,parker)
+	nr_cols, nr_rows, nr_angles = proj.shape
+	padding = int(padding)
+	filt_len = max(64,2 ** nextpow2(2 * (geo.nDetector[0] + 2 * padding)))
 
-	filt_len = max(64,2 ** nextpow2(2 * geo.nDetector[0]))
-	ramp_kernel = ramp_flat(filt_len)
+	# Angular step (Parker weights already normalize the redundant rays of a
+	# short scan, otherwise a full scan is assumed). A subset of the angles
+	# (e.g. streaming) needs the step of the whole scan:
+	if step is not None:
+		pass
+	elif parker and (len(angles) > 1):
+		step = abs(float(angles[1]) - float(angles[0]))
+	else:
+		step = (2 * np.pi / len(angles)) / 2
+
+	# Cached filter with the remaining scaling of the backprojection:
+	filt = filter_kernel(filt_len, geo.filter, geo.dDetector[0]) * np.float32( \
+		step * (geo.DSD / geo.DSO))
+
+	# Cached plans and aligned buffers for a block of detector lines [lines,padded
+	# cols]. The number of lines is a power of two (up to FILTER_BLOCK_ELEMENTS)
+	# regardless of the rows and angles of proj, so that slabs and streamed 
+	# subsets of any size reuse the same few plans:
+	nr_lines = max(nr_rows, min(FILTER_BLOCK_ELEMENTS // filt_len, \
+		2 ** nextpow2(nr_rows * nr_angles)))
+	fwd, inv = kst_fft.rfft_plans((nr_lines, filt_len), (1,))
+	batch_size = nr_lines // nr_rows
+	spectrum = fwd.output_array
+	c0 = int(filt_len / 2 - geo.nDetector[0] / 2)
+
+	for i in range(0, nr_angles, batch_size):
+		n = min(batch_size, nr_angles - i)
+		buf = fwd.input_array[:n * nr_rows].reshape(n, nr_rows, filt_len)
+
+		# Zero-padding (the tail of a partial block is just ignored):
+		buf[:, :, :c0] = 0
+		buf[:, :, c0 + nr_cols:] = 0
+		buf[:, :, c0:c0 + nr_cols] = proj[:, :, i:i + n].transpose(2, 1, 0)
+		if weights is not None:
+			buf[:, :, c0:c0 + nr_cols] *= weights[i:i + n, np.newaxis, :]
+
+		# Edge extension (virtual overpadding):
+		if (padding > 0):
+			buf[:, :, c0 - padding:c0] = buf[:, :, c0:c0 + 1]
+			buf[:, :, c0 + nr_cols:c0 + nr_cols + padding] = buf[:, :, c0 + nr_cols - 1:c0 + nr_cols]
 
-	d = 1
-	filt = filter(geo.filter,ramp_kernel[0],filt_len,d)
+		# Filter:
+		fwd()
+		spectrum *= filt
+		inv()
 
-	filt = np.kron(np.ones((geo.nDetector[1],1)),filt).transpose()    
+		# Crop:
+		proj[:, :, i:i + n] = buf[:, :, c0:c0 + nr_cols].transpose(2, 1, 0)
 
-	for i in range(len(angles)):
+	return proj
 
-        # Zero-padding:
-		fproj = np.zeros((filt_len,geo.nDetector[1]),dtype=np.float32)
-		fproj[int(filt_len / 2 - geo.nDetector[0] / 2):int(filt_len / 2 + geo.nDetector[0] / 2),:] = proj[:,:,i]   
+def cosine_weights(geo):
+	"""FDK (cosine) weights [rows,cols] of the detector pixels (read-only,
+	memoized in the geometry).
+	"""
+	return geo.table('cosine_weights', _cosine_weights)
 
-		# Fourier-transform:
-		n_byte_align(fproj, simd_alignment) 
-		fproj = rfft(fproj, axis=0, threads=2)
+def _cosine_weights(geo):
+	xv, yv = geo.detector_grid()
+	(xx, yy) = np.meshgrid(xv, yv)
 
-		# Filter:
-		fproj = fproj * filt[0:fproj.shape[0],:]
+	return (geo.DSD / np.sqrt((geo.DSD ** 2 + xx ** 2 + yy ** 2))).astype(np.float32)
 
-        # Inverse-Fourier:
-		n_byte_align(fproj, simd_alignment) 
-		fproj = np.real(irfft(fproj, axis=0, threads=2))
-		end = len(fproj)
+def filter_kernel(filt_len, filter_name, pixel_size):
+	"""Get (or compute and cache) the read-only frequency response (half
+	spectrum, ready for broadcasting along the padded detector rows) of the 
+	specified filter, including the 1/(2 * pixel_size) scaling.
+	"""
+	key = (int(filt_len), filter_name, float(pixel_size))
 
-		# Crop:
-		fproj = fproj[int(end / 2 - geo.nDetector[0] / 2):int(end / 2 + geo.nDetector[0] / 2),:] / 2 / geo.dDetector[0] * \
-				 (2 * np.pi / len(angles)) / 2 * (geo.DSD / geo.DSO)
-		proj[:,:,i] = fproj.astype(np.float32)
+	if key not in _filter_kernels:
+		ramp_kernel = ramp_flat(filt_len)
 
-	return proj
+		d = 1
+		filt = filter(filter_name,ramp_kernel[0],filt_len,d)
+		filt = (filt[:filt_len // 2 + 1] / 2 / pixel_size).astype(np.float32)
+		filt.flags.writeable = False
+
+		_filter_kernels[key] = filt
+
+	return _filter_kernels[key]
 
 def ramp_flat(n):
 	nn = np.arange(-n / 2,n / 2)
@@ -167,11 +347,57 @@ def nextpow2(n):
 
 
 def FDK(proj_in, ssd, sdd, px, offset_u=0.0, offset_v=0.0, roll_deg=0.0, pitch_deg=0.0, \
-		yaw_deg=0.0, filter='ram-lak', tot_angles=2*math.pi, angles_shift=0, geom='cone'):
+		yaw_deg=0.0, filter='ram-lak', tot_angles=2*math.pi, angles_shift=0, geom='cone', \
+		backend='auto', inplace=False, short_scan=False, roi=None, fov=False, progressive=1, \
+		callback=None, padding=0):
 	"""
+	backend: 'tigre' (compiled backprojector), 'cpu' (portable multi-threaded
+	backprojector) or 'auto' (the compiled one if available).
+
+	inplace: if True a float32 proj_in is used as working buffer (weighted and
+	filtered in place, i.e. the caller's data are overwritten), otherwise a 
+	single float32 copy is made and proj_in is left untouched.
+
+	short_scan: apply Parker weights (scan of 180 deg plus the fan angle).
+
+	roi: region of interest (x, y, z) of the volume, see 
+	kst_backprojection.roi_ranges. Only its voxels and the detector rows they
+	need are processed (see FDK_slabs).
+
+	fov: zero the voxels outside the field of view (the CPU backprojector
+	does not visit them at all).
 
+	progressive: number of interleaved subsets of angles (e.g. 8 for every
+	8th projection) filtered and backprojected coarse-to-fine into the same
+	volume (see FDK_progressive). Ignored with a roi.
+
+	callback: callback(rec, fraction) called with the preview after each
+	subset but the last one (progressive only).
+
+	padding: number of detector columns virtually added on each side by 
+	replicating the edge ones (overpadding of laterally truncated data, see 
+	filtering). The volume is not enlarged.
+
+	proj_in can be a list of channels sharing the geometry (e.g. low and 
+	high energy): the CPU backprojector computes the detector coordinates 
+	and weights once for all of them. A list of volumes is returned.
 	"""
-	proj = copy.deepcopy(proj_in)
+	cpu = (backend == 'cpu') or ((backend == 'auto') and (tigre_FDK is None))
+
+	# Channels are reconstructed one after the other if not jointly:
+	channels = isinstance(proj_in, (list, tuple))
+	if channels and ((roi is not None) or (progressive > 1) or not (cpu)):
+		return [FDK(p, ssd, sdd, px, offset_u, offset_v, roll_deg, pitch_deg, yaw_deg, filter, \
+			tot_angles, angles_shift, geom, backend, inplace, short_scan, roi, fov, progressive, \
+			callback, padding) for p in proj_in]
+
+	if roi is not None:
+		return FDK_slabs(proj_in, ssd, sdd, px, offset_u, offset_v, roll_deg, pitch_deg, yaw_deg, \
+			filter, tot_angles, angles_shift, short_scan, roi=roi, fov=fov, padding=padding)
+
+	# The only copy of the projections (if any):
+	projs = [p.astype(np.float32, copy=not inplace) for p in (proj_in if channels else [proj_in])]
+	proj = projs[0]
 	nr_proj = proj.shape[2]
 	ang_range = np.linspace(0 + angles_shift, tot_angles + angles_shift, nr_proj, False).astype(np.float32)   
 
@@ -182,25 +408,311 @@ def FDK(proj_in, ssd, sdd, px, offset_u=0.0, offset_v=0.0, roll_deg=0.0, pitch_d
 		geo.filter = filter
 
 	# Apply weights (offsets are constants...  out of the loop):
-	xv = np.arange((-geo.nDetector[0] / 2) + 0.5, 1 + (geo.nDetector[0] / 2) - 0.5) * geo.dDetector[0] + geo.offDetector[0]
-	yv = np.arange((-geo.nDetector[1] / 2) + 0.5, 1 + (geo.nDetector[1] / 2) - 0.5) * geo.dDetector[1] + geo.offDetector[1]
-	(xx, yy) = np.meshgrid(xv, yv)
-	w = geo.DSD / np.sqrt((geo.DSD ** 2 + xx ** 2 + yy ** 2))
+	for proj in projs:
+		proj *= cosine_weights(geo)[:,:,np.newaxis]
 
-	for ii in range(len(ang_range)):		
-		proj_in[:,:,ii] = proj_in[:,:,ii] * w
+	# Coarse-to-fine reconstruction:
+	if (progressive > 1):
+		return FDK_progressive(proj, geo, ang_range, (roll_deg, pitch_deg, yaw_deg), short_scan, \
+			progressive, callback, backend, fov, padding)
 
-	# Filtering:    
-	proj = proj.transpose(1,0,2)
-	proj = filtering(proj, geo, ang_range, parker=False)
-	proj = proj.transpose(1,0,2)	
+	# Filtering (in place, on a [cols,rows,angles] view):    
+	for proj in projs:
+		filtering(proj.transpose(1,0,2), geo, ang_range, parker=short_scan, padding=padding)
 	
-    # Backproject (one week of debug... please remember...):
+	if (cpu):
+		rec = kst_backprojection.backproject_cone(projs if (channels) else proj, geo, ang_range, \
+			roll_deg, pitch_deg, yaw_deg, fov=fov)
+
+	else:
+		rec = _backproject_tigre(proj, geo, ang_range, roll_deg, pitch_deg, yaw_deg)
+
+		if (fov):
+			_fov_mask(rec, geo)
+
+	return rec
+
+
+def _backproject_tigre(proj, geo, angles, roll_deg, pitch_deg, yaw_deg):
+	"""Compiled (TIGRE) FDK backprojection of the filtered proj [rows,cols,angles].
+	"""
+	ssd, sdd, px = geo.DSO, geo.DSD - geo.DSO, geo.dDetector[0]
+
+	# Backproject (one week of debug... please remember...):
 	shp = np.array([proj.shape[0],proj.shape[1],proj.shape[2]]) # For further reshape    		
-	proj = np.asfortranarray(proj.transpose(2,0,1), dtype=np.float32).flatten()	# Note the flattening
-	rec = tigre_FDK(proj, shp, 1, 0, ssd, sdd, px, offset_u, offset_v, roll_deg, pitch_deg, yaw_deg, ang_range) 	
-	rec = np.reshape(rec, geo.nVoxel, order='F') # 1-D output
+	proj = proj.transpose(1,0,2).ravel(order='F')	# Same as asfortranarray(transpose(2,0,1)).flatten(), one copy
+	rec = tigre_FDK(proj, shp, 1, 0, ssd, sdd, px, geo.offDetector[0] / px, geo.offDetector[1] / px, \
+		roll_deg, pitch_deg, yaw_deg, angles)
+	return np.reshape(rec, geo.nVoxel, order='F') # 1-D output
+
+
+def _fov_mask(rec, geo):
+	"""Zero (in place) the voxels of rec outside the cone-beam field of view.
+	"""
+	vx, vy, vz = [(np.arange(n) - (n - 1) / 2) * d for n, d in zip(geo.nVoxel, geo.dVoxel)]
+	kst_backprojection.fov_mask(rec, kst_backprojection.fov_radius_cone(geo, vz), vx, vy)
+
+
+def FDK_progressive(proj, geo, angles, tilt, short_scan=False, decimation=8, callback=None, \
+					backend='auto', fov=False, padding=0):
+	"""Coarse-to-fine FDK of the cosine weighted proj [rows,cols,angles] (used
+	as working buffer): the interleaved subsets of angles (every decimation-th
+	projection, see kst_backprojection.interleaved_subsets) are filtered and
+	backprojected one after the other into the same volume. Filter and Parker
+	weights are the ones of the whole scan, so that each projection is 
+	processed once and the final volume is the full FDK reconstruction. The
+	previews are rescaled to the whole number of projections.
+
+	Parameters
+	----------
+	proj : array_like
+		Cosine weighted projections as numpy array organized as [rows,cols,angles].
+
+	geo : Geometry
+		Geometry of the acquisition.
 
+	angles : array_like [radians]
+		Angle of each projection.
+
+	tilt : tuple
+		Detector (roll, pitch, yaw) in degrees.
+
+	short_scan : bool
+		Apply Parker weights.
+
+	decimation : int
+		Number of interleaved subsets (angular step of the first preview).
+
+	callback : function
+		callback(rec, fraction) called after each subset but the last one 
+		with the (rescaled copy of the) preview volume and the fraction of 
+		projections already backprojected.
+
+	backend : string
+		'tigre', 'cpu' or 'auto' (see FDK).
+
+	fov : bool
+		Zero the voxels outside the field of view.
+
+	padding : int
+		Virtual edge padding of the detector columns (see filtering).
+
+	Return
+	----------
+	rec : array_like
+		Reconstructed volume as numpy array organized as geo.nVoxel [x,y,z].
+
+	"""
+	nr_proj = proj.shape[2]
+	cpu = (backend == 'cpu') or ((backend == 'auto') and (tigre_FDK is None))
+
+	# Parker weights and angular step of the whole scan (a subset has its own
+	# first angle and spacing):
+	if (short_scan):
+		proj *= parker_weights(geo, angles).T[np.newaxis, :, :]
+	if short_scan and (nr_proj > 1):
+		step = abs(float(angles[1]) - float(angles[0]))
+	else:
+		step = (2 * np.pi / nr_proj) / 2
+
+	rec = np.zeros(geo.nVoxel, dtype=np.float32)
+	subsets = kst_backprojection.interleaved_subsets(min(decimation, nr_proj))
+	count = 0
+
+	for m, k in enumerate(subsets):
+		sub = proj[:, :, k::len(subsets)]
+		ang = angles[k::len(subsets)]
+
+		# Filter (in place on the strided view) and accumulate:
+		filtering(sub.transpose(1,0,2), geo, ang, False, step=step, padding=padding)
+		if (cpu):
+			kst_backprojection.backproject_cone(sub, geo, ang, *tilt, fov=fov, out=rec)
+		else:
+			rec += _backproject_tigre(sub, geo, ang, *tilt)
+		count += sub.shape[2]
+
+		# Preview with the weights corrected for the missing projections:
+		if (callback is not None) and (m < len(subsets) - 1):
+			preview = rec * np.float32(nr_proj / count)
+			if (fov) and not (cpu):
+				_fov_mask(preview, geo)
+			callback(preview, count / nr_proj)
+
+	if (fov) and not (cpu):
+		_fov_mask(rec, geo)
 
 	return rec
 
+
+
+def _roi_geometry(geo, x0, x1, y0, y1):
+	"""Geometry of the in-plane region of interest x0:x1, y0:y1 of the
+	volume (same coordinates as in the full geometry).
+	"""
+	sub = copy.copy(geo)
+	nx, ny = int(geo.nVoxel[0]), int(geo.nVoxel[1])
+
+	sub.nVoxel = np.array((x1 - x0, y1 - y0, geo.nVoxel[2]))
+	sub.sVoxel = sub.nVoxel * geo.dVoxel
+	sub.offOrigin = np.array((geo.offOrigin[0] + ((x0 + x1 - 1) / 2 - (nx - 1) / 2) * geo.dVoxel[0], \
+		geo.offOrigin[1] + ((y0 + y1 - 1) / 2 - (ny - 1) / 2) * geo.dVoxel[1], geo.offOrigin[2]))
+
+	return sub
+
+
+def _sub_geometry(geo, z0, z1, r0, r1):
+	"""Geometry of the slices z0:z1 of the volume seen by the detector rows
+	r0:r1 (same coordinates as in the full geometry).
+	"""
+	sub = copy.copy(geo)
+	nz, nv = int(geo.nVoxel[2]), int(geo.nDetector[1])
+
+	sub.nVoxel = np.array((geo.nVoxel[0], geo.nVoxel[1], z1 - z0))
+	sub.sVoxel = sub.nVoxel * geo.dVoxel
+	sub.offOrigin = np.array((geo.offOrigin[0], geo.offOrigin[1], \
+		geo.offOrigin[2] + ((z0 + z1 - 1) / 2 - (nz - 1) / 2) * geo.dVoxel[2]))
+
+	sub.nDetector = np.array((geo.nDetector[0], r1 - r0))
+	sub.sDetector = sub.nDetector * geo.dDetector
+	sub.offDetector = np.array((geo.offDetector[0], \
+		geo.offDetector[1] + ((r0 + r1 - 1) / 2 - (nv - 1) / 2) * geo.dDetector[1]))
+
+	return sub
+
+
+def _slab_size(geo, angles, tilt, budget, nr_threads, runs):
+	"""Largest number of slices per slab (of the specified runs of slices)
+	whose working memory (volume slab, needed rows of the projections and 
+	backprojection temporaries) fits the budget [bytes].
+	"""
+	nr_vox = int(geo.nVoxel[0]) * int(geo.nVoxel[1])
+	row_bytes = 4 * int(geo.nDetector[0]) * len(angles)
+	fixed = 4 * 4 * nr_threads * kst_backprojection.SLAB_ELEMENTS
+
+	slab = max(b - a for a, b in runs)
+	while (slab > 1):
+		rows = max(r1 - r0 for a, b in runs for r0, r1 in (kst_backprojection.cone_rows(geo, \
+			angles, z0, min(b, z0 + slab), *tilt) for z0 in range(a, b, slab)))
+		if (fixed + 2 * 4 * nr_vox * slab + 2 * row_bytes * rows <= budget):
+			break
+		slab = slab // 2
+
+	return slab
+
+
+def FDK_slabs(proj_in, ssd, sdd, px, offset_u=0.0, offset_v=0.0, roll_deg=0.0, pitch_deg=0.0, \
+		yaw_deg=0.0, filter='ram-lak', tot_angles=2*math.pi, angles_shift=0, short_scan=False, \
+		upsampling=1, out=None, memory=None, nr_threads=None, roi=None, fov=False, padding=0):
+	"""FDK with bounded memory (portable CPU backprojector): the volume is 
+	reconstructed by z-slabs and, for each slab, only the detector rows seen
+	by its voxels are read, weighted, filtered and backprojected (rows shared
+	with the previous slab are filtered once).
+
+	Parameters
+	----------
+	proj_in : array_like
+		Projections organized as [rows,cols,angles]: a numpy array or any 
+		array supporting slicing along the rows (e.g. a h5py dataset or a 
+		numpy memmap). It is never modified.
+
+	ssd, sdd, px, offset_u, offset_v, roll_deg, pitch_deg, yaw_deg, filter,
+	tot_angles, angles_shift, short_scan : see FDK.
+
+	upsampling : int
+		Number of voxels per detector pixel along each axis (the volume has
+		upsampling^3 times the voxels of the default one).
+
+	out : array_like
+		Output organized as [x,y,z] (e.g. a h5py dataset or a numpy memmap)
+		with shape [cols,cols,rows] times upsampling (or the shape of the 
+		region of interest). If None, a numpy array is allocated.
+
+	memory : int [bytes]
+		Working memory budget (default: a fraction of the available memory).
+
+	nr_threads : int
+		Number of parallel threads of the backprojection (default: all the 
+		cores).
+
+	roi : tuple
+		Region of interest (x, y, z) of the (upsampled) volume, see 
+		kst_backprojection.roi_ranges. The selected slices are stacked along
+		z in the output.
+
+	fov : bool
+		Skip (and zero in the output) the voxels outside the field of view.
+
+	padding : int
+		Virtual edge padding of the detector columns (see filtering).
+
+	Return
+	----------
+	out : array_like
+		Reconstructed volume.
+
+	"""
+	nr_threads = os.cpu_count() if nr_threads is None else nr_threads
+	nr_proj = proj_in.shape[2]
+	ang_range = np.linspace(0 + angles_shift, tot_angles + angles_shift, nr_proj, False).astype(np.float32)
+	tilt = (roll_deg, pitch_deg, yaw_deg)
+
+	# Geometry of the (upsampled) volume:
+	geo = Geometry(proj_in.shape, ssd, sdd, px, offset_u, offset_v, 'cone', filter)
+	geo.filter = filter
+	geo.nVoxel = geo.nVoxel * int(upsampling)
+	geo.dVoxel = geo.sVoxel / geo.nVoxel
+
+	# Region of interest:
+	(x0, x1), (y0, y1), runs = kst_backprojection.roi_ranges(roi, geo.nVoxel)
+	geo = _roi_geometry(geo, x0, x1, y0, y1)
+
+	if (out is None):
+		out = np.empty((x1 - x0, y1 - y0, sum(b - a for a, b in runs)), dtype=np.float32)
+
+	# Slab size from the available memory:
+	if (memory is None):
+		if psutil is not None:
+			memory = int(psutil.virtual_memory().available * SLAB_MEMORY_FRACTION)
+		else:
+			memory = SLAB_MEMORY_DEFAULT
+	slab = _slab_size(geo, ang_range, tilt, memory, nr_threads, runs)
+
+	# Filtered rows of the previous slab:
+	f0, f1, filtered = 0, 0, None
+
+	# Slabs of each run of slices and their position in the output:
+	slabs, o = [], 0
+	for a, b in runs:
+		for z0 in range(a, b, slab):
+			slabs.append((z0, min(b, z0 + slab), o))
+			o += min(b, z0 + slab) - z0
+
+	for z0, z1, o in slabs:
+		r0, r1 = kst_backprojection.cone_rows(geo, ang_range, z0, z1, *tilt)
+
+		if (r1 == r0):
+			out[:, :, o:o + z1 - z0] = 0
+			continue
+
+		# Needed rows (the ones already filtered are reused):
+		rows = np.empty((r1 - r0, proj_in.shape[1], nr_proj), dtype=np.float32)
+		for a, b in ((r0, min(r1, f0)), (max(r0, f1), r1), (max(r0, f0), min(r1, f1))):
+			if (b <= a):
+				continue
+			if (filtered is not None) and (a >= f0) and (b <= f1):
+				rows[a - r0:b - r0] = filtered[a - f0:b - f0]
+			else:
+				block = np.array(proj_in[a:b], dtype=np.float32)
+				sub = _sub_geometry(geo, 0, int(geo.nVoxel[2]), a, b)
+				block *= cosine_weights(sub)[:, :, np.newaxis]
+				filtering(block.transpose(1, 0, 2), sub, ang_range, parker=short_scan, padding=padding)
+				rows[a - r0:b - r0] = block
+
+		f0, f1, filtered = r0, r1, rows
+
+		# Backproject the slab:
+		sub = _sub_geometry(geo, z0, z1, r0, r1)
+		out[:, :, o:o + z1 - z0] = kst_backprojection.backproject_cone(rows, sub, ang_range, *tilt, \
+			nr_threads=nr_threads, fov=fov)
+
+	return out
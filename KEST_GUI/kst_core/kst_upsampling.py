@@ -0,0 +1,156 @@
+from numpy import float32, empty, empty_like, asarray, arange, clip, abs as npabs, pi, inf
+from numpy import floor, full, less, copyto
+from scipy.ndimage import uniform_filter1d
+from math import ceil
+
+# Number of elements of the input processed at once (block of sinograms):
+UPSAMPLING_BLOCK_ELEMENTS = 2 ** 22
+
+# Largest displacement [pixels per angular step] searched by the sinogram
+# aware interpolation:
+UPSAMPLING_MAX_SHIFT = 8
+
+# Matching window [columns, angular steps] and penalty (relative to the mean
+# value, per pixel of displacement) of the sinogram aware interpolation:
+UPSAMPLING_WINDOW = (9, 3)
+UPSAMPLING_PENALTY = 0.05
+
+
+def upsample_angles(proj, factor=2, tot_angles=2*pi, method='linear', parallel=False, \
+					offset_u=0.0, max_shift=None):
+	"""Angular upsampling of a sparse scan: factor - 1 projections are
+	interpolated between each pair of consecutive ones, so that the output
+	covers the same tot_angles with factor times the angular sampling (the
+	original projections are kept at indices multiple of factor). Sinograms
+	are processed in blocks.
+
+	Parameters
+	----------
+	proj : array_like
+		Projections as numpy array organized as [rows,cols,angles].
+
+	factor : int
+		Upsampling factor along the angles.
+
+	tot_angles : double [radians]
+		Angular range of the scan (e.g. 2*pi for a full scan: the last
+		projection is interpolated with the first one).
+
+	method : string
+		"linear" (along the angles) or "sinogram" (along the local direction
+		of the sinusoidal trajectories, i.e. for each pixel the displacement
+		between the two projections that best matches them is searched, 
+		slightly penalized so that the linear interpolation is kept where 
+		the data do not suggest otherwise).
+
+	parallel : bool
+		Parallel-beam data: a half scan (180 deg) wraps to the first
+		projection mirrored about the rotation axis.
+
+	offset_u : double [pixel]
+		Horizontal detector offset (i.e. center of rotation offset), used
+		for the mirrored wrap only.
+
+	max_shift : int [pixels]
+		Largest displacement per angular step searched by the "sinogram"
+		method (default: the one of the edge of the field of view, at most
+		UPSAMPLING_MAX_SHIFT).
+
+	Return
+	----------
+	out : array_like
+		Upsampled projections [rows,cols,factor*angles] (float32).
+
+	"""
+	if method not in ('linear', 'sinogram'):
+		raise ValueError('upsampling method not recognised: ' + str(method))
+
+	factor = int(factor)
+	nv, nu, nr_angles = proj.shape
+	out = empty((nv, nu, factor * nr_angles), dtype=float32)
+	step = tot_angles / nr_angles
+
+	# The projection following the last one:
+	if abs(tot_angles - 2 * pi) < step / 2:
+		wrap = 'periodic'
+	elif (parallel) and (abs(tot_angles - pi) < step / 2):
+		wrap = 'mirror'
+	else:
+		wrap = None
+
+	if (max_shift is None):
+		max_shift = min(UPSAMPLING_MAX_SHIFT, int(ceil(nu / 2 * step)))
+
+	block = max(1, UPSAMPLING_BLOCK_ELEMENTS // (nu * nr_angles))
+	for r0 in range(0, nv, block):
+		r1 = min(nv, r0 + block)
+		prev = asarray(proj[r0:r1], dtype=float32)
+
+		# Next projection of each one:
+		nxt = empty_like(prev)
+		nxt[:, :, :-1] = prev[:, :, 1:]
+		if (wrap == 'periodic'):
+			nxt[:, :, -1] = prev[:, :, 0]
+		elif (wrap == 'mirror'):
+			nxt[:, :, -1] = _shift(prev[:, :, 0], arange(nu, dtype=float32)[::-1] - \
+				2 * offset_u - arange(nu))
+		else:
+			nxt[:, :, -1] = prev[:, :, -1]
+
+		out[r0:r1, :, ::factor] = prev
+		for j in range(1, factor):
+			t = j / factor
+			if (method == 'linear'):
+				out[r0:r1, :, j::factor] = prev + float32(t) * (nxt - prev)
+			else:
+				out[r0:r1, :, j::factor] = _directional(prev, nxt, j, factor, max_shift)
+
+	return out
+
+
+def _shift(x, s):
+	"""Samples x(u + s) along the columns (axis 1) of x, with linear
+	interpolation and replicated edges (s is a scalar or an array of
+	shifts, one for each column).
+	"""
+	nu = x.shape[1]
+	u = arange(nu) + s
+	i = floor(u)
+	w = (u - i).astype(float32)
+	i0 = clip(i, 0, nu - 1).astype(int)
+	i1 = clip(i + 1, 0, nu - 1).astype(int)
+	if (x.ndim == 3):
+		w = w[:, None]
+
+	return x[:, i0] * (1 - w) + x[:, i1] * w
+
+
+def _directional(prev, nxt, j, factor, max_shift):
+	"""Interpolation at the fraction t = j / factor between prev and nxt 
+	[rows,cols,angles] along the displacement d = k * factor (pixels per
+	angular step, i.e. integer shifts of both, up to max_shift) that best 
+	matches prev(u - t*d) with nxt(u + (1-t)*d) within UPSAMPLING_WINDOW.
+	Small displacements are preferred on ties.
+	"""
+	t = j / factor
+	nu = prev.shape[1]
+	u = arange(nu)
+	best = full(prev.shape, inf, dtype=float32)
+	out = empty_like(prev)
+	penalty = float32(UPSAMPLING_PENALTY * npabs(prev).mean())
+
+	k_max = int(ceil(max_shift / factor))
+	for k in sorted(range(-k_max, k_max + 1), key=abs):
+		a = prev.take(clip(u - j * k, 0, nu - 1), axis=1)
+		b = nxt.take(clip(u + (factor - j) * k, 0, nu - 1), axis=1)
+
+		# Matching cost (mean absolute difference in the window):
+		cost = uniform_filter1d(npabs(a - b), UPSAMPLING_WINDOW[0], axis=1, mode='nearest')
+		uniform_filter1d(cost, UPSAMPLING_WINDOW[1], axis=2, mode='nearest', output=cost)
+		cost += penalty * abs(k * factor)
+
+		mask = less(cost, best)
+		copyto(best, cost, where=mask)
+		copyto(out, a + float32(t) * (b - a), where=mask)
+
+	return out
@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from kst_core import kst_tigre_FDK
+
+# Acquisition geometry [mm] and sphere phantom (centered, radius [mm] and
+# attenuation coefficient [1/mm]):
+SSD, SDD, PX = 100.0, 20.0, 0.1
+NU, NV, NR_ANGLES = 64, 48, 120
+RADIUS, MU = 1.5, 0.5
+
+
+def sphere_projections(radius, mu, nu, nv, nr_angles, ssd, sdd, px):
+	"""Analytic cone-beam projections [rows,cols,angles] of a sphere centered
+	on the rotation axis (i.e. the same for all the angles).
+	"""
+	u = (np.arange(nu) - (nu - 1) / 2) * px
+	v = (np.arange(nv) - (nv - 1) / 2) * px
+	uu, vv = np.meshgrid(u, v)
+
+	# Distance of each ray from the center of the sphere:
+	dsd = ssd + sdd
+	dist = ssd * np.sqrt(uu ** 2 + vv ** 2) / np.sqrt(dsd ** 2 + uu ** 2 + vv ** 2)
+	chord = 2 * mu * np.sqrt(np.clip(radius ** 2 - dist ** 2, 0, None))
+
+	return np.repeat(chord[:, :, np.newaxis], nr_angles, axis=2).astype(np.float32)
+
+
+class TestFDKCpu(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		cls.proj = sphere_projections(RADIUS, MU, NU, NV, NR_ANGLES, SSD, SDD, PX)
+		cls.rec = kst_tigre_FDK.FDK(cls.proj, SSD, SDD, PX, backend='cpu')
+		cls.voxel = PX		# voxel size of the default volume
+
+	def test_shape(self):
+		self.assertEqual(self.rec.shape, (NU, NU, NV))
+
+	def test_interior_value(self):
+		c = NU // 2
+		interior = self.rec[c - 4:c + 4, c - 4:c + 4, NV // 2 - 2:NV // 2 + 2]
+		self.assertAlmostEqual(float(interior.mean()), MU, delta=0.05 * MU)
+
+	def test_edge_position(self):
+		# Half-maximum crossing of the profile through the center along x:
+		profile = self.rec[:, NU // 2, NV // 2]
+		x = (np.arange(NU) - (NU - 1) / 2) * self.voxel
+		inside = x[profile > MU / 2]
+		self.assertLess(abs(inside.max() - RADIUS), 1.5 * self.voxel)
+		self.assertLess(abs(-inside.min() - RADIUS), 1.5 * self.voxel)
+
+	def test_outside_value(self):
+		# Outside the sphere but within the field of view:
+		c = NU // 2
+		self.assertLess(float(np.abs(self.rec[6:12, c - 2:c + 2, NV // 2]).max()), 0.02 * MU)
+
+	def test_slabs(self):
+		rec = kst_tigre_FDK.FDK_slabs(self.proj, SSD, SDD, PX, memory=1 << 20)
+		np.testing.assert_allclose(rec, self.rec, atol=1e-4 * MU)
+
+	def test_progressive(self):
+		rec = kst_tigre_FDK.FDK(self.proj, SSD, SDD, PX, backend='cpu', progressive=4)
+		np.testing.assert_allclose(rec, self.rec, atol=1e-4 * MU)
+
+	def test_channels(self):
+		rec = kst_tigre_FDK.FDK([self.proj, 2 * self.proj], SSD, SDD, PX, backend='cpu')
+		np.testing.assert_allclose(rec[0], self.rec, atol=1e-6 * MU)
+		np.testing.assert_allclose(rec[1], 2 * self.rec, atol=1e-6 * MU)
+
+	def test_roi(self):
+		roi = ((10, 40), (20, 50), (5, 9))
+		rec = kst_tigre_FDK.FDK(self.proj, SSD, SDD, PX, backend='cpu', roi=roi)
+		np.testing.assert_allclose(rec, self.rec[10:40, 20:50, 5:9], atol=1e-4 * MU)
+
+
+if __name__ == '__main__':
+	unittest.main()